@@ -0,0 +1,98 @@
+import os
+import threading
+import requests
+
+ACCESS_LOG_MODES = ("all", "sampled", "errors", "slow", "off")
+FILE_ACCESS_LOG_TYPE = "type.googleapis.com/envoy.extensions.access_loggers.file.v3.FileAccessLog"
+ENVOY_ADMIN_URL = "http://127.0.0.1:9901"
+
+class AccessLog:
+    """Envoy access logging, configured with ACCESS_LOG_MODE.
+
+    Entries are written to ACCESS_LOG_PATH by Envoy's buffered file logger,
+    not to stdout. The file is rotated once it grows past ACCESS_LOG_MAX_BYTES:
+    it is renamed to .1 (older copies shift up to ACCESS_LOG_BACKUPS) and
+    Envoy is told to reopen it through the admin API.
+    """
+
+    def __init__(self):
+        self.mode = os.getenv("ACCESS_LOG_MODE", "all").lower()
+        if self.mode not in ACCESS_LOG_MODES:
+            raise ValueError(f"ACCESS_LOG_MODE must be one of {', '.join(ACCESS_LOG_MODES)}, got: {self.mode}")
+        self.sample_percent = float(os.getenv("ACCESS_LOG_SAMPLE_PERCENT", "1"))
+        if not 0 < self.sample_percent <= 100:
+            raise ValueError(f"ACCESS_LOG_SAMPLE_PERCENT must be between 0 and 100, got: {self.sample_percent}")
+        self.slow_ms = int(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
+        self.path = os.getenv("ACCESS_LOG_PATH", "/var/log/envoy_access.log")
+        self.max_bytes = int(os.getenv("ACCESS_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.backups = int(os.getenv("ACCESS_LOG_BACKUPS", "3"))
+        self.check_interval = float(os.getenv("ACCESS_LOG_CHECK_INTERVAL", "10"))
+        self._thread = None
+
+    def _filter(self):
+        if self.mode == "sampled":
+            # Parts per million so that fractional percentages work
+            return {"runtime_filter": {
+                "runtime_key": "neon_local.access_log.sampled",
+                "percent_sampled": {"numerator": round(self.sample_percent * 10000), "denominator": "MILLION"},
+                "use_independent_randomness": True,
+            }}
+        if self.mode == "errors":
+            # 5xx responses, plus anything Envoy flagged (upstream connect failures, resets, timeouts)
+            return {"or_filter": {"filters": [
+                {"status_code_filter": {"comparison": {"op": "GE", "value": {
+                    "default_value": 500, "runtime_key": "neon_local.access_log.error_status"}}}},
+                {"response_flag_filter": {}},
+            ]}}
+        if self.mode == "slow":
+            return {"duration_filter": {"comparison": {"op": "GE", "value": {
+                "default_value": self.slow_ms, "runtime_key": "neon_local.access_log.slow_ms"}}}}
+        return None
+
+    def envoy_config(self):
+        """The access_log list for the HTTP connection manager and the TCP proxy."""
+        if self.mode == "off":
+            return []
+        access_log = {"name": "envoy.access_loggers.file",
+                      "typed_config": {"@type": FILE_ACCESS_LOG_TYPE, "path": self.path}}
+        log_filter = self._filter()
+        if log_filter:
+            access_log["filter"] = log_filter
+        return [access_log]
+
+    def rotate(self):
+        """Rotate the access log if it is too large; returns True if it was rotated."""
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return False
+        except OSError:
+            return False
+
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+        # Envoy keeps writing to the renamed file until it reopens the path
+        try:
+            requests.post(f"{ENVOY_ADMIN_URL}/reopen_logs", timeout=5).raise_for_status()
+        except requests.RequestException as e:
+            print(f"Failed to reopen Envoy access log after rotation: {str(e)}")
+        return True
+
+    def start_rotation(self, shutdown_event):
+        if self._thread is not None or self.mode == "off" or self.max_bytes <= 0:
+            return
+        self._thread = threading.Thread(target=self._rotation_loop, args=(shutdown_event,), daemon=True)
+        self._thread.start()
+
+    def _rotation_loop(self, shutdown_event):
+        while not shutdown_event.wait(self.check_interval):
+            try:
+                if self.rotate():
+                    print(f"Rotated Envoy access log {self.path}")
+            except OSError as e:
+                print(f"Failed to rotate Envoy access log: {str(e)}")
@@ -0,0 +1,129 @@
+import time
+import uuid
+import random
+import threading
+from datetime import datetime
+from app.metrics import BRANCH_POOL_CLAIMS
+
+POOL_NAME_PREFIX = "neon_local_pool_"
+# Role every pool branch is created with; deleting it is how a branch is claimed
+CLAIM_TOKEN_ROLE = "neon_local_pool_token"
+# Adding the token waits for the branch's creation to finish, which Neon reports as a conflict
+CLAIM_TOKEN_ATTEMPTS = 10
+
+class BranchPool:
+    """A set of pre-created branches off one parent, ready to be claimed.
+
+    Pool branches are recognised by name: neon_local_pool_<parent>_<token>.
+    Claiming renames one to the branch name neon_local would otherwise have
+    created, which is much faster than creating a branch and starting its
+    compute. The pool is topped back up to its size in the background.
+
+    The Neon API has no conditional rename, so every pool branch carries a
+    CLAIM_TOKEN_ROLE role and a claim starts by deleting it. Only one delete
+    can succeed, so exactly one container wins the branch and only the winner
+    renames it. A container whose delete fails has written nothing and moves
+    on to the next branch. Refill deletes an expired branch only after
+    winning its token the same way.
+    """
+
+    def __init__(self, neon_api, parent_branch_id, size, max_age=0, vscode=False):
+        self.neon_api = neon_api
+        self.parent_branch_id = parent_branch_id
+        self.size = size
+        # Pool branches older than this (seconds) are replaced, 0 keeps them forever
+        self.max_age = max_age
+        self.vscode = vscode
+        self.name_prefix = f"{POOL_NAME_PREFIX}{parent_branch_id or 'default'}_"
+        self._refill_lock = threading.Lock()
+
+    def _age(self, branch):
+        try:
+            created_at = datetime.strptime(branch["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+        except (KeyError, ValueError):
+            return 0
+        return (datetime.utcnow() - created_at).total_seconds()
+
+    def _pool_branches(self):
+        branches = [b for b in self.neon_api.list_branches() if b.get("name", "").startswith(self.name_prefix)]
+        # Ready branches first, then oldest first so the pool turns over
+        branches.sort(key=lambda b: (b.get("current_state") != "ready", b.get("created_at", "")))
+        return branches
+
+    def claim(self, branch_name=None):
+        """Rename a pool branch to branch_name and return its ID, or None if the pool is empty."""
+        try:
+            candidates = [b for b in self._pool_branches() if not self.max_age or self._age(b) <= self.max_age]
+        except Exception as e:
+            print(f"Failed to list warm pool branches: {str(e)}")
+            return None
+        # Spread concurrent claimers across the ready branches
+        ready = [b for b in candidates if b.get("current_state") == "ready"]
+        candidates = random.sample(ready, len(ready)) + [b for b in candidates if b not in ready]
+
+        new_name = branch_name or f"neon_local_{uuid.uuid4().hex[:8]}"
+        for candidate in candidates:
+            try:
+                if not self.neon_api.delete_role(candidate["id"], CLAIM_TOKEN_ROLE):
+                    continue
+            except Exception as e:
+                print(f"Failed to claim warm pool branch {candidate['id']}: {str(e)}")
+                continue
+            try:
+                self.neon_api.rename_branch(candidate["id"], new_name)
+            except Exception as e:
+                # The branch is ours either way, only its name is off
+                print(f"Failed to rename claimed warm pool branch {candidate['id']}: {str(e)}")
+            print(f"Claimed warm pool branch {candidate['id']} as '{new_name}'")
+            BRANCH_POOL_CLAIMS.inc()
+            return candidate["id"]
+
+        print("Warm branch pool is empty, creating a branch on demand")
+        return None
+
+    def refill_async(self):
+        threading.Thread(target=self.refill, daemon=True).start()
+
+    def _add_claim_token(self, branch_id):
+        for attempt in range(CLAIM_TOKEN_ATTEMPTS):
+            try:
+                self.neon_api.create_role(branch_id, CLAIM_TOKEN_ROLE)
+                return
+            except Exception:
+                if attempt == CLAIM_TOKEN_ATTEMPTS - 1:
+                    # Without a token nobody could ever claim it
+                    self.neon_api.delete_branch(branch_id)
+                    raise
+                time.sleep(1)
+
+    def refill(self):
+        """Replace expired pool branches and create branches until the pool is full."""
+        if not self._refill_lock.acquire(blocking=False):
+            return
+        try:
+            pool = self._pool_branches()
+            for branch in list(pool):
+                if self.max_age and self._age(branch) > self.max_age:
+                    pool.remove(branch)
+                    # A claim that picked the branch before it expired may already hold its token
+                    if self.neon_api.delete_role(branch["id"], CLAIM_TOKEN_ROLE):
+                        print(f"Deleting expired warm pool branch {branch['id']}")
+                        self.neon_api.delete_branch(branch["id"])
+
+            missing = self.size - len(pool)
+            if missing > 0:
+                print(f"Refilling warm branch pool with {missing} branch(es)...")
+            annotations = {"neon_local_pool": "true"}
+            if self.vscode:
+                annotations["vscode"] = "true"
+            for _ in range(missing):
+                name = f"{self.name_prefix}{uuid.uuid4().hex[:8]}"
+                branch_id = self.neon_api.create_branch(name, self.parent_branch_id, annotations)
+                self._add_claim_token(branch_id)
+                print(f"Created warm pool branch {branch_id}")
+                # Neon limits concurrent operations per project, so space the creations out
+                time.sleep(1)
+        except Exception as e:
+            print(f"Failed to refill warm branch pool: {str(e)}")
+        finally:
+            self._refill_lock.release()
@@ -0,0 +1,136 @@
+import os
+import subprocess
+from datetime import datetime, timedelta
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+# Outside /tmp/.neon_local, which users bind-mount into their project
+CERT_CACHE_DIR = "/tmp/neon_local_certs"
+CERT_SUBJECT = "/CN=localhost/O=DO NOT TRUST/OU=Neon Local self-signed cert"
+
+def _certificate_info(cert_path):
+    """Expiry (naive UTC) and key type of a PEM certificate, or None if it is missing or unreadable."""
+    try:
+        with open(cert_path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if x509 is not None:
+        try:
+            cert = x509.load_pem_x509_certificate(data, default_backend())
+        except ValueError:
+            return None
+        # not_valid_after is deprecated in newer cryptography releases, which have not_valid_after_utc
+        expires_at = getattr(cert, "not_valid_after_utc", None)
+        expires_at = expires_at.replace(tzinfo=None) if expires_at else cert.not_valid_after
+        key_type = "ecdsa" if isinstance(cert.public_key(), ec.EllipticCurvePublicKey) else "rsa"
+        return expires_at, key_type
+    result = subprocess.run(["openssl", "x509", "-noout", "-enddate", "-text", "-in", cert_path],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    enddate = result.stdout.split("\n", 1)[0].strip().split("=", 1)[1]
+    key_type = "ecdsa" if "id-ecPublicKey" in result.stdout else "rsa"
+    return datetime.strptime(enddate, "%b %d %H:%M:%S %Y %Z"), key_type
+
+def _is_fresh(cert_path, key_path, key_type, renew_before):
+    """True if the certificate has the requested key type and is not about to expire."""
+    if not os.path.exists(key_path):
+        return False
+    info = _certificate_info(cert_path)
+    return info is not None and info[1] == key_type and info[0] - datetime.utcnow() > renew_before
+
+def _write(path, data, mode):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def _generate_in_process(cert_path, key_path, key_type, days):
+    backend = default_backend()
+    if key_type == "ecdsa":
+        key = ec.generate_private_key(ec.SECP256R1(), backend)
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=backend)
+
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "DO NOT TRUST"),
+        x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, "Neon Local self-signed cert"),
+    ])
+    now = datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256(), backend)
+    )
+
+    _write(key_path, key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ), 0o600)
+    _write(cert_path, cert.public_bytes(serialization.Encoding.PEM), 0o644)
+
+def _generate_with_openssl(cert_path, key_path, key_type, days):
+    # Single fork fallback for images without the cryptography package
+    newkey = "ec" if key_type == "ecdsa" else "rsa:2048"
+    command = ["openssl", "req", "-x509", "-nodes", "-newkey", newkey]
+    if key_type == "ecdsa":
+        command += ["-pkeyopt", "ec_paramgen_curve:prime256v1"]
+    subprocess.run(command + [
+        "-keyout", key_path, "-out", cert_path, "-days", str(days), "-subj", CERT_SUBJECT,
+    ], check=True, capture_output=True)
+    os.chmod(key_path, 0o600)
+    os.chmod(cert_path, 0o644)
+
+def ensure_certificate(cert_path, key_path):
+    """Make sure a self-signed certificate and key exist at the given paths.
+
+    Certificates are kept in TLS_CERT_CACHE_DIR and reused until they are
+    within TLS_CERT_RENEW_DAYS of expiry, so mounting that directory lets
+    ephemeral containers skip key generation entirely. A certificate whose
+    key type is not TLS_KEY_TYPE is replaced. The directory holds private
+    keys and is only accessible to the container user.
+    """
+    cache_dir = os.getenv("TLS_CERT_CACHE_DIR", CERT_CACHE_DIR)
+    key_type = os.getenv("TLS_KEY_TYPE", "rsa").lower()
+    if key_type not in ("rsa", "ecdsa"):
+        raise ValueError(f"Unsupported TLS_KEY_TYPE '{key_type}', expected rsa or ecdsa")
+    days = int(os.getenv("TLS_CERT_DAYS", "365"))
+    renew_before = timedelta(days=int(os.getenv("TLS_CERT_RENEW_DAYS", "30")))
+
+    if _is_fresh(cert_path, key_path, key_type, renew_before):
+        return
+
+    cached_cert = os.path.join(cache_dir, f"server-{key_type}.crt")
+    cached_key = os.path.join(cache_dir, f"server-{key_type}.key")
+    if not _is_fresh(cached_cert, cached_key, key_type, renew_before):
+        print(f"Generating self-signed {key_type} certificate...")
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        os.chmod(cache_dir, 0o700)
+        if x509 is not None:
+            _generate_in_process(cached_cert, cached_key, key_type, days)
+        else:
+            _generate_with_openssl(cached_cert, cached_key, key_type, days)
+    else:
+        print(f"Reusing cached self-signed certificate from {cache_dir}")
+
+    os.makedirs(os.path.dirname(cert_path), exist_ok=True)
+    for source, target, mode in ((cached_key, key_path, 0o600), (cached_cert, cert_path, 0o644)):
+        with open(source, "rb") as file:
+            _write(target, file.read(), mode)
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+CACHE_PATH = "/tmp/.neon_local/.connection_cache"
+
+class ConnectionCache:
+    """Branch connection info cached on disk, keyed by project and branch.
+
+    Entries are encrypted with a key derived from NEON_API_KEY, so the file is
+    useless without the key and is implicitly invalidated when the key changes.
+    """
+
+    def __init__(self, api_key, path=CACHE_PATH):
+        self.path = path
+        self.ttl = float(os.getenv("NEON_CACHE_TTL", "86400"))
+        self.enabled = os.getenv("NEON_CACHE", "true").lower() == "true" and bool(api_key)
+        self._lock = threading.Lock()
+        self._fernet = None
+
+        if self.enabled and Fernet is None:
+            print("cryptography is not installed, connection info cache disabled")
+            self.enabled = False
+        if self.enabled:
+            key = hashlib.sha256(b"neon_local connection cache:" + api_key.encode()).digest()
+            self._fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    def _key(self, project_id, branch_id):
+        return f"{project_id}/{branch_id}"
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(entries, file)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def get(self, project_id, branch_id):
+        """Return cached connection info, or None if missing, expired or unreadable."""
+        if not self.enabled or not branch_id:
+            return None
+        with self._lock:
+            entry = self._load().get(self._key(project_id, branch_id))
+        if not entry or time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        try:
+            return json.loads(self._fernet.decrypt(entry["data"].encode()))
+        except (InvalidToken, KeyError, ValueError):
+            return None
+
+    def put(self, project_id, branch_id, params):
+        if not self.enabled or not branch_id:
+            return
+        data = self._fernet.encrypt(json.dumps(params).encode()).decode()
+        try:
+            with self._lock:
+                entries = self._load()
+                entries[self._key(project_id, branch_id)] = {"fetched_at": time.time(), "data": data}
+                self._save(entries)
+        except OSError as e:
+            print(f"Failed to write connection cache: {str(e)}")
+
+    def invalidate(self, project_id, branch_id):
+        if not self.enabled or not branch_id:
+            return
+        try:
+            with self._lock:
+                entries = self._load()
+                if entries.pop(self._key(project_id, branch_id), None) is not None:
+                    self._save(entries)
+        except OSError as e:
+            print(f"Failed to write connection cache: {str(e)}")
+
+def cached_branch_connection_info(neon_api, cache, project_id, branch_id):
+    """Return (params, from_cache) for a branch, fetching and caching on a miss."""
+    params = cache.get(project_id, branch_id)
+    if params is not None:
+        return params, True
+    params = neon_api.get_branch_connection_info(project_id, branch_id)
+    cache.put(project_id, branch_id, params)
+    return params, False
@@ -0,0 +1,135 @@
+import os
+import time
+import socket
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+HOSTS_FILE = "/etc/hosts"
+BLOCK_BEGIN = "# BEGIN neon_local"
+BLOCK_END = "# END neon_local"
+MAX_RESOLVER_THREADS = 16
+
+def _render_hosts(current, addresses):
+    """Replace the neon_local block in a hosts file with one line per host."""
+    lines = []
+    inside = False
+    for line in current.splitlines():
+        if line.strip() == BLOCK_BEGIN:
+            inside = True
+        elif line.strip() == BLOCK_END:
+            inside = False
+        elif not inside:
+            lines.append(line)
+    if addresses:
+        lines.append(BLOCK_BEGIN)
+        lines.extend(f"{address} {host}" for host, address in sorted(addresses.items()))
+        lines.append(BLOCK_END)
+    return "\n".join(lines) + "\n"
+
+def write_hosts_file(addresses, path=HOSTS_FILE):
+    """Rewrite the neon_local entries in the hosts file in one step; returns True if it changed.
+
+    The new file is written next to the old one and renamed over it. Docker
+    bind-mounts /etc/hosts, where a rename fails, so in that case the content
+    is copied over the original in a single write instead.
+    """
+    with open(path, "r") as file:
+        current = file.read()
+    content = _render_hosts(current, addresses)
+    if content == current:
+        return False
+
+    tmp_path = os.path.join(os.path.dirname(path), ".hosts.neon_local")
+    if os.geteuid() == 0:
+        with open(tmp_path, "w") as file:
+            file.write(content)
+        os.chmod(tmp_path, 0o644)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            with open(path, "w") as file:
+                file.write(content)
+            os.remove(tmp_path)
+    else:
+        # The application user may only run sed and sh through sudo (see Dockerfile)
+        script = (f"cat > {tmp_path} && chmod 644 {tmp_path} && "
+                  f"{{ mv -f {tmp_path} {path} 2>/dev/null || {{ cat {tmp_path} > {path}; rm -f {tmp_path}; }}; }}")
+        subprocess.run(["sudo", "sh", "-c", script], input=content, text=True, check=True)
+    return True
+
+class DNSResolver:
+    """Resolves Neon endpoint hosts to IPv4 and keeps their /etc/hosts entries current.
+
+    Hosts are resolved concurrently and cached for DNS_CACHE_TTL seconds. A
+    background thread re-resolves them every DNS_REFRESH_INTERVAL seconds and
+    rewrites /etc/hosts only when an address changed. If a lookup fails, the
+    last known address is kept rather than dropping the entry.
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("DNS_CACHE_TTL", "300"))
+        self.refresh_interval = float(os.getenv("DNS_REFRESH_INTERVAL", "60"))
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def _lookup(self, host):
+        return socket.getaddrinfo(host, 5432, socket.AF_INET)[0][4][0]
+
+    def resolve_all(self, hosts, force=False):
+        """Resolve hosts concurrently, returning a dict of host to IPv4 address."""
+        hosts = sorted(set(hosts))
+        now = time.monotonic()
+        with self._lock:
+            addresses = {host: self._cache[host][0] for host in hosts
+                         if host in self._cache and (not force and self._cache[host][1] > now)}
+        pending = [host for host in hosts if host not in addresses]
+        if not pending:
+            return addresses
+
+        with ThreadPoolExecutor(max_workers=min(len(pending), MAX_RESOLVER_THREADS)) as executor:
+            futures = {host: executor.submit(self._lookup, host) for host in pending}
+        expires_at = time.monotonic() + self.ttl
+        for host, future in futures.items():
+            try:
+                address = future.result()
+            except OSError as e:
+                with self._lock:
+                    stale = self._cache.get(host)
+                if stale:
+                    print(f"Failed to resolve {host}, keeping {stale[0]}: {str(e)}")
+                    addresses[host] = stale[0]
+                else:
+                    print(f"Failed to resolve {host}: {str(e)}")
+                continue
+            with self._lock:
+                self._cache[host] = (address, expires_at)
+            addresses[host] = address
+        return addresses
+
+    def update_hosts_file(self, hosts, force=False):
+        """Resolve hosts and write their entries to /etc/hosts; returns the addresses."""
+        addresses = self.resolve_all(hosts, force=force)
+        with self._write_lock:
+            if write_hosts_file(addresses):
+                for host, address in sorted(addresses.items()):
+                    print(f"Updated /etc/hosts: {address} {host}")
+        return addresses
+
+    def start_refresh(self, get_hosts, shutdown_event):
+        if self._thread is not None or self.refresh_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, args=(get_hosts, shutdown_event), daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self, get_hosts, shutdown_event):
+        while not shutdown_event.wait(self.refresh_interval):
+            hosts = get_hosts()
+            if not hosts:
+                continue
+            try:
+                self.update_hosts_file(hosts, force=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Failed to refresh /etc/hosts: {str(e)}")
@@ -19,7 +19,7 @@ def main():
     signal.signal(signal.SIGINT, handle_signal)
 
     manager.reloader_thread = threading.Thread(target=manager.start_reloader_loop)
-    manager.watcher_thread = threading.Thread(target=manager.watch_file_changes, args=("/tmp/.git/HEAD",))
+    manager.watcher_thread = threading.Thread(target=manager.watch_file_changes, args=(manager._git_head_path(),))
 
     manager.reloader_thread.start()
     manager.watcher_thread.start()
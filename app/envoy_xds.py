@@ -0,0 +1,333 @@
+import os
+import json
+import hashlib
+
+# Envoy watches this directory and applies any resource file moved into it
+XDS_DIR = "/tmp/envoy"
+CDS_FILE = "cds.json"
+RDS_FILE = "rds.json"
+
+CLUSTER_TYPE = "type.googleapis.com/envoy.config.cluster.v3.Cluster"
+ROUTE_CONFIGURATION_TYPE = "type.googleapis.com/envoy.config.route.v3.RouteConfiguration"
+UPSTREAM_TLS_CONTEXT_TYPE = "type.googleapis.com/envoy.extensions.transport_sockets.tls.v3.UpstreamTlsContext"
+HTTP_PROTOCOL_OPTIONS_NAME = "envoy.extensions.upstreams.http.v3.HttpProtocolOptions"
+HTTP_PROTOCOL_OPTIONS_TYPE = f"type.googleapis.com/{HTTP_PROTOCOL_OPTIONS_NAME}"
+TCP_PROXY_TYPE = "type.googleapis.com/envoy.extensions.filters.network.tcp_proxy.v3.TcpProxy"
+POSTGRES_PROXY_TYPE = "type.googleapis.com/envoy.extensions.filters.network.postgres_proxy.v3alpha.PostgresProxy"
+STARTTLS_CONFIG_TYPE = "type.googleapis.com/envoy.extensions.transport_sockets.starttls.v3.StartTlsConfig"
+
+# Upstream connection pooling towards Neon's serverless endpoint (port 443)
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+UPSTREAM_IDLE_TIMEOUT_S = int(os.getenv("UPSTREAM_IDLE_TIMEOUT_S", "300"))
+UPSTREAM_MAX_CONCURRENT_STREAMS = int(os.getenv("UPSTREAM_MAX_CONCURRENT_STREAMS", "100"))
+UPSTREAM_TLS_SESSION_KEYS = int(os.getenv("UPSTREAM_TLS_SESSION_KEYS", "16"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "1024"))
+UPSTREAM_MAX_PENDING_REQUESTS = int(os.getenv("UPSTREAM_MAX_PENDING_REQUESTS", "1024"))
+UPSTREAM_MAX_REQUESTS = int(os.getenv("UPSTREAM_MAX_REQUESTS", "1024"))
+
+def connection_string(db, app_name):
+    return f"postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
+
+# Routing keys set by the Lua filter in envoy.yaml.tmpl. DATABASE_HEADER is
+# "<kind>|<database>", where kind is "ws" for WebSocket upgrades and "http"
+# otherwise, and FALLBACK_HEADER is the kind when a request without a known
+# database should go to the first one
+DATABASE_HEADER = "x-neon-local-database"
+FALLBACK_HEADER = "x-neon-local-fallback"
+# Sent by Neon Local's own readiness probes, which the Lua filter gives the
+# kind "probe" so they go to a cluster of their own and don't count as client
+# traffic for the health checks or keep-warm
+PROBE_HEADER = "x-neon-local-probe"
+ROUTING_HEADERS = [DATABASE_HEADER, FALLBACK_HEADER, PROBE_HEADER]
+
+HEADER_MATCH_INPUT_TYPE = "type.googleapis.com/envoy.type.matcher.v3.HttpRequestHeaderMatchInput"
+ROUTE_TYPE = "type.googleapis.com/envoy.config.route.v3.Route"
+
+# Non-Neon HTTP requests get an error
+FALLBACK_ROUTE = {
+    "match": {"prefix": "/"},
+    "direct_response": {
+        "status": 400,
+        "body": {"inline_string": "This endpoint only supports Neon serverless connections"},
+    },
+}
+
+def cluster_name(db):
+    """All databases on a branch share its compute, so there is one cluster per endpoint host."""
+    return f"neon_cluster_{db['host'].split('.')[0]}"
+
+def websocket_cluster_name(db):
+    """WebSocket upgrades need HTTP/1.1, so with HTTP/2 they get a cluster of their own."""
+    return f"{cluster_name(db)}_ws" if UPSTREAM_HTTP2 else cluster_name(db)
+
+def probe_cluster_name(db):
+    """Readiness probes get a cluster of their own, so its request count is not client activity."""
+    return f"{cluster_name(db)}_probe"
+
+def _header(key, value, append_action=None):
+    header = {"header": {"key": key, "value": value}}
+    if append_action:
+        header["append_action"] = append_action
+    return header
+
+def _route(cluster, connection, host, user_agent=None, websocket=False):
+    # Neon routes on the Host header, and the client's connection string is
+    # replaced with the real credentials, both natively in the router
+    route = {"cluster": cluster, "host_rewrite_literal": host}
+    if websocket:
+        # No timeout for WebSocket connections
+        route["timeout"] = "0s"
+        route["upgrade_configs"] = [{"upgrade_type": "websocket"}]
+    else:
+        route["timeout"] = "30s"
+
+    headers = [_header("neon-connection-string", connection, "OVERWRITE_IF_EXISTS_OR_ADD")]
+    if user_agent:
+        headers.append(_header("user-agent", user_agent))
+
+    return {"match": {"prefix": "/"}, "route": route, "request_headers_to_add": headers}
+
+def _on_match(route):
+    return {"action": {"name": "route", "typed_config": dict({"@type": ROUTE_TYPE}, **route)}}
+
+def _header_map(header, entries, on_no_match):
+    """Constant-time lookup of a routing header's exact value."""
+    return {"matcher": {
+        "matcher_tree": {
+            "input": {"name": header, "typed_config": {"@type": HEADER_MATCH_INPUT_TYPE, "header_name": header}},
+            "exact_match_map": {"map": {key: _on_match(route) for key, route in entries.items()}},
+        },
+        "on_no_match": on_no_match,
+    }}
+
+def build_route_configuration(databases, app_name, user_agent):
+    """Routes keyed by exact database name instead of a linear list of prefix and substring matches.
+
+    The Lua filter extracts the database name from the neon-connection-string
+    header, or from the first path segment when there is no such header.
+    Requests for an unknown database that are meant for the serverless
+    endpoint go to the first database. Both lookups are hash maps, so routing
+    cost does not grow with the database count.
+    """
+    virtual_host = {
+        "name": "neon_backend",
+        "domains": ["*"],
+        "request_headers_to_add": [
+            _header("content-type", "application/json"),
+        ],
+        "request_headers_to_remove": ROUTING_HEADERS,
+    }
+
+    if databases:
+        by_database = {}
+        for db in databases:
+            name = cluster_name(db)
+            connection = connection_string(db, app_name)
+            by_database[f"http|{db['database']}"] = _route(name, connection, db["host"], user_agent)
+            by_database[f"ws|{db['database']}"] = _route(websocket_cluster_name(db), connection, db["host"], websocket=True)
+            by_database[f"probe|{db['database']}"] = _route(probe_cluster_name(db), connection, db["host"], user_agent)
+
+        first_db = databases[0]
+        first_connection = connection_string(first_db, app_name)
+        first_db_routes = {
+            "http": _route(cluster_name(first_db), first_connection, first_db["host"], user_agent),
+            "ws": _route(websocket_cluster_name(first_db), first_connection, first_db["host"], websocket=True),
+            "probe": _route(probe_cluster_name(first_db), first_connection, first_db["host"], user_agent),
+        }
+        on_no_database = _header_map(FALLBACK_HEADER, first_db_routes, _on_match(FALLBACK_ROUTE))
+        virtual_host.update(_header_map(DATABASE_HEADER, by_database, on_no_database))
+    else:
+        virtual_host["routes"] = [FALLBACK_ROUTE]
+
+    return {
+        "@type": ROUTE_CONFIGURATION_TYPE,
+        "name": "neon_routes",
+        "virtual_hosts": [virtual_host],
+    }
+
+# Passive health checking from client traffic: gateway errors (502-504) and
+# connection failures eject the compute for a while
+OUTLIER_DETECTION = {
+    "consecutive_gateway_failure": 3,
+    "enforcing_consecutive_gateway_failure": 100,
+    "split_external_local_origin_errors": True,
+    "consecutive_local_origin_failure": 3,
+    "enforcing_consecutive_local_origin_failure": 100,
+    # A 5xx from /sql is usually a failed query, not an unhealthy compute
+    "enforcing_consecutive_5xx": 0,
+    "enforcing_success_rate": 0,
+    "interval": "10s",
+    "base_ejection_time": "30s",
+    "max_ejection_percent": 100,
+}
+
+def _protocol_options(http2):
+    options = {
+        "@type": HTTP_PROTOCOL_OPTIONS_TYPE,
+        # Pooled connections are kept open between bursts of /sql requests
+        "common_http_protocol_options": {"idle_timeout": f"{UPSTREAM_IDLE_TIMEOUT_S}s"},
+    }
+    if http2:
+        # HTTP/2 if Neon offers it in the TLS handshake (ALPN), HTTP/1.1 otherwise
+        options["auto_config"] = {
+            "http_protocol_options": {},
+            "http2_protocol_options": {"max_concurrent_streams": UPSTREAM_MAX_CONCURRENT_STREAMS},
+        }
+    else:
+        options["explicit_http_config"] = {"http_protocol_options": {}}
+    return options
+
+def _cluster(name, host, http2, health_checks):
+    cluster = {
+        "@type": CLUSTER_TYPE,
+        "name": name,
+        "connect_timeout": "5s",
+        "type": "STRICT_DNS",
+        "lb_policy": "ROUND_ROBIN",
+        "dns_lookup_family": "V4_ONLY",
+        "transport_socket": {
+            "name": "envoy.transport_sockets.tls",
+            "typed_config": {
+                "@type": UPSTREAM_TLS_CONTEXT_TYPE,
+                "sni": host,
+                # Cached sessions let new upstream connections skip the full handshake
+                "max_session_keys": UPSTREAM_TLS_SESSION_KEYS,
+                "common_tls_context": {"validation_context": {}},
+            },
+        },
+        "typed_extension_protocol_options": {HTTP_PROTOCOL_OPTIONS_NAME: _protocol_options(http2)},
+        "upstream_connection_options": {"tcp_keepalive": {"keepalive_time": 60, "keepalive_interval": 10}},
+        "outlier_detection": OUTLIER_DETECTION,
+        "circuit_breakers": {"thresholds": [{
+            "priority": "DEFAULT",
+            "max_connections": UPSTREAM_MAX_CONNECTIONS,
+            "max_pending_requests": UPSTREAM_MAX_PENDING_REQUESTS,
+            "max_requests": UPSTREAM_MAX_REQUESTS,
+        }]},
+        "load_assignment": {
+            "cluster_name": name,
+            "endpoints": [{"lb_endpoints": [{"endpoint": {"address": {
+                "socket_address": {"address": host, "port_value": 443},
+            }}}]}],
+        },
+    }
+    if health_checks:
+        cluster["health_checks"] = health_checks
+    return cluster
+
+def build_clusters(databases, app_name, health_check_user_agent, health_checked_hosts=()):
+    """One cluster per compute, with an active /sql health check only for health_checked_hosts.
+
+    Every cluster has passive outlier detection, which only looks at client
+    traffic and never wakes a suspended compute.
+    """
+    clusters = []
+    hosts = set()
+    for db in databases:
+        if db["host"] in hosts:
+            continue
+        hosts.add(db["host"])
+        health_checks = None
+        if db["host"] in health_checked_hosts:
+            health_checks = [{
+                "timeout": "5s",
+                "interval": "3s",
+                "interval_jitter": "1s",
+                "unhealthy_threshold": 2,
+                "healthy_threshold": 2,
+                "http_health_check": {
+                    "path": "/sql",
+                    "request_headers_to_add": [
+                        _header("neon-connection-string", connection_string(db, app_name)),
+                        _header("user-agent", health_check_user_agent),
+                        _header("content-type", "application/json"),
+                    ],
+                },
+            }]
+        clusters.append(_cluster(cluster_name(db), db["host"], UPSTREAM_HTTP2, health_checks))
+        if UPSTREAM_HTTP2:
+            # Failed upgrades surface to the client directly, the /sql cluster carries the health checks
+            clusters.append(_cluster(websocket_cluster_name(db), db["host"], False, None))
+        clusters.append(_cluster(probe_cluster_name(db), db["host"], UPSTREAM_HTTP2, None))
+    return clusters
+
+def pgbouncer_endpoints(ports, socket_paths=None):
+    """Static endpoints of the bootstrap's pgbouncer_cluster, one per PgBouncer worker.
+
+    With socket_paths, Envoy connects to the workers' Unix sockets instead of
+    their loopback ports.
+    """
+    if socket_paths:
+        return [{"endpoint": {"address": {"pipe": {"path": path}}}} for path in socket_paths]
+    return [{"endpoint": {"address": {"socket_address": {"address": "127.0.0.1", "port_value": port}}}}
+            for port in ports]
+
+def postgres_filter_chain(access_log, tls_certificate=None):
+    """The listener's fallback filter chain, which passes Postgres clients to pgbouncer_cluster.
+
+    PgBouncer terminates client TLS itself, but not on its Unix socket. With
+    tls_certificate, a (certificate, key) pair of paths, Envoy answers the
+    client's SSLRequest and terminates TLS instead, so clients keep the same
+    sslmode either way.
+    """
+    tcp_proxy = {
+        "name": "envoy.filters.network.tcp_proxy",
+        "typed_config": {
+            "@type": TCP_PROXY_TYPE,
+            "stat_prefix": "postgres_tcp",
+            "cluster": "pgbouncer_cluster",
+            "access_log": access_log,
+        },
+    }
+    if not tls_certificate:
+        return {"filters": [tcp_proxy]}
+    certificate, key = tls_certificate
+    return {
+        "filters": [
+            {
+                "name": "envoy.filters.network.postgres_proxy",
+                "typed_config": {"@type": POSTGRES_PROXY_TYPE, "stat_prefix": "postgres", "terminate_ssl": True},
+            },
+            tcp_proxy,
+        ],
+        # Plaintext until the postgres_proxy filter sees an SSLRequest
+        "transport_socket": {
+            "name": "envoy.transport_sockets.starttls",
+            "typed_config": {
+                "@type": STARTTLS_CONFIG_TYPE,
+                "cleartext_socket_config": {},
+                "tls_socket_config": {
+                    "common_tls_context": {
+                        "tls_certificates": [{
+                            "certificate_chain": {"filename": certificate},
+                            "private_key": {"filename": key},
+                        }],
+                    },
+                },
+            },
+        },
+    }
+
+def write_resources(directory, filename, resources):
+    """Atomically publish a discovery response file; returns True if it changed.
+
+    Envoy only reloads a watched file when it is moved into place, so the
+    response is written to a temporary file in the same directory first.
+    """
+    body = json.dumps(resources, sort_keys=True)
+    version = hashlib.sha256(body.encode()).hexdigest()[:16]
+    path = os.path.join(directory, filename)
+    try:
+        with open(path, "r") as file:
+            if json.load(file).get("version_info") == version:
+                return False
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump({"version_info": version, "resources": resources}, file)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+    return True
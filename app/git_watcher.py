@@ -0,0 +1,110 @@
+import os
+import select
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+# git replaces HEAD by renaming HEAD.lock over it, so the directory is watched
+# as well as the file. The file watch covers single-file bind mounts.
+DIR_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+
+class GitHeadWatcher:
+    """Calls on_change whenever the contents of a git HEAD file change.
+
+    inotify wakes the watcher as soon as git touches HEAD. Bind mounts do not
+    always deliver events (Docker Desktop file sharing in particular), so the
+    file is also stat'ed every poll_interval seconds and only read when its
+    inode, size or mtime moved.
+    """
+
+    def __init__(self, head_path, on_change, shutdown_event, poll_interval=1.0):
+        self.head_path = head_path
+        self.on_change = on_change
+        self.shutdown_event = shutdown_event
+        self.poll_interval = poll_interval
+        self._libc = None
+        self._inotify_fd = None
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.head_path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_head(self):
+        try:
+            with open(self.head_path, "r") as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    def _start_inotify(self):
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        self._inotify_fd = fd
+        self._add_watches()
+        return fd
+
+    def _add_watches(self):
+        # Re-adding an existing watch is a no-op, and it restores the file watch
+        # after git replaced HEAD with a new inode
+        for path, mask in ((os.path.dirname(self.head_path), DIR_EVENTS), (self.head_path, FILE_EVENTS)):
+            if os.path.exists(path):
+                self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(path), mask)
+
+    def _wait_for_event(self):
+        """Block until inotify reports activity or the poll interval elapses."""
+        try:
+            readable, _, _ = select.select([self._inotify_fd], [], [], self.poll_interval)
+        except (OSError, ValueError):
+            return
+        if readable:
+            try:
+                while os.read(self._inotify_fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+            self._add_watches()
+
+    def run(self):
+        last_stat = self._stat_key()
+        last_head = self._read_head()
+        if self._start_inotify() is None:
+            print(f"inotify unavailable, polling {self.head_path} every {self.poll_interval}s")
+        else:
+            print(f"Watching {self.head_path} for changes with inotify...")
+
+        try:
+            while not self.shutdown_event.is_set():
+                if self._inotify_fd is not None:
+                    self._wait_for_event()
+                else:
+                    self.shutdown_event.wait(self.poll_interval)
+
+                current_stat = self._stat_key()
+                if current_stat == last_stat:
+                    continue
+                last_stat = current_stat
+                current_head = self._read_head()
+                if current_head != last_head:
+                    last_head = current_head
+                    self.on_change()
+        finally:
+            if self._inotify_fd is not None:
+                os.close(self._inotify_fd)
+                self._inotify_fd = None
@@ -0,0 +1,93 @@
+import os
+import re
+import time
+import threading
+import requests
+
+ENVOY_STATS_URL = "http://127.0.0.1:9901/stats"
+# Client requests per compute, over both its /sql and WebSocket clusters; endpoint
+# IDs have no underscores, so the readiness probe clusters (_probe) don't match
+TRAFFIC_STATS_FILTER = r"^cluster\.neon_cluster_[^._]*(_ws)?\.upstream_rq_total$"
+TRAFFIC_STAT = re.compile(r"^cluster\.neon_cluster_([^._]*)(?:_ws)?\.upstream_rq_total: (\d+)$")
+POLL_INTERVAL = 10
+
+class TrafficAwareHealthChecks:
+    """Decides which computes get active health checks from Envoy.
+
+    An active /sql health check keeps a compute from ever scaling to zero, so
+    it only runs while clients are sending requests to that compute. Once a
+    compute has seen no requests for HEALTH_CHECK_IDLE_TIMEOUT seconds, its
+    cluster drops the check and relies on passive outlier detection, which
+    costs nothing. Checks are per endpoint host, all databases on a branch
+    share one compute.
+
+    on_change is called with the new set of health-checked hosts; it should
+    republish the clusters. Envoy replaces a cluster whose definition changed,
+    which happens at most twice per idle period, and the replaced cluster's
+    pooled upstream connections are closed with it, so the first requests
+    after a compute becomes active again open new ones.
+    """
+
+    def __init__(self, get_databases, on_change, shutdown_event):
+        self.get_databases = get_databases
+        self.on_change = on_change
+        self.shutdown_event = shutdown_event
+        self.idle_timeout = float(os.getenv("HEALTH_CHECK_IDLE_TIMEOUT", "300"))
+        self.session = requests.Session()
+        self.active_hosts = set()
+        self.last_activity = {}
+        self._last_counts = {}
+        self._thread = None
+
+    def start(self):
+        if self.idle_timeout <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def _request_counts(self):
+        """Requests per endpoint ID since Envoy started, or None if the admin API is unavailable."""
+        try:
+            response = self.session.get(ENVOY_STATS_URL, params={"filter": TRAFFIC_STATS_FILTER}, timeout=2)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return None
+        counts = {}
+        for line in response.text.splitlines():
+            match = TRAFFIC_STAT.match(line.strip())
+            if match:
+                counts[match.group(1)] = counts.get(match.group(1), 0) + int(match.group(2))
+        return counts
+
+    def poll(self):
+        """Update activity from Envoy's counters; returns True if the health-checked hosts changed."""
+        counts = self._request_counts()
+        if counts is None:
+            return False
+        now = time.monotonic()
+        for endpoint_id, count in counts.items():
+            # An Envoy restart resets the counters, so any change counts as traffic
+            if count != self._last_counts.get(endpoint_id, 0):
+                self.last_activity[endpoint_id] = now
+        self._last_counts = counts
+
+        hosts = {db["host"] for db in self.get_databases() or []}
+        active_hosts = {host for host in hosts
+                        if now - self.last_activity.get(host.split(".")[0], float("-inf")) <= self.idle_timeout}
+        if active_hosts == self.active_hosts:
+            return False
+        for host in sorted(active_hosts - self.active_hosts):
+            print(f"Health checks: client traffic to compute {host.split('.')[0]}, enabling active checks")
+        for host in sorted(self.active_hosts - active_hosts):
+            print(f"Health checks: compute {host.split('.')[0]} idle for {self.idle_timeout:g}s, "
+                  f"switching to passive outlier detection")
+        self.active_hosts = active_hosts
+        return True
+
+    def run(self):
+        while not self.shutdown_event.wait(POLL_INTERVAL):
+            if self.poll():
+                try:
+                    self.on_change(set(self.active_hosts))
+                except OSError as e:
+                    print(f"Failed to update Envoy health checks: {str(e)}")
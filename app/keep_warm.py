@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from datetime import datetime
+import requests
+from app.metrics import KEEP_WARM_PROBES, KEEP_WARM_ACTIVE
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+ENVOY_STATS_URL = "http://127.0.0.1:9901/stats"
+# Client traffic counters: HTTP requests to Neon and Postgres connections to PgBouncer
+ACTIVITY_STATS_FILTER = r"^cluster\.(neon_cluster_[^._]*(_ws)?\.upstream_rq_total|pgbouncer_cluster\.upstream_cx_total)$"
+
+def parse_window(value):
+    """Parse "HH:MM-HH:MM" into (start, end) minutes after midnight, or None."""
+    if not value:
+        return None
+    try:
+        start, end = value.split("-")
+        start_h, start_m = (int(part) for part in start.strip().split(":"))
+        end_h, end_m = (int(part) for part in end.strip().split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid KEEP_WARM_WINDOW '{value}', expected HH:MM-HH:MM")
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+def parse_days(value):
+    """Parse "mon-fri" or "mon,wed,fri" into a set of weekday numbers (Monday is 0)."""
+    days = set()
+    for part in value.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = (DAY_NAMES.index(day.strip()) for day in part.split("-"))
+                days.update(range(first, last + 1) if first <= last else list(range(first, 7)) + list(range(0, last + 1)))
+            else:
+                days.add(DAY_NAMES.index(part))
+        except ValueError:
+            raise ValueError(f"Invalid KEEP_WARM_DAYS '{value}', expected day names like mon-fri")
+    return days
+
+class KeepWarmScheduler:
+    """Keeps branch computes from scaling to zero while they are likely to be used.
+
+    A compute is kept warm inside the configured time window, and for a while
+    after the last client request seen by Envoy. Warm computes get a
+    lightweight SELECT 1 over Neon's HTTP endpoint every interval. Outside
+    those periods nothing is sent, so the compute can suspend as usual.
+    Databases are grouped by endpoint host, because all databases on a branch
+    share one compute and a single probe keeps it awake.
+    """
+
+    def __init__(self, get_databases, shutdown_event):
+        self.get_databases = get_databases
+        self.shutdown_event = shutdown_event
+        self.window = parse_window(os.getenv("KEEP_WARM_WINDOW", ""))
+        self.days = parse_days(os.getenv("KEEP_WARM_DAYS", "mon-sun"))
+        self.after_activity = float(os.getenv("KEEP_WARM_AFTER_ACTIVITY", "0"))
+        self.interval = float(os.getenv("KEEP_WARM_INTERVAL", "240"))
+        self.enabled = self.window is not None or self.after_activity > 0
+        self.session = requests.Session()
+        self.thread = None
+
+        self.last_activity = 0.0
+        self._last_activity_count = None
+        self._last_probe = 0.0
+        self._last_reason = None
+
+    def start(self):
+        if not self.enabled or self.thread is not None:
+            return
+        print(f"Keep-warm scheduler enabled (window={os.getenv('KEEP_WARM_WINDOW') or 'none'}, "
+              f"after_activity={self.after_activity:g}s, interval={self.interval:g}s)")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def in_window(self, now=None):
+        if self.window is None:
+            return False
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        start, end = self.window
+        if start <= end:
+            return now.weekday() in self.days and start <= minute < end
+        # Overnight window, e.g. 22:00-02:00, belongs to the day it started on
+        if minute >= start:
+            return now.weekday() in self.days
+        return minute < end and (now.weekday() - 1) % 7 in self.days
+
+    def _poll_activity(self):
+        try:
+            response = self.session.get(ENVOY_STATS_URL, params={"filter": ACTIVITY_STATS_FILTER}, timeout=2)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return
+        count = 0
+        for line in response.text.splitlines():
+            try:
+                count += int(line.rsplit(":", 1)[1])
+            except (IndexError, ValueError):
+                continue
+        if self._last_activity_count is not None and count > self._last_activity_count:
+            self.last_activity = time.time()
+        self._last_activity_count = count
+
+    def _reason(self):
+        if self.in_window():
+            return "inside keep-warm window"
+        if self.after_activity > 0 and time.time() - self.last_activity <= self.after_activity:
+            return "recent client activity"
+        return None
+
+    def _probe(self, db):
+        response = self.session.post(
+            f"https://{db['host']}/sql",
+            json={"query": "SELECT 1", "params": []},
+            headers={
+                "Neon-Connection-String": f"postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require",
+                "User-Agent": "neon_local_keep_warm",
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
+
+    def probe_all(self):
+        databases = self.get_databases() or []
+        hosts = {}
+        for db in databases:
+            hosts.setdefault(db["host"], []).append(db)
+        for host, host_databases in hosts.items():
+            names = ", ".join(db["database"] for db in host_databases)
+            try:
+                self._probe(host_databases[0])
+                KEEP_WARM_PROBES.inc(result="success")
+                print(f"Keep-warm: probed compute {host.split('.')[0]} (databases: {names})")
+            except requests.exceptions.RequestException as e:
+                KEEP_WARM_PROBES.inc(result="failure")
+                print(f"Keep-warm: probe of compute {host.split('.')[0]} failed: {str(e)}")
+
+    def run(self):
+        # Sample activity more often than we probe so short bursts are noticed
+        check_interval = min(30.0, self.interval)
+        while not self.shutdown_event.wait(check_interval):
+            self._poll_activity()
+            reason = self._reason()
+            if reason != self._last_reason:
+                if reason:
+                    print(f"Keep-warm: keeping computes warm ({reason})")
+                else:
+                    print("Keep-warm: no window or recent activity, letting computes scale to zero")
+                self._last_reason = reason
+            KEEP_WARM_ACTIVE.set(1 if reason else 0)
+            if reason and time.time() - self._last_probe >= self.interval:
+                self._last_probe = time.time()
+                self.probe_all()
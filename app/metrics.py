@@ -0,0 +1,285 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from app.readiness import postgres_connect, postgres_query, postgres_close
+
+ENVOY_PROMETHEUS_URL = "http://127.0.0.1:9901/stats/prometheus"
+# Seconds to wait for the PgBouncer admin console
+PGBOUNCER_ADMIN_TIMEOUT = 2
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            bucket_counts, count, total = self._values.get(key, ((0,) * len(self.buckets), 0, 0.0))
+            bucket_counts = tuple(c + (1 if value <= bound else 0) for c, bound in zip(bucket_counts, self.buckets))
+            self._values[key] = (bucket_counts, count + 1, total + value)
+
+    def _render_value(self, key, value):
+        bucket_counts, count, total = value
+        lines = [f"{self.name}_bucket{_format_labels(key + (('le', f'{bound:g}'),))} {c}"
+                 for c, bound in zip(bucket_counts, self.buckets)]
+        lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        return lines
+
+# Control-plane metrics
+API_REQUEST_DURATION = Histogram(
+    "neon_local_api_request_duration_seconds", "Latency of Neon API requests, per attempt.",
+    ("method", "endpoint", "status"))
+RELOADS = Counter("neon_local_reloads_total", "Configuration reloads by outcome.", ("result",))
+RELOAD_DURATION = Histogram("neon_local_reload_duration_seconds", "Duration of configuration reloads.", ("result",))
+BRANCH_CREATIONS = Counter("neon_local_branch_creations_total", "Neon branches created by Neon Local.", ("kind",))
+BRANCH_POOL_CLAIMS = Counter("neon_local_branch_pool_claims_total", "Branches claimed from the warm pool.")
+KEEP_WARM_PROBES = Counter("neon_local_keep_warm_probes_total", "Keep-warm probes sent to computes.", ("result",))
+KEEP_WARM_ACTIVE = Gauge("neon_local_keep_warm_active", "1 while the keep-warm scheduler keeps computes awake.")
+PGBOUNCER_PREWARM_CONNECTIONS = Counter(
+    "neon_local_pgbouncer_prewarm_connections_total",
+    "PgBouncer server connections opened ahead of demand after an idle period.", ("result",))
+
+def _with_labels(sample, extra):
+    """Add labels to a Prometheus sample line, keeping any it already has."""
+    match = re.match(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})?\s+(.*)$", sample)
+    if not match:
+        return sample
+    name, _, labels, value = match.groups()
+    added = ",".join(f'{key}="{_escape(val)}"' for key, val in extra)
+    labels = f"{labels},{added}" if labels else added
+    return f"{name}{{{labels}}} {value}"
+
+def collect_envoy_metrics(branch):
+    try:
+        response = requests.get(ENVOY_PROMETHEUS_URL, timeout=2)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        return [f"# Envoy admin unavailable: {str(e)}"]
+
+    lines = []
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            lines.append(line)
+            continue
+        extra = [("branch", branch)]
+        cluster = re.search(r'envoy_cluster_name="neon_cluster_([^"_]*)(?:_ws|_probe)?"', line)
+        if cluster:
+            extra.append(("endpoint", cluster.group(1)))
+        lines.append(_with_labels(line, extra))
+    return lines
+
+# One admin console session per PgBouncer worker port, kept open across scrapes
+_admin_sessions = {}
+_admin_lock = threading.Lock()
+
+def _close_admin_session(port):
+    sock = _admin_sessions.pop(port, None)
+    if sock is not None:
+        postgres_close(sock)
+
+def _pgbouncer_show(commands, port=6432):
+    """Run SHOW commands on a worker's admin console, returning each one's rows as dicts.
+
+    The session is reused by later scrapes and reopened once if it has
+    broken, for example because the worker was restarted. The neon user from
+    userlist.txt is listed in stats_users in pgbouncer.ini.tmpl.
+    """
+    with _admin_lock:
+        sock = _admin_sessions.get(port)
+        if sock is not None:
+            try:
+                return [postgres_query(sock, f"SHOW {command}") for command in commands]
+            except OSError:
+                _close_admin_session(port)
+        sock = postgres_connect("127.0.0.1", port, "pgbouncer", timeout=PGBOUNCER_ADMIN_TIMEOUT)
+        _admin_sessions[port] = sock
+        try:
+            return [postgres_query(sock, f"SHOW {command}") for command in commands]
+        except OSError:
+            _close_admin_session(port)
+            raise
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _worker_label(row):
+    return (("worker", row["worker"]),) if "worker" in row else ()
+
+def collect_pgbouncer_metrics(branch, ports=(6432,)):
+    """PgBouncer samples for every worker; with several workers each sample has a worker label."""
+    lines = []
+    stats, pools, clients = [], [], []
+    for worker, port in enumerate(ports):
+        try:
+            worker_rows = _pgbouncer_show(("STATS", "POOLS", "CLIENTS"), port)
+        except OSError as e:
+            lines.append(f"# PgBouncer admin console on port {port} unavailable: {str(e)}")
+            continue
+        if len(ports) > 1:
+            for rows in worker_rows:
+                for row in rows:
+                    row["worker"] = str(worker)
+        stats.extend(worker_rows[0])
+        pools.extend(worker_rows[1])
+        clients.extend(worker_rows[2])
+
+    # SHOW STATS: total_* are counters, avg_* are gauges over the last stats period
+    for column in (stats[0].keys() if stats else []):
+        if column in ("database", "worker"):
+            continue
+        name = f"neon_local_pgbouncer_stats_{column}"
+        lines.append(f"# TYPE {name} {'counter' if column.startswith('total_') else 'gauge'}")
+        for row in stats:
+            value = _number(row.get(column))
+            if value is not None:
+                labels = (("database", row["database"]),) + _worker_label(row) + (("branch", branch),)
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    # SHOW POOLS: connection states per database/user pool
+    for column in (pools[0].keys() if pools else []):
+        if column in ("database", "user", "pool_mode", "worker"):
+            continue
+        name = f"neon_local_pgbouncer_pool_{column}"
+        lines.append(f"# TYPE {name} gauge")
+        for row in pools:
+            value = _number(row.get(column))
+            if value is not None:
+                labels = (("database", row["database"]), ("user", row["user"])) + _worker_label(row) + (("branch", branch),)
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    # SHOW CLIENTS lists every connection, so only export counts per database and state
+    counts = {}
+    for row in clients:
+        key = (row.get("database", ""), row.get("state", ""), _worker_label(row))
+        counts[key] = counts.get(key, 0) + 1
+    lines.append("# TYPE neon_local_pgbouncer_clients gauge")
+    for (database, state, worker), count in sorted(counts.items()):
+        labels = (("database", database), ("state", state)) + worker + (("branch", branch),)
+        lines.append(f"neon_local_pgbouncer_clients{_format_labels(labels)} {count}")
+    return lines
+
+def render_metrics(branch, pgbouncer_ports=(6432,)):
+    lines = []
+    for metric in REGISTRY:
+        for line in metric.render():
+            lines.append(line if line.startswith("#") else _with_labels(line, [("branch", branch)]))
+    lines.extend(collect_envoy_metrics(branch))
+    lines.extend(collect_pgbouncer_metrics(branch, pgbouncer_ports))
+    return "\n".join(lines) + "\n"
+
+class StatusServer:
+    """Small HTTP server for local observability endpoints such as /metrics.
+
+    Handlers are registered per path and return (status, content_type, body).
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.routes = {}
+        self.httpd = None
+
+    def add_route(self, path, handler):
+        self.routes[path] = handler
+
+    def start(self):
+        if self.httpd is not None or not self.port:
+            return
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                handler = routes.get(self.path.split("?", 1)[0])
+                if handler is None:
+                    status, content_type, body = 404, "text/plain", "Not found\n"
+                else:
+                    try:
+                        status, content_type, body = handler()
+                    except Exception as e:
+                        status, content_type, body = 500, "text/plain", f"{str(e)}\n"
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f"Status endpoints listening on port {self.port}: {', '.join(sorted(self.routes))}")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+def status_server_port():
+    return int(os.getenv("METRICS_PORT", "9090"))
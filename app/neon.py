@@ -1,13 +1,57 @@
 import os
+import random
+import time
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from app.metrics import API_REQUEST_DURATION, BRANCH_CREATIONS
+
+# Overridable so the API can be pointed at a local stand-in, e.g. for benchmarks
+API_URL = os.getenv("NEON_API_URL", "https://console.neon.tech/api/v2")
+
+# Path segments followed by an identifier, collapsed so metric labels stay bounded
+ID_PATH_SEGMENTS = {"projects", "branches", "roles", "databases", "endpoints", "operations"}
+
+# Responses worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+AUTH_FAILURE_STATUS_CODES = {401, 403}
+
+
+class NeonAPIError(ValueError):
+    """A Neon API call failed; carries the HTTP status when there was a response."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def is_auth_failure(self):
+        return self.status_code in AUTH_FAILURE_STATUS_CODES
 
-API_URL = "https://console.neon.tech/api/v2"
 
 class NeonAPI:
     def __init__(self):
         self.api_key = os.getenv("NEON_API_KEY")
         self.project_id = os.getenv("NEON_PROJECT_ID")
+        # Upper bound on concurrent control-plane calls made by a single fan-out
+        self.max_workers = max(1, int(os.getenv("NEON_API_MAX_WORKERS", "8")))
+        self.timeout = (
+            float(os.getenv("NEON_API_CONNECT_TIMEOUT", "5")),
+            float(os.getenv("NEON_API_READ_TIMEOUT", "30")),
+        )
+        self.max_retries = max(0, int(os.getenv("NEON_API_MAX_RETRIES", "4")))
+        self.backoff_base = float(os.getenv("NEON_API_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("NEON_API_BACKOFF_MAX", "30"))
+
+        # One keep-alive session for every call, sized so a full fan-out never
+        # has to open throwaway connections outside the pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def _headers(self):
         # Determine user agent based on CLIENT environment variable
@@ -20,7 +64,80 @@ class NeonAPI:
             "User-Agent": user_agent
         }
 
+    def _request(self, method, url, **kwargs):
+        """Send a request on the shared session, retrying transient failures.
+
+        Idempotent methods are retried on connection errors, timeouts, 429 and
+        5xx responses. Other methods are only retried on 429, which Neon sends
+        before doing any work. Waits use jittered exponential backoff unless the
+        response carries a Retry-After header.
+        """
+        method = method.upper()
+        kwargs.setdefault("headers", self._headers())
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        endpoint = self._endpoint_label(url)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                API_REQUEST_DURATION.observe(time.monotonic() - start, method=method, endpoint=endpoint, status="error")
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"Neon API {method} {url} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                API_REQUEST_DURATION.observe(time.monotonic() - start, method=method, endpoint=endpoint,
+                                             status=str(response.status_code))
+                retryable = response.status_code == 429 or (
+                    idempotent and response.status_code in RETRYABLE_STATUS_CODES)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after_delay(response)
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                print(f"Neon API {method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _api_error(self, message, error):
+        response = getattr(error, "response", None)
+        status_code = response.status_code if response is not None else None
+        return NeonAPIError(f"{message}: {str(error)}", status_code)
+
+    def _endpoint_label(self, url):
+        segments = url[len(API_URL):].split("?", 1)[0].strip("/").split("/") if url.startswith(API_URL) else ["other"]
+        for i in range(1, len(segments)):
+            if segments[i - 1] in ID_PATH_SEGMENTS:
+                segments[i] = "{id}"
+        return "/" + "/".join(segments)
+
+    def _backoff_delay(self, attempt):
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after_delay(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(self.backoff_max, max(0.0, delay))
+
     def get_endpoint_host(self, project_id, branch_id):
+        return self.get_endpoint(project_id, branch_id)["host"]
+
+    def get_endpoint(self, project_id, branch_id):
+        """The branch's read_write endpoint, including its host and autoscaling limits."""
         if not self.api_key:
             raise ValueError("NEON_API_KEY not set.")
         if not project_id:
@@ -30,7 +147,7 @@ class NeonAPI:
         
         try:
             endpoint_url = f"{API_URL}/projects/{project_id}/endpoints"
-            endpoint_response = requests.get(endpoint_url, headers=self._headers())
+            endpoint_response = self._request("GET", endpoint_url)
             endpoint_response.raise_for_status()
             endpoint_json = endpoint_response.json()
             
@@ -42,12 +159,12 @@ class NeonAPI:
                 if endpoint.get("branch_id") == branch_id and endpoint.get("type") == "read_write":
                     if not endpoint.get("host"):
                         raise ValueError("Endpoint host not found in response")
-                    return endpoint["host"]
+                    return endpoint
             
             raise ValueError(f"No read_write endpoint found for branch {branch_id}")
             
         except requests.exceptions.RequestException as e:
-            raise ValueError(f"Failed to fetch endpoint information: {str(e)}")
+            raise self._api_error("Failed to fetch endpoint information", e)
     
     def get_database_name_and_owner(self, project_id, branch_id):
         if not self.api_key:
@@ -59,7 +176,7 @@ class NeonAPI:
         
         try:
             url = f"{API_URL}/projects/{project_id}/branches/{branch_id}/databases"
-            response = requests.get(url, headers=self._headers())
+            response = self._request("GET", url)
             response.raise_for_status()
             json_response = response.json()
             
@@ -83,7 +200,7 @@ class NeonAPI:
             return databases
             
         except requests.exceptions.RequestException as e:
-            raise ValueError(f"Failed to fetch database information: {str(e)}")
+            raise self._api_error("Failed to fetch database information", e)
     
     def get_database_owner_password(self, project_id, branch_id, user):
         if not self.api_key:
@@ -97,7 +214,7 @@ class NeonAPI:
         
         try:
             url = f"{API_URL}/projects/{project_id}/branches/{branch_id}/roles/{user}/reveal_password"
-            response = requests.get(url, headers=self._headers())
+            response = self._request("GET", url)
             response.raise_for_status()
             json_response = response.json()
             
@@ -107,7 +224,7 @@ class NeonAPI:
             return json_response["password"]
             
         except requests.exceptions.RequestException as e:
-            raise ValueError(f"Failed to fetch password: {str(e)}")
+            raise self._api_error("Failed to fetch password", e)
 
     def get_branch_connection_info(self, project_id, branch_id):
         if not self.api_key:
@@ -117,15 +234,45 @@ class NeonAPI:
         if not branch_id:
             raise ValueError("BRANCH_ID not set.")
 
-        databases = self.get_database_name_and_owner(project_id, branch_id)
-        host = self.get_endpoint_host(project_id, branch_id)
-        
-        # Add password to each database entry
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Databases and endpoints are independent lookups, fetch them together
+            databases_future = executor.submit(self.get_database_name_and_owner, project_id, branch_id)
+            endpoint_future = executor.submit(self.get_endpoint, project_id, branch_id)
+            databases = self._collect([databases_future, endpoint_future])[0]
+            endpoint = endpoint_future.result()
+
+            # Reveal each owner's password once, even when a role owns several databases
+            users = list(dict.fromkeys(db_info["user"] for db_info in databases))
+            password_futures = [
+                executor.submit(self.get_database_owner_password, project_id, branch_id, user)
+                for user in users
+            ]
+            passwords = dict(zip(users, self._collect(password_futures)))
+
+        # Results are assembled in the order the API listed the databases
         for db_info in databases:
-            db_info["password"] = self.get_database_owner_password(project_id, branch_id, db_info["user"])
-            db_info["host"] = host
+            db_info["password"] = passwords[db_info["user"]]
+            db_info["host"] = endpoint["host"]
+            # Used to size PgBouncer's pools for the compute, see pool_sizing.py
+            db_info["compute_max_cu"] = endpoint.get("autoscaling_limit_max_cu")
         
         return databases
+
+    def _collect(self, futures):
+        """Wait for all futures and return their results in submission order.
+
+        If any call fails, the remaining queued calls are cancelled and the
+        first error (in submission order) is raised.
+        """
+        results = []
+        try:
+            for future in futures:
+                results.append(future.result())
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return results
         
     def cleanup_branch(self, state, current_branch):
         if not self.api_key or not self.project_id:
@@ -142,16 +289,14 @@ class NeonAPI:
                     print("No branch_id found in state, skipping cleanup")
                     return state
                     
-                requests.get(f"{API_URL}/projects/{self.project_id}/branches/{branch_id}",
-                             headers=self._headers()).raise_for_status()
+                self._request("GET", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}").raise_for_status()
             except:
                 print("Branch not found at Neon.")
                 params = None
 
             if params:
-                response = requests.delete(
-                    f"{API_URL}/projects/{self.project_id}/branches/{branch_id}",
-                    headers=self._headers())
+                response = self._request(
+                    "DELETE", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}")
                 print(response)
                 response.raise_for_status()
                 print(response.json())
@@ -161,14 +306,66 @@ class NeonAPI:
 
         return state
 
+    def list_branches(self):
+        response = self._request("GET", f"{API_URL}/projects/{self.project_id}/branches")
+        response.raise_for_status()
+        return response.json().get("branches", [])
+
+    def get_branch(self, branch_id):
+        response = self._request("GET", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}")
+        response.raise_for_status()
+        return response.json()["branch"]
+
+    def create_branch(self, branch_name=None, parent_branch_id=None, annotations=None):
+        """Create a branch with a read_write endpoint and return its ID."""
+        payload = {
+            "annotation_value": {"neon_local": "true"},
+            "endpoints": [{"type": "read_write"}]
+        }
+        if annotations:
+            payload["annotation_value"].update(annotations)
+
+        if parent_branch_id or branch_name:
+            payload["branch"] = {}
+            if parent_branch_id:
+                payload["branch"]["parent_id"] = parent_branch_id
+            if branch_name:
+                payload["branch"]["name"] = branch_name
+
+        response = self._request("POST", f"{API_URL}/projects/{self.project_id}/branches",
+                                 json=payload)
+        response.raise_for_status()
+        BRANCH_CREATIONS.inc(kind="pool" if annotations and annotations.get("neon_local_pool") else "on_demand")
+        return response.json()["branch"]["id"]
+
+    def rename_branch(self, branch_id, branch_name):
+        response = self._request("PATCH", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}",
+                                 json={"branch": {"name": branch_name}})
+        response.raise_for_status()
+        return response.json()["branch"]
+
+    def delete_branch(self, branch_id):
+        response = self._request("DELETE", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}")
+        response.raise_for_status()
+
+    def create_role(self, branch_id, role_name):
+        response = self._request("POST", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}/roles",
+                                 json={"role": {"name": role_name}})
+        response.raise_for_status()
+
+    def delete_role(self, branch_id, role_name):
+        """Delete a role, returning False if the branch has no role by that name."""
+        response = self._request("DELETE", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}/roles/{role_name}")
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
     def _get_available_branch_name(self, base_name):
         """Get an available branch name by appending a number if needed."""
         try:
             # Get all existing branches
-            branches_response = requests.get(f"{API_URL}/projects/{self.project_id}/branches",
-                                           headers=self._headers())
-            branches_response.raise_for_status()
-            branches = branches_response.json().get("branches", [])
+            branches = self.list_branches()
             
             # Get all existing branch names
             existing_names = {branch.get("name") for branch in branches if branch.get("name")}
@@ -189,7 +386,7 @@ class NeonAPI:
             print(f"Error checking branch names: {str(e)}")
             raise
 
-    def fetch_or_create_branch(self, state, current_branch, parent_branch_id=None, vscode=False):
+    def fetch_or_create_branch(self, state, current_branch, parent_branch_id=None, vscode=False, branch_pool=None):
         if not self.api_key or not self.project_id:
             raise ValueError("NEON_API_KEY or NEON_PROJECT_ID not set.")
 
@@ -198,8 +395,7 @@ class NeonAPI:
             try:
                 branch_id = state[current_branch]["branch_id"]
                 # Verify branch still exists
-                requests.get(f"{API_URL}/projects/{self.project_id}/branches/{branch_id}",
-                             headers=self._headers()).raise_for_status()
+                self._request("GET", f"{API_URL}/projects/{self.project_id}/branches/{branch_id}").raise_for_status()
             except:
                 print("No branch found at Neon.")
                 branch_id = None
@@ -211,26 +407,13 @@ class NeonAPI:
                 if branch_name != current_branch:
                     print(f"Branch name '{current_branch}' already exists, using '{branch_name}' instead")
                 
-                # Create new branch
-                payload = {
-                    "annotation_value": {"neon_local": "true"},
-                    "endpoints": [{"type": "read_write"}]
-                }
-
-                if parent_branch_id or branch_name:
-                    payload["branch"] = {}
-                    if parent_branch_id:
-                        payload["branch"]["parent_id"] = parent_branch_id
-                    if branch_name:
-                        payload["branch"]["name"] = branch_name
-                if vscode:
-                    payload["annotation_value"]["vscode"] = "true"
-
-                response = requests.post(f"{API_URL}/projects/{self.project_id}/branches",
-                                         headers=self._headers(), json=payload)
-                response.raise_for_status()
-                json_response = response.json()
-                branch_id = json_response["branch"]["id"]
+                # Claim a pre-created branch from the warm pool before creating one
+                if branch_pool:
+                    branch_id = branch_pool.claim(branch_name)
+
+                if branch_id is None:
+                    annotations = {"vscode": "true"} if vscode else None
+                    branch_id = self.create_branch(branch_name, parent_branch_id, annotations)
                 
             except requests.exceptions.RequestException as e:
                 print(f"Error creating branch: {str(e)}")
@@ -0,0 +1,120 @@
+import os
+import re
+import signal
+import threading
+import subprocess
+from app.pool_sizing import container_cpus
+
+BASE_PORT = 6432
+MAX_AUTO_WORKERS = 8
+DEFAULT_SOCKET_DIR = "/tmp"
+SUPERVISE_INTERVAL = 1.0
+PGBOUNCER_COMMAND = "/usr/local/bin/pgbouncer_wrapper.sh"
+
+def worker_count():
+    """PGBOUNCER_WORKERS, where "auto" means one worker per available CPU."""
+    value = os.getenv("PGBOUNCER_WORKERS", "1").lower()
+    if value == "auto":
+        return max(1, min(MAX_AUTO_WORKERS, int(container_cpus())))
+    count = int(value)
+    if count < 1:
+        raise ValueError(f"PGBOUNCER_WORKERS must be at least 1 or auto, got: {value}")
+    return count
+
+class PgBouncerWorkers:
+    """A group of PgBouncer processes on consecutive ports, started, reloaded and stopped together.
+
+    PgBouncer is single-threaded, so Postgres throughput is capped at one core
+    per process. Worker i listens on BASE_PORT + i with its own copy of the
+    config, and Envoy balances client connections across all of them. A
+    worker that exits on its own is restarted by the supervisor thread.
+
+    Every worker also listens on a Unix socket in socket_dir, named after its
+    port like Postgres does. With PGBOUNCER_UNIX_SOCKET=true Envoy connects
+    to those sockets instead of loopback TCP.
+    """
+
+    def __init__(self):
+        self.count = worker_count()
+        self.base_port = BASE_PORT
+        self.unix_socket = os.getenv("PGBOUNCER_UNIX_SOCKET", "false").lower() == "true"
+        self.socket_dir = os.getenv("PGBOUNCER_SOCKET_DIR", DEFAULT_SOCKET_DIR)
+        self.processes = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._launch = None
+        self._thread = None
+
+    @property
+    def ports(self):
+        return [self.base_port + i for i in range(self.count)]
+
+    @property
+    def socket_paths(self):
+        return [os.path.join(self.socket_dir, f".s.PGSQL.{port}") for port in self.ports]
+
+    def config_paths(self, config_path):
+        """The first worker uses config_path itself, the others a numbered copy next to it."""
+        root, ext = os.path.splitext(config_path)
+        return [config_path] + [f"{root}-{i}{ext}" for i in range(1, self.count)]
+
+    def write_configs(self, config_path, config):
+        config = re.sub(r"^unix_socket_dir = .*$", f"unix_socket_dir = {self.socket_dir}", config, flags=re.MULTILINE)
+        for path, port in zip(self.config_paths(config_path), self.ports):
+            with open(path, "w") as file:
+                file.write(re.sub(r"^listen_port = \d+$", f"listen_port = {port}", config, flags=re.MULTILINE))
+
+    def _spawn(self, config_path, env, log_path):
+        with open(log_path, "a") as log:
+            return subprocess.Popen([PGBOUNCER_COMMAND, config_path], stdout=log, stderr=log, env=env)
+
+    def start(self, config_path, env, log_path="/var/log/pgbouncer.log"):
+        with self._lock:
+            self._stopping = False
+            self._launch = (env, log_path)
+            self.processes = [self._spawn(path, env, log_path) for path in self.config_paths(config_path)]
+        if self.count > 1:
+            print(f"Started {self.count} PgBouncer workers on ports {self.ports[0]}-{self.ports[-1]}")
+
+    def running(self):
+        with self._lock:
+            return bool(self.processes) and all(process.poll() is None for process in self.processes)
+
+    def reload(self):
+        """Make every worker re-read its config."""
+        with self._lock:
+            for process in self.processes:
+                if process.poll() is None:
+                    process.send_signal(signal.SIGHUP)
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            processes, self.processes = self.processes, []
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def supervise(self, config_path, shutdown_event):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._supervise_loop, args=(config_path, shutdown_event), daemon=True)
+        self._thread.start()
+
+    def _supervise_loop(self, config_path, shutdown_event):
+        while not shutdown_event.wait(SUPERVISE_INTERVAL):
+            with self._lock:
+                if self._stopping or not self._launch:
+                    continue
+                env, log_path = self._launch
+                paths = self.config_paths(config_path)
+                for i, process in enumerate(self.processes):
+                    if process.poll() is not None:
+                        print(f"PgBouncer worker {i} on port {self.ports[i]} exited with code "
+                              f"{process.returncode}, restarting")
+                        self.processes[i] = self._spawn(paths[i], env, log_path)
@@ -0,0 +1,130 @@
+import os
+import math
+import time
+import threading
+from app.readiness import postgres_connect, postgres_query, postgres_close
+from app.metrics import PGBOUNCER_PREWARM_CONNECTIONS
+
+PGBOUNCER_HOST = "127.0.0.1"
+POLL_INTERVAL = 0.2
+SERVER_COLUMNS = ("sv_active", "sv_idle", "sv_used", "sv_tested", "sv_login")
+
+def _count(pool, columns):
+    return sum(int(pool.get(column) or 0) for column in columns)
+
+class PoolPrewarmer:
+    """Opens PgBouncer server connections in parallel when clients return after an idle period.
+
+    PgBouncer keeps min_pool_size at 0 so computes can scale to zero, which
+    means the first burst of clients after a pause finds an empty pool and
+    each server connection pays for TLS and SCRAM to Neon on demand. This
+    watches SHOW POOLS and, as soon as a client shows up in a pool without
+    server connections, opens PGBOUNCER_PREWARM_SIZE sessions that each hold
+    a transaction until all of them have a server connection. The servers
+    then stay in the pool for the clients that follow, and close again after
+    server_idle_timeout like any other.
+
+    With several PgBouncer workers, get_ports returns all of their ports and
+    the prewarm size is split between them, since Envoy spreads clients
+    across the workers. A prewarm never asks for more than the pool size.
+    """
+
+    def __init__(self, shutdown_event, get_ports):
+        self.shutdown_event = shutdown_event
+        self.get_ports = get_ports
+        self.size = int(os.getenv("PGBOUNCER_PREWARM_SIZE", "5"))
+        self.timeout = float(os.getenv("PGBOUNCER_PREWARM_TIMEOUT", "15"))
+        self._warmed = set()
+        self._thread = None
+
+    def start(self):
+        if self.size <= 1 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def check(self, pools, pool_sizes=None, port=6432, workers=1):
+        """Start a prewarm for every pool that just got its first client; returns the databases.
+
+        pools are SHOW POOLS rows of the worker on port, pool_sizes maps
+        database names to their pool_size from SHOW DATABASES.
+        """
+        started = []
+        size = math.ceil(self.size / workers)
+        for pool in pools:
+            database = pool.get("database")
+            if database == "pgbouncer":
+                continue
+            key = (port, database, pool.get("user"))
+            clients = _count(pool, ("cl_active", "cl_waiting"))
+            servers = _count(pool, SERVER_COLUMNS)
+            if not clients and not servers:
+                # Idle again, the next client gets a fresh prewarm
+                self._warmed.discard(key)
+            elif clients and servers <= 1 and key not in self._warmed:
+                self._warmed.add(key)
+                count = min(size, (pool_sizes or {}).get(database, size)) - servers
+                threading.Thread(target=self.prewarm, args=(database, count, port), daemon=True).start()
+                started.append(database)
+        return started
+
+    def prewarm(self, database, count, port=6432):
+        if count <= 0:
+            return
+        start = time.monotonic()
+        # Every session keeps its server connection until all of them have one,
+        # otherwise PgBouncer would hand the same server to each in turn
+        barrier = threading.Barrier(count)
+        results = []
+
+        def open_server_connection():
+            sock = None
+            try:
+                sock = postgres_connect(PGBOUNCER_HOST, port, database, timeout=self.timeout)
+                postgres_query(sock, "BEGIN")
+                results.append(True)
+                try:
+                    barrier.wait(timeout=self.timeout)
+                except threading.BrokenBarrierError:
+                    pass
+                postgres_query(sock, "COMMIT")
+            except OSError as e:
+                results.append(False)
+                barrier.abort()
+                print(f"PgBouncer prewarm for {database} failed: {str(e)}")
+            finally:
+                if sock is not None:
+                    postgres_close(sock)
+
+        threads = [threading.Thread(target=open_server_connection, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        opened = results.count(True)
+        PGBOUNCER_PREWARM_CONNECTIONS.inc(opened, result="success")
+        PGBOUNCER_PREWARM_CONNECTIONS.inc(len(results) - opened, result="failure")
+        print(f"PgBouncer prewarm: {opened}/{count} server connections for {database} on port {port} "
+              f"in {(time.monotonic() - start) * 1000:.0f}ms")
+
+    def run(self):
+        admins = {}
+        while not self.shutdown_event.wait(POLL_INTERVAL):
+            ports = self.get_ports()
+            for port in ports:
+                try:
+                    if port not in admins:
+                        admins[port] = postgres_connect(PGBOUNCER_HOST, port, "pgbouncer", timeout=2)
+                    pools = postgres_query(admins[port], "SHOW POOLS")
+                    if not any(_count(pool, ("cl_active", "cl_waiting")) for pool in pools):
+                        self.check(pools, port=port, workers=len(ports))
+                        continue
+                    pool_sizes = {row["name"]: int(row.get("pool_size") or 0)
+                                  for row in postgres_query(admins[port], "SHOW DATABASES")}
+                except OSError:
+                    # PgBouncer is restarting, reconnect on the next poll
+                    if port in admins:
+                        postgres_close(admins.pop(port))
+                    continue
+                self.check(pools, pool_sizes, port, len(ports))
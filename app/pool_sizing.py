@@ -0,0 +1,102 @@
+import os
+import math
+import resource
+
+# Neon sets max_connections from the compute size (the maximum when autoscaling),
+# roughly 450 per CU up to 4000, and keeps a few of them for its own use
+NEON_CONNECTIONS_PER_CU = 450.5
+NEON_MAX_CONNECTIONS = 4000
+NEON_RESERVED_CONNECTIONS = 7
+# Share of the compute's connections PgBouncer may use, the rest is left for
+# direct connections such as the SQL editor or psql
+POOLER_SHARE = 0.9
+# Server connections worth keeping busy per CU on the compute and per CPU of
+# this container, where PgBouncer and most clients run
+SERVER_CONNECTIONS_PER_CU = 40
+SERVER_CONNECTIONS_PER_CPU = 25
+MIN_POOL_SIZE = 5
+# Fallbacks when the compute size is unknown, the values pgbouncer.ini.tmpl used to hard-code
+DEFAULT_POOL_SIZE = 25
+DEFAULT_RESERVE_POOL_SIZE = 5
+DEFAULT_MAX_CLIENT_CONN = 200
+CLIENTS_PER_SERVER_CONNECTION = 10
+FILE_DESCRIPTOR_MARGIN = 100
+
+def neon_max_connections(compute_units):
+    return min(NEON_MAX_CONNECTIONS, int(compute_units * NEON_CONNECTIONS_PER_CU))
+
+def container_cpus():
+    """CPUs available to this container: the cgroup CPU quota if there is one, else the CPUs we may run on."""
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max", "r") as file:
+            quota, period = file.read().split()[:2]
+        if quota != "max":
+            return max(1.0, int(quota) / int(period))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as file:
+                quota = int(file.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as file:
+                period = int(file.read())
+            if quota > 0 and period > 0:
+                return max(1.0, quota / period)
+        except (OSError, ValueError):
+            pass
+    return float(len(os.sched_getaffinity(0)))
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def pool_sizes(databases, cpus=None, workers=1):
+    """Pool sizes per database and max_client_conn for each of workers PgBouncer processes.
+
+    Returns ({database: (pool_size, reserve_pool_size)}, max_client_conn). A
+    database's pool is limited by its compute's CPUs, the CPUs of this
+    container, and its share of the compute's max_connections with every
+    other database on the same compute. Every worker has its own pools, so
+    the pools are split between them. PGBOUNCER_POOL_SIZE,
+    PGBOUNCER_RESERVE_POOL_SIZE and PGBOUNCER_MAX_CLIENT_CONN override the
+    computed values before the split.
+    """
+    cpus = cpus or container_cpus()
+    cpu_limit = max(MIN_POOL_SIZE, int(cpus * SERVER_CONNECTIONS_PER_CPU))
+    pool_size_override = _env_int("PGBOUNCER_POOL_SIZE")
+    reserve_override = _env_int("PGBOUNCER_RESERVE_POOL_SIZE")
+
+    databases_per_host = {}
+    for db in databases:
+        databases_per_host[db["host"]] = databases_per_host.get(db["host"], 0) + 1
+
+    sizes = {}
+    for db in databases:
+        compute_units = db.get("compute_max_cu")
+        if compute_units:
+            budget = int((neon_max_connections(compute_units) - NEON_RESERVED_CONNECTIONS) * POOLER_SHARE)
+            budget = max(2, budget // databases_per_host[db["host"]])
+            compute_limit = max(MIN_POOL_SIZE, math.ceil(compute_units * SERVER_CONNECTIONS_PER_CU))
+            # The reserve is a fifth of the pool, both together stay within the budget
+            total = min(budget, compute_limit * 6 // 5, cpu_limit * 6 // 5)
+            pool_size = max(1, total * 5 // 6)
+            reserve_pool_size = total - pool_size
+        else:
+            pool_size, reserve_pool_size = DEFAULT_POOL_SIZE, DEFAULT_RESERVE_POOL_SIZE
+        if pool_size_override is not None:
+            pool_size = pool_size_override
+        if reserve_override is not None:
+            reserve_pool_size = reserve_override
+        sizes[db["database"]] = (max(1, pool_size // workers), reserve_pool_size // workers)
+
+    max_client_conn = _env_int("PGBOUNCER_MAX_CLIENT_CONN")
+    if max_client_conn is None:
+        # Sized per worker from that worker's own server connections
+        server_connections = sum(pool + reserve for pool, reserve in sizes.values())
+        max_client_conn = max(DEFAULT_MAX_CLIENT_CONN, server_connections * CLIENTS_PER_SERVER_CONNECTION)
+        # Every client and server connection is a file descriptor in PgBouncer
+        file_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if file_limit != resource.RLIM_INFINITY:
+            max_client_conn = min(max_client_conn, max(DEFAULT_MAX_CLIENT_CONN,
+                                                       file_limit - server_connections - FILE_DESCRIPTOR_MARGIN))
+    return sizes, max_client_conn
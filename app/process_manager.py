@@ -1,9 +1,19 @@
 import threading
-import hashlib
 import time
 import os
 import json
 from app.neon import NeonAPI
+from app.metrics import RELOADS, RELOAD_DURATION
+from app.timeline import Timeline
+from contextlib import nullcontext
+from app.git_watcher import GitHeadWatcher
+
+GIT_DIR = "/tmp/.git"
+# Mount point for the main repository's .git/worktrees when GIT_DIR is a worktree's .git file
+GIT_WORKTREES_DIR = "/tmp/.git-worktrees"
+
+class ReloadSuperseded(Exception):
+    """Raised inside a reload once a newer change has been requested."""
 
 class ProcessManager:
     def __init__(self):
@@ -11,6 +21,13 @@ class ProcessManager:
         self.config_cv = threading.Condition()
         self.reload_lock = threading.Lock()
         self.reload_needed = False
+        # Bumped on every change so an in-flight reload can tell it is stale
+        self.reload_generation = 0
+        self.active_reload_generation = None
+        self.reload_debounce = float(os.getenv("RELOAD_DEBOUNCE_MS", "500")) / 1000
+        # Timeline of the boot or reload in progress, and the last finished one
+        self.timeline = None
+        self.latest_timeline = None
         self.watcher_thread = None
         self.reloader_thread = None
         self.neon = NeonAPI()
@@ -26,43 +43,94 @@ class ProcessManager:
             
         self.delete_branch = os.getenv("DELETE_BRANCH", "true").lower() == "true"
         self.vscode = os.getenv("VSCODE", "").lower() == "true"
+        self._warned_unreachable_gitdir = False
         
-    def calculate_file_hash(self, path):
-        if not os.path.exists(path):
-            return None
-        with open(path, "rb") as file:
-            return hashlib.sha256(file.read()).hexdigest()
-
     def watch_file_changes(self, file_path):
-        last_hash = self.calculate_file_hash(file_path)
-        print(f"Watching {file_path} for changes...")
-        while not self.shutdown_event.is_set():
-            time.sleep(1)
-            try:
-                current_hash = self.calculate_file_hash(file_path)
-                if current_hash != last_hash:
-                    print("File changed. Triggering reload...")
-                    last_hash = current_hash
-                    with self.reload_lock:
-                        self.reload_needed = True
-                    with self.config_cv:
-                        self.config_cv.notify()
-            except Exception as e:
-                print(f"Error watching file: {e}")
+        def on_change():
+            print("File changed. Triggering reload...")
+            self.request_reload()
+
+        poll_interval = float(os.getenv("GIT_HEAD_POLL_INTERVAL", "1"))
+        GitHeadWatcher(file_path, on_change, self.shutdown_event, poll_interval).run()
+
+    def request_reload(self):
+        with self.reload_lock:
+            self.reload_needed = True
+            self.reload_generation += 1
+        with self.config_cv:
+            self.config_cv.notify()
+
+    def check_reload_superseded(self):
+        """Abort the running reload if another change arrived since it started."""
+        with self.reload_lock:
+            if (self.active_reload_generation is not None
+                    and self.reload_generation != self.active_reload_generation):
+                raise ReloadSuperseded()
+
+    def _wait_for_quiet_period(self):
+        """Coalesce a burst of changes, returning False if there is nothing to reload.
+
+        Waits until no change has been requested for the debounce window, so a
+        rebase or a run of quick checkouts results in a single reload.
+        """
+        with self.reload_lock:
+            if not self.reload_needed:
+                return False
+            generation = self.reload_generation
+        while not self.shutdown_event.wait(self.reload_debounce):
+            with self.reload_lock:
+                if self.reload_generation == generation:
+                    self.reload_needed = False
+                    self.active_reload_generation = generation
+                    return True
+                generation = self.reload_generation
+        return False
+
+    def span(self, name, **attributes):
+        """Time a phase of the current boot or reload; a no-op outside of one."""
+        if self.timeline is None:
+            return nullcontext()
+        return self.timeline.span(name, **attributes)
+
+    def _finish_timeline(self, result):
+        if self.timeline is not None:
+            self.latest_timeline = self.timeline.finish(result)
+            self.timeline = None
 
     def start_reloader_loop(self):
-        self.start_process()
+        self.timeline = Timeline("boot")
+        try:
+            self.start_process()
+        except Exception:
+            self._finish_timeline("error")
+            raise
+        self._finish_timeline("success")
         while not self.shutdown_event.is_set():
             with self.config_cv:
-                self.config_cv.wait(timeout=1)
-                if self.shutdown_event.is_set():
-                    break
                 with self.reload_lock:
-                    if not self.reload_needed:
-                        continue
-                    self.reload_needed = False
+                    pending = self.reload_needed
+                if not pending:
+                    self.config_cv.wait(timeout=1)
+            if self.shutdown_event.is_set():
+                break
+            if not self._wait_for_quiet_period():
+                continue
             print("Reload triggered.")
-            self.reload()
+            start = time.monotonic()
+            result = "error"
+            self.timeline = Timeline("reload")
+            try:
+                self.reload()
+                result = "success"
+            except ReloadSuperseded:
+                result = "superseded"
+                print("Reload superseded by a newer change, switching to the latest branch...")
+            finally:
+                with self.reload_lock:
+                    self.active_reload_generation = None
+                RELOADS.inc(result=result)
+                RELOAD_DURATION.observe(time.monotonic() - start, result=result)
+                self._finish_timeline(result)
         self.stop_process()
 
     def branch_cleanup(self):
@@ -81,9 +149,41 @@ class ProcessManager:
         print(state)
         self._write_neon_branch(state)
 
+    def _git_head_path(self):
+        """Path of HEAD, following the "gitdir:" file a worktree puts in place of .git.
+
+        The gitdir is a path on the host, which the container usually cannot
+        reach. In that case the worktree's directory is looked up by name in
+        GIT_WORKTREES_DIR, where the main repository's .git/worktrees can be
+        mounted.
+        """
+        git_dir = GIT_DIR
+        if not os.path.isfile(git_dir):
+            return os.path.join(git_dir, "HEAD")
+        try:
+            with open(git_dir, "r") as file:
+                content = file.read().strip()
+        except OSError:
+            return os.path.join(git_dir, "HEAD")
+        if not content.startswith("gitdir:"):
+            return os.path.join(git_dir, "HEAD")
+
+        gitdir = content.split(":", 1)[1].strip()
+        git_dir = os.path.join(os.path.dirname(GIT_DIR), gitdir)
+        if not os.path.isdir(git_dir):
+            mapped_dir = os.path.join(GIT_WORKTREES_DIR, os.path.basename(os.path.normpath(gitdir)))
+            if os.path.isdir(mapped_dir):
+                git_dir = mapped_dir
+            elif not self._warned_unreachable_gitdir:
+                self._warned_unreachable_gitdir = True
+                print(f"{GIT_DIR} points to the worktree git directory {gitdir}, which is not mounted in the "
+                      f"container. Mount your main repository's .git/worktrees directory at {GIT_WORKTREES_DIR} "
+                      f"to follow branch switches in this worktree.")
+        return os.path.join(git_dir, "HEAD")
+
     def _get_git_branch(self):
         try:
-            with open("/tmp/.git/HEAD", "r") as file:
+            with open(self._git_head_path(), "r") as file:
                 return file.read().split(":", 1)[1].split("/", 2)[-1].strip()
         except:
             return None
@@ -123,7 +223,8 @@ class ProcessManager:
         raise NotImplementedError
 
     def reload(self):
-        self.stop_process()
+        with self.span("stop_process"):
+            self.stop_process()
         self.start_process()
 
     def cleanup(self):
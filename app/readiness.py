@@ -0,0 +1,292 @@
+import os
+import ssl
+import time
+import socket
+import struct
+import hashlib
+import threading
+from datetime import datetime
+import requests
+from app.envoy_xds import PROBE_HEADER
+
+# The neon user from userlist.txt, which PgBouncer accepts for every database
+PROBE_USER = "neon"
+PROBE_PASSWORD = "npg"
+SSL_REQUEST_CODE = 80877103
+PROTOCOL_VERSION = 196608
+
+# Retry delays for a probe that has not passed yet, in seconds
+MIN_RETRY_DELAY = 0.05
+MAX_RETRY_DELAY = 2.0
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Server closed the connection")
+        data += chunk
+    return data
+
+def _read_message(sock):
+    header = _recv_exact(sock, 5)
+    message_type, length = header[:1], struct.unpack("!I", header[1:])[0]
+    return message_type, _recv_exact(sock, length - 4)
+
+def _error_message(body):
+    fields = {}
+    for field in body.split(b"\0"):
+        if field:
+            fields[field[:1]] = field[1:].decode(errors="replace")
+    return fields.get(b"M", "unknown error")
+
+def _message(message_type, body):
+    return message_type + struct.pack("!I", len(body) + 4) + body
+
+def ssl_client_context():
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    # The local certificate is self-signed
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def _open_socket(host, port, timeout):
+    # Like libpq, a host starting with / is the directory of the server's Unix socket
+    if not host.startswith("/"):
+        return socket.create_connection((host, port), timeout=timeout)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(os.path.join(host, f".s.PGSQL.{port}"))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+def postgres_connect(host, port, database, user=PROBE_USER, password=PROBE_PASSWORD, timeout=10, tls=True):
+    """Open an authenticated Postgres session, returning the socket once it is ready for queries.
+
+    The session uses TLS unless tls is False, which PgBouncer requires for
+    clients on its Unix socket.
+    """
+    sock = _open_socket(host, port, timeout)
+    try:
+        if tls:
+            sock.sendall(struct.pack("!II", 8, SSL_REQUEST_CODE))
+            if _recv_exact(sock, 1) != b"S":
+                raise ConnectionError("Server refused SSL")
+            sock = ssl_client_context().wrap_socket(sock, server_hostname=None if host.startswith("/") else host)
+
+        parameters = {"user": user, "database": database, "application_name": "neon_local_readiness"}
+        body = struct.pack("!I", PROTOCOL_VERSION)
+        body += b"".join(f"{key}\0{value}\0".encode() for key, value in parameters.items()) + b"\0"
+        sock.sendall(struct.pack("!I", len(body) + 4) + body)
+
+        while True:
+            message_type, body = _read_message(sock)
+            if message_type == b"E":
+                raise ConnectionError(_error_message(body))
+            if message_type == b"R":
+                auth_type = struct.unpack("!I", body[:4])[0]
+                if auth_type == 3:
+                    sock.sendall(_message(b"p", password.encode() + b"\0"))
+                elif auth_type == 5:
+                    inner = hashlib.md5((password + user).encode()).hexdigest()
+                    digest = "md5" + hashlib.md5(inner.encode() + body[4:8]).hexdigest()
+                    sock.sendall(_message(b"p", digest.encode() + b"\0"))
+                elif auth_type != 0:
+                    raise ConnectionError(f"Unsupported authentication method {auth_type}")
+            elif message_type == b"Z":
+                return sock
+    except BaseException:
+        sock.close()
+        raise
+
+def _row_description(body):
+    count = struct.unpack("!h", body[:2])[0]
+    names = []
+    offset = 2
+    for _ in range(count):
+        end = body.index(b"\0", offset)
+        names.append(body[offset:end].decode())
+        # Table OID, column number, type OID, type size, type modifier and format code
+        offset = end + 1 + 18
+    return names
+
+def _data_row(body):
+    count = struct.unpack("!h", body[:2])[0]
+    values = []
+    offset = 2
+    for _ in range(count):
+        length = struct.unpack("!i", body[offset:offset + 4])[0]
+        offset += 4
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(body[offset:offset + length].decode(errors="replace"))
+            offset += length
+    return values
+
+def postgres_query(sock, query):
+    """Run a simple query on a session from postgres_connect and return its rows as dicts of text values."""
+    sock.sendall(_message(b"Q", query.encode() + b"\0"))
+    error = None
+    columns = []
+    rows = []
+    while True:
+        message_type, body = _read_message(sock)
+        if message_type == b"E":
+            error = _error_message(body)
+        elif message_type == b"T":
+            columns = _row_description(body)
+        elif message_type == b"D":
+            rows.append(dict(zip(columns, _data_row(body))))
+        elif message_type == b"Z":
+            break
+    if error:
+        raise ConnectionError(error)
+    return rows
+
+def postgres_close(sock):
+    try:
+        sock.sendall(_message(b"X", b""))
+    except OSError:
+        pass
+    sock.close()
+
+def postgres_probe(host, port, database, user=PROBE_USER, password=PROBE_PASSWORD, timeout=10, tls=True):
+    """Open a Postgres session and run SELECT 1, raising ConnectionError on failure.
+
+    This is the same round trip a client makes: SSLRequest, startup, password
+    authentication and a simple query, so it only passes once the whole path
+    through Envoy and PgBouncer to the Neon compute is working. PgBouncer may
+    answer the startup from cached server parameters, the query makes sure a
+    server connection is actually usable.
+    """
+    sock = postgres_connect(host, port, database, user, password, timeout, tls)
+    try:
+        postgres_query(sock, "SELECT 1")
+    finally:
+        postgres_close(sock)
+
+def http_sql_probe(url, connection_string, timeout=10):
+    """Run SELECT 1 over the Neon serverless HTTP endpoint at url.
+
+    The request is marked as a probe, so Envoy does not count it as client
+    traffic that keeps the compute's health checks running.
+    """
+    try:
+        response = requests.post(url, json={"query": "SELECT 1", "params": []},
+                                 headers={"Neon-Connection-String": connection_string, PROBE_HEADER: "1"},
+                                 timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(str(e))
+    if response.status_code != 200:
+        raise ConnectionError(f"HTTP {response.status_code}: {response.text.strip()[:200]}")
+
+class ReadinessChecker:
+    """Runs readiness probes concurrently and remembers the latest result.
+
+    Each probe is retried until it passes or the deadline expires. A refused
+    connection means the local process is still starting, so it is retried
+    quickly; any other failure (for example a compute that is waking up)
+    backs off exponentially so the probes don't pile up on Neon.
+
+    Between waits, status() can re-run a cheap local check, at most every
+    READINESS_RECHECK_INTERVAL seconds, so a proxy that died since the last
+    wait is reported instead of the stale result.
+    """
+
+    def __init__(self):
+        self.timeout = float(os.getenv("READINESS_TIMEOUT", "30"))
+        self.recheck_interval = float(os.getenv("READINESS_RECHECK_INTERVAL", "5"))
+        self.ready = False
+        self.results = {}
+        self.checked_at = None
+        self.recheck_error = None
+        self._rechecked_at = None
+        self._lock = threading.Lock()
+
+    def _run_probe(self, name, probe, deadline):
+        delay = MIN_RETRY_DELAY
+        attempts = 0
+        start = time.monotonic()
+        while True:
+            attempts += 1
+            try:
+                probe()
+                result = {"ready": True}
+                break
+            except Exception as e:
+                result = {"ready": False, "error": str(e)}
+                refused = isinstance(e, ConnectionRefusedError)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(MIN_RETRY_DELAY if refused else delay, remaining))
+            if not refused:
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+        result["attempts"] = attempts
+        result["duration_ms"] = round((time.monotonic() - start) * 1000, 3)
+        with self._lock:
+            self.results[name] = result
+        if result["ready"]:
+            print(f"✓ {name} is ready ({result['duration_ms']:.0f}ms)")
+
+    def wait(self, probes):
+        """Run the probes, a dict of name to callable, and return True once all pass."""
+        print("Waiting for services to be ready...")
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            # Not ready while the probes run, e.g. during a reload
+            self.ready = False
+            self.results = {}
+            self._rechecked_at = None
+        threads = [threading.Thread(target=self._run_probe, args=(name, probe, deadline), daemon=True)
+                   for name, probe in probes.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self._lock:
+            self.ready = bool(self.results) and all(result["ready"] for result in self.results.values())
+            self.checked_at = datetime.utcnow()
+            failed = {name: result for name, result in self.results.items() if not result["ready"]}
+        if failed:
+            print(f"⚠️  Readiness check timed out after {self.timeout:g}s:")
+            for name, result in sorted(failed.items()):
+                print(f"   ✗ {name}: {result['error']}")
+        return self.ready
+
+    def mark_not_ready(self):
+        with self._lock:
+            self.ready = False
+
+    def _recheck(self, check):
+        now = time.monotonic()
+        if self._rechecked_at is not None and now - self._rechecked_at < self.recheck_interval:
+            return
+        try:
+            check()
+            self.recheck_error = None
+        except Exception as e:
+            self.recheck_error = str(e)
+        self._rechecked_at = now
+
+    def status(self, check=None):
+        """The latest result; with check, a callable that raises on failure, only while it also passes."""
+        with self._lock:
+            error = None
+            if check is not None and self.ready:
+                self._recheck(check)
+                error = self.recheck_error
+            status = {
+                "ready": self.ready and not error,
+                "checked_at": self.checked_at.strftime("%Y-%m-%dT%H:%M:%SZ") if self.checked_at else None,
+                "probes": dict(self.results),
+            }
+            if error:
+                status["error"] = error
+            return status
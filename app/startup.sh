@@ -5,43 +5,22 @@ set -e
 
 echo "Starting Neon Local as root to configure networking..."
 
-# Function to resolve hostname to IPv4 and add to /etc/hosts
-add_ipv4_host() {
-    local hostname=$1
-    echo "Resolving $hostname to IPv4..."
-    
-    # Use getent to get IPv4 address specifically
-    local ipv4_addr=$(python3 -c "
-import socket
-try:
-    result = socket.getaddrinfo('$hostname', 5432, socket.AF_INET)
-    print(result[0][4][0])
-except Exception as e:
-    print('FAILED')
-    exit(1)
-")
-    
-    if [ "$ipv4_addr" != "FAILED" ] && [ -n "$ipv4_addr" ]; then
-        echo "Adding to /etc/hosts: $ipv4_addr $hostname"
-        # Remove any existing entries for this hostname
-        sed -i "/$hostname/d" /etc/hosts
-        # Add the IPv4 entry
-        echo "$ipv4_addr $hostname" >> /etc/hosts
-    else
-        echo "Failed to resolve $hostname to IPv4"
-    fi
-}
-
 # Get the Neon database info from environment or API
 echo "Getting database configuration..."
 cd /scripts
 
-# Create a temporary Python script to get database info and update hosts
+neon_local_dir_existed=false
+if [ -d /tmp/.neon_local ]; then
+    neon_local_dir_existed=true
+fi
+
+# Get database info and write the resolved hosts to /etc/hosts
 python3 -c "
 import sys
 sys.path.append('/scripts')
 from app.neon import NeonAPI
-import socket
+from app.connection_cache import ConnectionCache, cached_branch_connection_info
+from app.dns_resolver import DNSResolver
 
 try:
     import os
@@ -52,7 +31,9 @@ try:
     params = None
     if project_id and branch_id:
         try:
-            params = api.get_branch_connection_info(project_id, branch_id)
+            params, from_cache = cached_branch_connection_info(api, ConnectionCache(api.api_key), project_id, branch_id)
+            if from_cache:
+                print('Using cached connection info')
         except Exception as e:
             print(f'Error with specific branch: {e}')
     
@@ -62,34 +43,21 @@ try:
     
     if params:
         print('Found database parameters, updating /etc/hosts...')
-        hosts_entries = []
-        
-        for db in params:
-            hostname = db['host']
-            try:
-                # Get IPv4 addresses for the hostname
-                ipv4_info = socket.getaddrinfo(hostname, 5432, socket.AF_INET)
-                ipv4_addr = ipv4_info[0][4][0]  # Get first IPv4 address
-                hosts_entries.append(f'{ipv4_addr} {hostname}')
-                print(f'Resolved {hostname} to IPv4: {ipv4_addr}')
-            except Exception as e:
-                print(f'Failed to resolve {hostname}: {e}')
-        
-        # Write entries to /etc/hosts
-        if hosts_entries:
-            with open('/etc/hosts', 'a') as f:
-                f.write('\n# Neon IPv4 entries added by startup script\n')
-                for entry in hosts_entries:
-                    f.write(f'{entry}\n')
-            print('Successfully updated /etc/hosts with IPv4 entries')
-        else:
-            print('No IPv4 entries to add')
+        DNSResolver().update_hosts_file([db['host'] for db in params])
     else:
         print('No specific database parameters found - application will create/use branch and update /etc/hosts dynamically')
 except Exception as e:
     print(f'Error getting database parameters: {e}')
 "
 
+# Hand the connection cache to the application user, which revalidates and rewrites it
+if [ "$neon_local_dir_existed" = false ] && [ -d /tmp/.neon_local ]; then
+    chown postgres:postgres /tmp/.neon_local
+fi
+if [ -f /tmp/.neon_local/.connection_cache ]; then
+    chown postgres:postgres /tmp/.neon_local/.connection_cache
+fi
+
 echo "Displaying updated /etc/hosts:"
 cat /etc/hosts
 
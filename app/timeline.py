@@ -0,0 +1,64 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+TIMELINE_DIR = "/var/log/neon_local/timelines"
+# Older timeline files are pruned so long-running containers don't accumulate them
+MAX_TIMELINE_FILES = 50
+
+class Timeline:
+    """Timing spans for one boot or reload, written out as a JSON document."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started_at = datetime.utcnow()
+        self.spans = []
+        self._start = time.monotonic()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span = {
+                "name": name,
+                "start_ms": round((start - self._start) * 1000, 3),
+                "duration_ms": round((time.monotonic() - start) * 1000, 3),
+            }
+            if attributes:
+                span["attributes"] = attributes
+            if error:
+                span["error"] = error
+            self.spans.append(span)
+
+    def finish(self, result):
+        """Close the timeline, persist it, and return it as a dict."""
+        document = {
+            "kind": self.kind,
+            "started_at": self.started_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "result": result,
+            "duration_ms": round((time.monotonic() - self._start) * 1000, 3),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+        directory = os.getenv("TIMELINE_DIR", TIMELINE_DIR)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            filename = f"{self.kind}-{self.started_at.strftime('%Y%m%dT%H%M%S%f')}.json"
+            with open(os.path.join(directory, filename), "w") as file:
+                json.dump(document, file, indent=2)
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+            for old in sorted(paths, key=os.path.getmtime)[:-MAX_TIMELINE_FILES]:
+                os.remove(old)
+        except OSError as e:
+            print(f"Failed to write {self.kind} timeline: {str(e)}")
+
+        print(f"{self.kind.capitalize()} finished in {document['duration_ms']:.0f}ms: " +
+              ", ".join(f"{span['name']}={span['duration_ms']:.0f}ms" for span in document["spans"]))
+        return document
@@ -1,118 +1,245 @@
 import os
+import re
 import json
+import socket
 import subprocess
 import threading
-import time
-import socket
-import requests
 from app.process_manager import ProcessManager
-from app.neon import NeonAPI
+from app.certs import ensure_certificate
+from app.neon import NeonAPIError
+from app.connection_cache import ConnectionCache, cached_branch_connection_info
+from app import envoy_xds
+from app.branch_pool import BranchPool
+from app.keep_warm import KeepWarmScheduler
+from app.dns_resolver import DNSResolver
+from app.access_log import AccessLog
+from app.health_checks import TrafficAwareHealthChecks
+from app.pool_prewarm import PoolPrewarmer
+from app.pool_sizing import pool_sizes, container_cpus
+from app.pgbouncer_workers import PgBouncerWorkers
+from app.metrics import StatusServer, render_metrics, status_server_port
+from app.readiness import ReadinessChecker, postgres_probe, http_sql_probe
 
 class UnifiedManager(ProcessManager):
     def __init__(self):
         super().__init__()
         self.envoy_process = None
-        self.pgbouncer_process = None
-        self.neon_api = NeonAPI()
+        self.pgbouncer = PgBouncerWorkers()
+        # Reuse the base manager's client so every call shares one pooled session
+        self.neon_api = self.neon
+        self.connection_cache = ConnectionCache(self.neon_api.api_key)
+        self.dns_resolver = DNSResolver()
+        self.keep_warm = KeepWarmScheduler(lambda: getattr(self, "database_params", None), self.shutdown_event)
+        self.status_server = StatusServer(status_server_port())
+        self.status_server.add_route("/metrics", self._metrics_response)
+        self.status_server.add_route("/timeline", self._timeline_response)
+        self.readiness = ReadinessChecker()
+        self.status_server.add_route("/ready", self._ready_response)
+        self.branch_pool = None
+        pool_size = int(os.getenv("BRANCH_POOL_SIZE", "0"))
+        if pool_size > 0 and not self.branch_id:
+            self.branch_pool = BranchPool(self.neon_api, self.parent_branch_id or None, pool_size,
+                                          max_age=int(os.getenv("BRANCH_POOL_MAX_AGE", "0")),
+                                          vscode=self.vscode)
         self.cert_path = "/etc/pgbouncer/server.crt"
         self.key_path = "/etc/pgbouncer/server.key"
+        self.pgbouncer_template_path = "/scripts/app/pgbouncer.ini.tmpl"
+        self.pgbouncer_config_path = "/etc/pgbouncer/pgbouncer.ini"
+        self.envoy_template_path = "/scripts/app/envoy/envoy.yaml.tmpl"
+        self.envoy_config_path = "/tmp/envoy.yaml"
+        # "live" applies branch switches in place, "restart" stops and starts both services
+        self.reload_mode = os.getenv("RELOAD_MODE", "live").lower()
+        self.xds_dir = envoy_xds.XDS_DIR
+        # Per-request Lua tracing of HTTP and WebSocket traffic, with credentials redacted
+        self.envoy_debug = os.getenv("ENVOY_DEBUG", "false").lower() == "true"
+        self.access_log = AccessLog()
+        self.health_checks = TrafficAwareHealthChecks(lambda: getattr(self, "database_params", None),
+                                                      self._update_health_checks, self.shutdown_event)
+        self._clusters_lock = threading.Lock()
+        self.pool_prewarmer = PoolPrewarmer(self.shutdown_event, lambda: self.pgbouncer.ports)
+        self.envoy_bootstrap_changed = False
 
     def _generate_certificates(self):
-        """Generate self-signed certificates if they don't exist."""
-        if os.path.exists(self.cert_path) and os.path.exists(self.key_path):
-            return
-
-        print("Generating self-signed certificate...")
-        # Ensure directory exists
-        os.makedirs("/etc/pgbouncer", exist_ok=True)
-        
-        # Generate private key
-        subprocess.run([
-            "openssl", "genrsa", "-out", self.key_path, "2048"
-        ], check=True, capture_output=True)
-        
-        # Generate CSR
-        subprocess.run([
-            "openssl", "req", "-new", "-key", self.key_path,
-            "-out", "/tmp/server.csr",
-            "-subj", "/CN=localhost/O=DO NOT TRUST/OU=Neon Local self-signed cert"
-        ], check=True, capture_output=True)
-        
-        # Generate self-signed certificate
-        subprocess.run([
-            "openssl", "x509", "-req", "-days", "365",
-            "-in", "/tmp/server.csr",
-            "-signkey", self.key_path,
-            "-out", self.cert_path
-        ], check=True)
-        
-        # Set proper permissions
-        os.chmod(self.key_path, 0o600)
-        os.chmod(self.cert_path, 0o644)
-        
-        # Clean up CSR
-        os.remove("/tmp/server.csr")
+        """Generate self-signed certificates if they don't exist or are about to expire."""
+        ensure_certificate(self.cert_path, self.key_path)
 
     def prepare_config(self):
-        self._generate_certificates()
+        with self.span("certificates"):
+            self._generate_certificates()
         params = None
         
         if self.branch_id:
             try:
-                params = self.neon_api.get_branch_connection_info(self.project_id, self.branch_id)
+                with self.span("neon_api"):
+                    params = self._get_connection_info(self.branch_id)
             except Exception as e:
                 print(f"Debug: Error getting connection info: {str(e)}")
                 raise
-        elif self.parent_branch_id:
-            state = self._get_neon_branch()
-            current_branch = self._get_git_branch()
-            parent = os.getenv("PARENT_BRANCH_ID")
-            if parent == "":
-                parent = None
-            params, updated_state = self.neon_api.fetch_or_create_branch(state, current_branch, parent, self.vscode)
-            self._write_neon_branch(updated_state)
-
         else:
             state = self._get_neon_branch()
             current_branch = self._get_git_branch()
-            params, updated_state = self.neon_api.fetch_or_create_branch(state, current_branch, vscode=self.vscode)
-            self._write_neon_branch(updated_state)
+            with self.span("connection_cache"):
+                params = self._get_cached_git_branch_info(state, current_branch)
+            if params is None:
+                # Don't create a branch for a checkout that has already moved on
+                self.check_reload_superseded()
+                with self.span("neon_api", git_branch=current_branch):
+                    if self.parent_branch_id:
+                        parent = os.getenv("PARENT_BRANCH_ID")
+                        if parent == "":
+                            parent = None
+                        params, updated_state = self.neon_api.fetch_or_create_branch(
+                            state, current_branch, parent, self.vscode, branch_pool=self.branch_pool)
+                    else:
+                        params, updated_state = self.neon_api.fetch_or_create_branch(
+                            state, current_branch, vscode=self.vscode, branch_pool=self.branch_pool)
+                self._write_neon_branch(updated_state)
+                if params:
+                    self.connection_cache.put(self.project_id, params[0]["branch_id"], params)
         
         if params is None:
             raise ValueError("Failed to get connection parameters")
-        
-        # Store params for use in start_process
-        self.database_params = params
-        
-        self._write_pgbouncer_config(params)
-        self._write_envoy_config(params)
+        if self.branch_pool:
+            self.branch_pool.refill_async()
+        self.check_reload_superseded()
+        
+        with self.span("render_pgbouncer_config"):
+            self._write_pgbouncer_config(params)
+        # The health check thread must not publish clusters for the previous params in between
+        with self._clusters_lock:
+            # Store params for use in start_process
+            self.database_params = params
+            with self.span("render_envoy_config"):
+                self.envoy_bootstrap_changed = self._write_envoy_config(params)
+
+    def _get_connection_info(self, branch_id):
+        """Connection info for an explicit branch, served from the cache when warm."""
+        try:
+            params, from_cache = cached_branch_connection_info(
+                self.neon_api, self.connection_cache, self.project_id, branch_id)
+        except NeonAPIError as e:
+            if e.is_auth_failure:
+                self.connection_cache.invalidate(self.project_id, branch_id)
+            raise
+        if from_cache:
+            print(f"Using cached connection info for branch {branch_id}")
+            self._revalidate_in_background(branch_id, params)
+        return params
+
+    def _get_cached_git_branch_info(self, state, current_branch):
+        """Cached connection info for the Neon branch already mapped to the git branch."""
+        branch_state = state.get(current_branch if current_branch else "None")
+        if not isinstance(branch_state, dict) or not branch_state.get("branch_id"):
+            return None
+        branch_id = branch_state["branch_id"]
+        params = self.connection_cache.get(self.project_id, branch_id)
+        if params is None:
+            return None
+        print(f"Using cached connection info for branch {branch_id}")
+        self._revalidate_in_background(branch_id, params)
+        return params
+
+    def _revalidate_in_background(self, branch_id, cached_params):
+        threading.Thread(
+            target=self._revalidate_connection_info,
+            args=(branch_id, cached_params),
+            daemon=True,
+        ).start()
+
+    def _revalidate_connection_info(self, branch_id, cached_params):
+        """Refresh a cache entry that was served, reloading if the branch changed."""
+        try:
+            params = self.neon_api.get_branch_connection_info(self.project_id, branch_id)
+        except NeonAPIError as e:
+            if e.is_auth_failure or e.status_code == 404:
+                print(f"Cached connection info for branch {branch_id} is no longer valid: {str(e)}")
+                self.connection_cache.invalidate(self.project_id, branch_id)
+                self.request_reload()
+            else:
+                print(f"Failed to revalidate cached connection info: {str(e)}")
+            return
+        except Exception as e:
+            print(f"Failed to revalidate cached connection info: {str(e)}")
+            return
+
+        if any("branch_id" in info for info in cached_params):
+            for info in params:
+                info["branch_id"] = branch_id
+        self.connection_cache.put(self.project_id, branch_id, params)
+        if params != cached_params:
+            print(f"Connection info for branch {branch_id} changed, reloading...")
+            self.request_reload()
 
     def start_process(self):
+        self.status_server.start()
         self.prepare_config()
+        self._update_hosts_file()
+        with self.span("spawn_pgbouncer"):
+            self._start_pgbouncer()
+        with self.span("spawn_envoy"):
+            self.envoy_process = self._start_envoy()
         
+        # Wait for services to be healthy before declaring ready
+        with self.span("wait_for_services_healthy"):
+            if self._wait_for_services_healthy():
+                print("Neon Local is ready - Envoy and PgBouncer are both running")
+            else:
+                print("Neon Local started, but is not ready for traffic yet - see /ready for details")
+        self.keep_warm.start()
+        self.dns_resolver.start_refresh(self._database_hosts, self.shutdown_event)
+        self.access_log.start_rotation(self.shutdown_event)
+        self.health_checks.start()
+        self.pool_prewarmer.start()
+
+    def _branch_label(self):
+        """Branch identifier attached to every exported metric."""
+        if self.branch_id:
+            return self.branch_id
+        return self._get_git_branch() or "None"
+
+    def _metrics_response(self):
+        return 200, "text/plain; version=0.0.4", render_metrics(self._branch_label(), self.pgbouncer.ports)
+
+    def _timeline_response(self):
+        if self.latest_timeline is None:
+            return 404, "application/json", json.dumps({"error": "No boot or reload has finished yet"})
+        return 200, "application/json", json.dumps(self.latest_timeline, indent=2)
+
+    def _ready_response(self):
+        status = self.readiness.status(self._check_proxies_accepting)
+        return (200 if status["ready"] else 503), "application/json", json.dumps(status, indent=2)
+
+    def _check_proxies_accepting(self):
+        """Raise unless Envoy and every PgBouncer worker are running and accepting connections.
+
+        Local only, unlike the readiness probes, so frequent /ready polling
+        never wakes a suspended compute.
+        """
+        if not self._services_running():
+            raise ConnectionError("Envoy or PgBouncer is not running")
+        for port in [5432] + self.pgbouncer.ports:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                pass
+
+    def _database_hosts(self):
+        return [db["host"] for db in getattr(self, "database_params", None) or []]
+
+    def _update_hosts_file(self):
         # Update /etc/hosts with the actual database hostnames now that we have them
-        if hasattr(self, 'database_params') and self.database_params:
-            import socket, subprocess
-            try:
-                for db in self.database_params:
-                    hostname = db['host']
-                    # Get IPv4 addresses for the hostname
-                    ipv4_info = socket.getaddrinfo(hostname, 5432, socket.AF_INET)
-                    ipv4_addr = ipv4_info[0][4][0]  # Get first IPv4 address
-                    
-                    # Use subprocess to run as root and update /etc/hosts
-                    hosts_entry = f"{ipv4_addr} {hostname}"
-                    print(f"Adding to /etc/hosts: {hosts_entry}")
-                    
-                    # Remove existing entry and add new one
-                    subprocess.run(["sudo", "sed", "-i", f"/{hostname}/d", "/etc/hosts"], check=False)
-                    subprocess.run(["sudo", "sh", "-c", f"echo '{hosts_entry}' >> /etc/hosts"], check=True)
-                    
-                print("Successfully updated /etc/hosts with runtime database hostnames")
-            except Exception as e:
-                print(f"Failed to update /etc/hosts at runtime: {e}")
-                
-        # Start PgBouncer first (on internal port 6432)
+        hosts = self._database_hosts()
+        if not hosts:
+            return
+        try:
+            with self.span("dns_resolution", hosts=len(set(hosts))):
+                addresses = self.dns_resolver.resolve_all(hosts)
+            with self.span("hosts_file_rewrite"):
+                self.dns_resolver.update_hosts_file(hosts)
+            print(f"/etc/hosts has {len(addresses)} runtime database hostname(s)")
+        except Exception as e:
+            print(f"Failed to update /etc/hosts at runtime: {e}")
+
+    def _start_pgbouncer(self):
+        # Start PgBouncer first (on internal port 6432, and the following ports with several workers)
         print("Starting PgBouncer...")
         
         # Set environment variables for Neon endpoint support
@@ -127,24 +254,58 @@ class UnifiedManager(ProcessManager):
             print(f"Setting PGOPTIONS environment variable: -c endpoint={endpoint_id}")
             print(f"Forcing IPv4-only DNS resolution for PgBouncer")
         
-        with open("/var/log/pgbouncer.log", "a") as log:
-            self.pgbouncer_process = subprocess.Popen([
-                "/usr/local/bin/pgbouncer_wrapper.sh", "/etc/pgbouncer/pgbouncer.ini"
-            ], stdout=log, stderr=log, env=pgbouncer_env)
-        
+        if self.pgbouncer.unix_socket:
+            print(f"Envoy connects to PgBouncer over Unix sockets in {self.pgbouncer.socket_dir} "
+                  f"and terminates client TLS itself")
+        self.pgbouncer.start(self.pgbouncer_config_path, pgbouncer_env)
+        self.pgbouncer.supervise(self.pgbouncer_config_path, self.shutdown_event)
+
+    def _start_envoy(self):
         # Start Envoy (on port 5432, routing to PgBouncer and Neon)
         print("Starting Envoy...")
         with open("/var/log/envoy.log", "a") as log:
-            self.envoy_process = subprocess.Popen([
-                "/usr/local/bin/envoy", "-c", "/tmp/envoy.yaml", "--log-level", "info"
+            return subprocess.Popen([
+                "/usr/local/bin/envoy", "-c", self.envoy_config_path, "--log-level", "info"
             ], stdout=log, stderr=log)
-        
-        # Wait for services to be healthy before declaring ready
-        self._wait_for_services_healthy()
-        
-        print("Neon Local is ready - Envoy and PgBouncer are both running")
+
+    def reload(self):
+        """Apply a branch switch without closing the listener on port 5432.
+
+        PgBouncer re-reads its config on SIGHUP and closes server connections
+        to changed databases as they are released. Envoy picks up new routes
+        and clusters from the xDS files, so it keeps running and its existing
+        connections are untouched. The bootstrap only depends on settings
+        that are fixed for the container's lifetime; should it change anyway,
+        both services are restarted.
+        """
+        if self.reload_mode != "live" or not self._services_running():
+            super().reload()
+            return
+
+        self.prepare_config()
+        if self.envoy_bootstrap_changed:
+            print("Envoy bootstrap changed, restarting the proxies")
+            super().reload()
+            return
+        self._update_hosts_file()
+
+        print("Reloading PgBouncer configuration...")
+        with self.span("reload_pgbouncer"):
+            self.pgbouncer.reload()
+        print("Envoy routes and clusters updated via xDS")
+
+        with self.span("wait_for_services_healthy"):
+            if not self._wait_for_services_healthy():
+                print("Neon Local reloaded, but is not ready for traffic yet - see /ready for details")
+                return
+        print("Neon Local reloaded - existing connections were kept")
+
+    def _services_running(self):
+        return (self.envoy_process is not None and self.envoy_process.poll() is None
+                and self.pgbouncer.running())
 
     def stop_process(self):
+        self.readiness.mark_not_ready()
         # Stop Envoy first
         if self.envoy_process:
             print("Stopping Envoy...")
@@ -157,18 +318,12 @@ class UnifiedManager(ProcessManager):
             self.envoy_process = None
         
         # Then stop PgBouncer
-        if self.pgbouncer_process:
+        if self.pgbouncer.processes:
             print("Stopping PgBouncer...")
-            self.pgbouncer_process.terminate()
-            try:
-                self.pgbouncer_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.pgbouncer_process.kill()
-                self.pgbouncer_process.wait()
-            self.pgbouncer_process = None
+            self.pgbouncer.stop()
 
     def _write_pgbouncer_config(self, databases):
-        with open("/scripts/app/pgbouncer.ini.tmpl", "r") as file:
+        with open(self.pgbouncer_template_path, "r") as file:
             template = file.read()
         
         # Split the template into sections
@@ -180,6 +335,14 @@ class UnifiedManager(ProcessManager):
         client = os.getenv("CLIENT", "").lower()
         app_name = "neon_local_vscode_container" if client == "vscode" else "neon_local_container"
         
+        # Pools are sized for each database's compute and this container's CPUs
+        sizes, max_client_conn = pool_sizes(databases, workers=self.pgbouncer.count)
+        cpus = container_cpus()
+
+        def pool_options(db):
+            pool_size, reserve_pool_size = sizes[db['database']]
+            return f"pool_size={pool_size} reserve_pool={reserve_pool_size} max_db_connections={pool_size + reserve_pool_size}"
+
         # Generate database entries for each database
         import socket
         database_entries = []
@@ -190,8 +353,12 @@ class UnifiedManager(ProcessManager):
             # Keep hostname for SNI support
             host = db['host']
             
-            entry = f"{db['database']}=user={db['user']} password={db['password']} host={host} port=5432 dbname={db['database']} application_name={app_name}"
+            entry = f"{db['database']}=user={db['user']} password={db['password']} host={host} port=5432 dbname={db['database']} application_name={app_name} {pool_options(db)}"
             database_entries.append(entry)
+            pool_size, reserve_pool_size = sizes[db['database']]
+            workers = f" in each of {self.pgbouncer.count} workers" if self.pgbouncer.count > 1 else ""
+            print(f"PgBouncer pool for {db['database']}: pool_size={pool_size} reserve_pool={reserve_pool_size}{workers} "
+                  f"(compute max {db.get('compute_max_cu') or 'unknown'} CU, {cpus:g} CPUs)")
         
         # Add wildcard entry pointing to the first database
         if databases:
@@ -201,253 +368,110 @@ class UnifiedManager(ProcessManager):
             # Keep hostname for SNI support
             host = first_db['host']
             
-            wildcard_entry = f"*=user={first_db['user']} password={first_db['password']} host={host} port=5432 dbname={first_db['database']} application_name={app_name}"
+            wildcard_entry = f"*=user={first_db['user']} password={first_db['password']} host={host} port=5432 dbname={first_db['database']} application_name={app_name} {pool_options(first_db)}"
             database_entries.append(wildcard_entry)
         
-        # Modify pgbouncer section to listen on port 6432 (internal port)
+        # Each worker gets its own internal port, starting at 6432
         pgbouncer_section = pgbouncer_section.replace("listen_port = 5432", "listen_port = 6432")
+        pgbouncer_section = re.sub(r"^max_client_conn = \d+$", f"max_client_conn = {max_client_conn}",
+                                   pgbouncer_section, flags=re.MULTILINE)
         
         # Combine all sections
         config = f"[databases]\n" + "\n".join(database_entries) + "\n\n[pgbouncer]\n" + pgbouncer_section
         
-        with open("/etc/pgbouncer/pgbouncer.ini", "w") as file:
-            file.write(config)
+        self.pgbouncer.write_configs(self.pgbouncer_config_path, config)
 
     def _write_envoy_config(self, databases):
-        template_path = "/scripts/app/envoy/envoy.yaml.tmpl"
+        """Render the Envoy bootstrap and publish routes and clusters over file-based xDS.
+
+        Returns True when the bootstrap itself changed and Envoy must be
+        restarted; route and cluster changes are picked up by the running
+        Envoy as soon as the files are moved into place.
+        """
+        template_path = self.envoy_template_path
         if not os.path.exists(template_path):
             raise FileNotFoundError(f"Envoy config template not found at: {template_path}")
 
         with open(template_path, "r") as file:
             envoy_template = file.read()
 
-        print(f"Databases: {databases}")
+        print(f"Databases: {[db['database'] for db in databases]}")
         
-        # Determine application name based on CLIENT environment variable
-        client = os.getenv("CLIENT", "").lower()
-        app_name = "neon_local_vscode_container" if client == "vscode" else "neon_local_container"
-        user_agent_suffix = "_neon_local_vscode_container" if client == "vscode" else "_neon_local_container"
-        
-        # Define injection markers
-        routes_marker = "              # Database-specific routes will be injected here"
-        clusters_marker = "  # Database-specific clusters will be injected here"
-        
-        # Build database-specific routes
-        database_routes = ""
-        database_clusters = ""
-        
-        for db in databases:
-            cluster_name = f"neon_cluster_{db['database']}"
-            
-            # Create routes for this database
-            database_routes += f"""
-              # HTTP routes for {db['database']}
-              - match:
-                  prefix: "/{db['database']}"
-                route:
-                  cluster: {cluster_name}
-                  timeout: 30s
-                request_headers_to_add:
-                - header:
-                    key: "neon-connection-string"
-                    value: "postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
-                - header:
-                    key: "user-agent"
-                    value: "node{user_agent_suffix}"
-              - match:
-                  prefix: "/"
-                  headers:
-                  - name: "neon-connection-string"
-                    string_match:
-                      contains: "{db['database']}"
-                route:
-                  cluster: {cluster_name}
-                  timeout: 30s
-                request_headers_to_add:
-                - header:
-                    key: "neon-connection-string"
-                    value: "postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
-                - header:
-                    key: "user-agent"
-                    value: "node{user_agent_suffix}"
-              
-              # WebSocket routes for {db['database']}
-              - match:
-                  prefix: "/{db['database']}"
-                  headers:
-                  - name: "upgrade"
-                    string_match:
-                      exact: "websocket"
-                route:
-                  cluster: {cluster_name}
-                  timeout: 0s  # No timeout for WebSocket connections
-                  upgrade_configs:
-                  - upgrade_type: "websocket"
-                request_headers_to_add:
-                - header:
-                    key: "neon-connection-string"
-                    value: "postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
-              - match:
-                  prefix: "/"
-                  headers:
-                  - name: "upgrade"
-                    string_match:
-                      exact: "websocket"
-                  - name: "neon-connection-string"
-                    string_match:
-                      contains: "{db['database']}"
-                route:
-                  cluster: {cluster_name}
-                  timeout: 0s  # No timeout for WebSocket connections
-                  upgrade_configs:
-                  - upgrade_type: "websocket"
-                request_headers_to_add:
-                - header:
-                    key: "neon-connection-string"
-                    value: "postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
-"""
-            
-            # Create cluster for this database
-            database_clusters += f"""
-  - name: {cluster_name}
-    connect_timeout: 5s
-    type: STRICT_DNS
-    lb_policy: ROUND_ROBIN
-    dns_lookup_family: V4_ONLY
-    transport_socket:
-      name: envoy.transport_sockets.tls
-      typed_config:
-        "@type": type.googleapis.com/envoy.extensions.transport_sockets.tls.v3.UpstreamTlsContext
-        common_tls_context:
-          validation_context: {{}}
-    load_assignment:
-      cluster_name: {cluster_name}
-      endpoints:
-      - lb_endpoints:
-        - endpoint:
-            address:
-              socket_address:
-                address: {db['host']}
-                port_value: 443
-    health_checks:
-    - timeout: 5s
-      interval: 3s
-      interval_jitter: 1s
-      unhealthy_threshold: 2
-      healthy_threshold: 2
-      http_health_check:
-        path: "/sql"
-        request_headers_to_add:
-        - header:
-            key: "neon-connection-string"
-            value: "postgresql://{db['user']}:{db['password']}@{db['host']}/{db['database']}?sslmode=require&application_name={app_name}"
-
-        - header:
-            key: "user-agent"
-            value: "envoy-health-check{user_agent_suffix}"
-        - header:
-            key: "content-type"
-            value: "application/json"
-
-"""
-        
-        # Update default cluster reference if we have databases
-        if databases:
-            first_db = databases[0]
-            default_cluster_replacement = f"neon_cluster_{first_db['database']}"
-            envoy_template = envoy_template.replace("neon_cluster_default", default_cluster_replacement)
-            
-            # Replace placeholder connection string with actual connection string for default routes
-            default_connection_string = f"postgresql://{first_db['user']}:{first_db['password']}@{first_db['host']}/{first_db['database']}?sslmode=require&application_name={app_name}"
-            envoy_template = envoy_template.replace("PLACEHOLDER_NEON_CONNECTION_STRING", default_connection_string)
-            
-            # Replace placeholder user agent
-            default_user_agent = f"node{user_agent_suffix}"
-            envoy_template = envoy_template.replace("PLACEHOLDER_USER_AGENT", default_user_agent)
-            
-            # Replace placeholder neon host for Lua filter
-            default_neon_host = first_db['host']
-            envoy_template = envoy_template.replace("PLACEHOLDER_NEON_HOST", default_neon_host)
-            
-            # Replace placeholder connection string for Lua filter body modification
-            lua_connection_string = f"postgresql://{first_db['user']}:{first_db['password']}@{first_db['host']}/{first_db['database']}?sslmode=require&application_name={app_name}"
-            envoy_template = envoy_template.replace("PLACEHOLDER_NEON_CONNECTION_STRING", lua_connection_string)
-            
+        app_name, user_agent_suffix = self._client_names()
 
-        
-        # Inject configurations into template
-        envoy_config = envoy_template.replace(routes_marker, database_routes)
-        envoy_config = envoy_config.replace(clusters_marker, database_clusters)
+        # Clusters go first so that new routes never point at a cluster Envoy has not seen
+        self._write_clusters(databases, self.health_checks.active_hosts)
+        route_configuration = envoy_xds.build_route_configuration(databases, app_name, f"node{user_agent_suffix}")
+        envoy_xds.write_resources(self.xds_dir, envoy_xds.RDS_FILE, [route_configuration])
 
-        with open("/tmp/envoy.yaml", "w") as file:
+        envoy_config = envoy_template.replace("XDS_DIR", self.xds_dir)
+        envoy_config = envoy_config.replace("ENVOY_DEBUG_TRACE", "true" if self.envoy_debug else "false")
+        # JSON is valid YAML, so the list can be inlined as is
+        envoy_config = envoy_config.replace("ACCESS_LOG_CONFIG", json.dumps(self.access_log.envoy_config()))
+        # PgBouncer cannot terminate client TLS on its Unix socket, so Envoy does
+        tls_certificate = (self.cert_path, self.key_path) if self.pgbouncer.unix_socket else None
+        envoy_config = envoy_config.replace("POSTGRES_FILTER_CHAIN", json.dumps(
+            envoy_xds.postgres_filter_chain(self.access_log.envoy_config(), tls_certificate)))
+        socket_paths = self.pgbouncer.socket_paths if self.pgbouncer.unix_socket else None
+        envoy_config = envoy_config.replace("PGBOUNCER_ENDPOINTS", json.dumps(
+            envoy_xds.pgbouncer_endpoints(self.pgbouncer.ports, socket_paths)))
+        try:
+            with open(self.envoy_config_path, "r") as file:
+                if file.read() == envoy_config:
+                    return False
+        except OSError:
+            pass
+        with open(self.envoy_config_path, "w") as file:
             file.write(envoy_config)
+        return True
 
-    def _is_port_open(self, host, port, timeout=1):
-        """Check if a port is open and accepting connections."""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result = sock.connect_ex((host, port))
-            sock.close()
-            return result == 0
-        except Exception:
-            return False
+    def _client_names(self):
+        """Application name and user agent suffix, based on the CLIENT environment variable."""
+        if os.getenv("CLIENT", "").lower() == "vscode":
+            return "neon_local_vscode_container", "_neon_local_vscode_container"
+        return "neon_local_container", "_neon_local_container"
 
-    def _check_pgbouncer_health(self):
-        """Check if PgBouncer is healthy and accepting connections."""
-        # PgBouncer runs on internal port 6432
-        return self._is_port_open('127.0.0.1', 6432)
+    def _write_clusters(self, databases, health_checked_hosts):
+        """Publish the clusters; callers hold _clusters_lock."""
+        app_name, user_agent_suffix = self._client_names()
+        clusters = envoy_xds.build_clusters(databases, app_name, f"envoy-health-check{user_agent_suffix}",
+                                            health_checked_hosts)
+        return envoy_xds.write_resources(self.xds_dir, envoy_xds.CDS_FILE, clusters)
 
-    def _check_envoy_health(self):
-        """Check if Envoy is healthy and accepting connections."""
-        # Envoy runs on port 5432
-        if not self._is_port_open('127.0.0.1', 5432):
-            return False
-        
-        # Additional check: try a simple HTTP request to ensure HTTP backend is working
-        try:
-            response = requests.get('http://127.0.0.1:5432', timeout=2)
-            # We expect this to fail with a specific error, but it should connect
-            return True
-        except requests.exceptions.ConnectionError:
-            # If connection is refused, Envoy is not ready
-            return False
-        except Exception:
-            # Other exceptions (like HTTP errors) are fine - it means Envoy is responding
-            return True
+    def _update_health_checks(self, health_checked_hosts):
+        # Called from the health check thread, database_params must not change until the clusters are written
+        with self._clusters_lock:
+            databases = getattr(self, "database_params", None)
+            if databases:
+                self._write_clusters(databases, health_checked_hosts)
 
-    def _wait_for_services_healthy(self, max_wait_time=30, check_interval=0.5):
-        """Wait for both PgBouncer and Envoy to be healthy before proceeding."""
-        print("Waiting for services to be healthy...")
-        
-        start_time = time.time()
-        pgbouncer_ready = False
-        envoy_ready = False
-        
-        while time.time() - start_time < max_wait_time:
-            if not pgbouncer_ready:
-                pgbouncer_ready = self._check_pgbouncer_health()
-                if pgbouncer_ready:
-                    print("✓ PgBouncer is healthy")
-            
-            if not envoy_ready:
-                envoy_ready = self._check_envoy_health()
-                if envoy_ready:
-                    print("✓ Envoy is healthy")
-            
-            if pgbouncer_ready and envoy_ready:
-                print("✓ All services are healthy and ready for traffic")
-                return True
-            
-            time.sleep(check_interval)
-        
-        # If we get here, services didn't become healthy in time
-        pgbouncer_status = "✓" if pgbouncer_ready else "✗"
-        envoy_status = "✓" if envoy_ready else "✗"
-        
-        print(f"⚠️  Health check timeout after {max_wait_time}s:")
-        print(f"   PgBouncer (port 6432): {pgbouncer_status}")
-        print(f"   Envoy (port 5432): {envoy_status}")
-        print("Services may not be fully ready for traffic")
-        
-        return False
\ No newline at end of file
+    def _readiness_probes(self):
+        """Probes for the paths clients use, one per database and one HTTP probe per compute."""
+        probes = {}
+        hosts = set()
+        for db in getattr(self, "database_params", None) or []:
+            probes[f"postgres:{db['database']}"] = (
+                lambda db=db: postgres_probe("127.0.0.1", 5432, db["database"]))
+            if db["host"] not in hosts:
+                hosts.add(db["host"])
+                connection = envoy_xds.connection_string(db, "neon_local_readiness")
+                probes[f"http_sql:{db['host'].split('.')[0]}"] = (
+                    lambda connection=connection: http_sql_probe("http://127.0.0.1:5432/sql", connection))
+        # Envoy may send a client to any worker, so each one must be able to serve it
+        databases = getattr(self, "database_params", None)
+        if databases and self.pgbouncer.count > 1:
+            # PgBouncer refuses TLS from clients on its Unix socket
+            host = self.pgbouncer.socket_dir if self.pgbouncer.unix_socket else "127.0.0.1"
+            tls = not self.pgbouncer.unix_socket
+            for port in self.pgbouncer.ports:
+                probes[f"pgbouncer:{port}"] = (
+                    lambda port=port: postgres_probe(host, port, databases[0]["database"], tls=tls))
+        return probes
+
+    def _wait_for_services_healthy(self):
+        """Wait until clients can run queries through Envoy and PgBouncer, returning True if they can."""
+        probes = self._readiness_probes()
+        if not probes:
+            print("No databases configured, skipping readiness probes")
+            return False
+        return self.readiness.wait(probes)
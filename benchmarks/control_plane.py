@@ -0,0 +1,216 @@
+"""Control-plane benchmarks against the local Neon API stand-in.
+
+Times the Neon API client, config rendering and a full prepare_config for
+projects of different sizes, without touching console.neon.tech:
+
+    python -m benchmarks.control_plane --sizes 1,10,100,1000 --latency-ms 20
+
+Results are saved to benchmarks/results/<git revision>.json. Pass
+--baseline <revision or file> to compare against an earlier run; the command
+exits with status 1 if any benchmark regressed by more than --threshold.
+"""
+import io
+import os
+import sys
+import json
+import shutil
+import uuid
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from benchmarks.mock_neon_api import MockNeonAPI, MockNeonProject
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+# Differences smaller than this are treated as noise when looking for regressions
+MIN_REGRESSION_MS = 1.0
+
+def git_revision(ref="HEAD"):
+    revision = subprocess.run(["git", "rev-parse", "--short", ref], cwd=REPO_ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    if not revision:
+        return None
+    if ref == "HEAD":
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        if dirty:
+            revision += "-dirty"
+    return revision
+
+def measure(function, repeats, setup=None, teardown=None):
+    samples = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            function()
+        samples.append(time.perf_counter() - start)
+        if teardown:
+            teardown()
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "min_ms": round(samples[0] * 1000, 3),
+    }
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def run_size(size, args, workdir):
+    project = MockNeonProject(databases=size, branches=size, latency_ms=args.latency_ms,
+                              jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate)
+    server = MockNeonAPI(project).start()
+    os.environ["NEON_PROJECT_ID"] = project.project_id
+    os.environ["BRANCH_ID"] = project.default_branch_id
+
+    from app import neon
+    from app.connection_cache import ConnectionCache
+    from app.unified_manager import UnifiedManager
+    # API_URL is read at import time, each project size gets its own server
+    neon.API_URL = server.url
+
+    with redirect_stdout(io.StringIO()):
+        manager = UnifiedManager()
+    manager.cert_path = os.path.join(workdir, "server.crt")
+    manager.key_path = os.path.join(workdir, "server.key")
+    manager.pgbouncer_template_path = os.path.join(REPO_ROOT, "app", "pgbouncer", "pgbouncer.ini.tmpl")
+    manager.pgbouncer_config_path = os.path.join(workdir, "pgbouncer.ini")
+    manager.envoy_template_path = os.path.join(REPO_ROOT, "app", "envoy", "envoy.yaml.tmpl")
+    manager.envoy_config_path = os.path.join(workdir, "envoy.yaml")
+    manager.xds_dir = os.path.join(workdir, "xds")
+    cache_path = os.path.join(workdir, "connection_cache")
+    manager.connection_cache = ConnectionCache(manager.neon_api.api_key, path=cache_path)
+    # Background revalidation would overlap with the following runs
+    manager._revalidate_in_background = lambda branch_id, params: None
+
+    api = manager.neon_api
+    branch_id = project.default_branch_id
+    params = api.get_branch_connection_info(project.project_id, branch_id)
+    created = []
+
+    def fetch_new_branch():
+        _, state = api.fetch_or_create_branch({}, f"bench_{uuid.uuid4().hex[:8]}")
+        created.extend(value["branch_id"] for value in state.values())
+
+    def delete_created_branches():
+        while created:
+            project.branches.pop(created.pop(), None)
+
+    results = {}
+    try:
+        results["neon_api.get_branch_connection_info"] = measure(
+            lambda: api.get_branch_connection_info(project.project_id, branch_id), args.repeats)
+        results["neon_api.fetch_or_create_branch.existing"] = measure(
+            lambda: api.fetch_or_create_branch({"main": {"branch_id": branch_id}}, "main"), args.repeats)
+        results["neon_api.fetch_or_create_branch.new"] = measure(
+            fetch_new_branch, args.repeats, teardown=delete_created_branches)
+        results["render.pgbouncer_config"] = measure(
+            lambda: manager._write_pgbouncer_config(params), args.repeats,
+            setup=lambda: _remove(manager.pgbouncer_config_path))
+        results["render.envoy_config"] = measure(
+            lambda: manager._write_envoy_config(params), args.repeats,
+            setup=lambda: _remove(manager.envoy_config_path, manager.xds_dir))
+        results["render.envoy_config.unchanged"] = measure(
+            lambda: manager._write_envoy_config(params), args.repeats)
+        results["prepare_config.cold"] = measure(
+            manager.prepare_config, args.repeats,
+            setup=lambda: _remove(cache_path, manager.envoy_config_path, manager.xds_dir))
+        results["prepare_config.warm"] = measure(manager.prepare_config, args.repeats)
+    finally:
+        server.stop()
+        api.session.close()
+    results["mock_api.requests"] = project.request_count
+    return results
+
+def load_results(baseline, prefix=""):
+    path = baseline if os.path.isfile(baseline) else os.path.join(
+        RESULTS_DIR, f"{prefix}{git_revision(baseline) or baseline}.json")
+    with open(path, "r") as file:
+        return json.load(file)
+
+def compare(current, baseline, threshold, metric="median_ms"):
+    """Print current against baseline results for metric and return the names that regressed."""
+    if current["config"] != baseline["config"]:
+        print(f"Warning: baseline {baseline['revision']} was run with a different configuration")
+    regressions = []
+    print(f"\n{metric:<58} {baseline['revision']:>14} {current['revision']:>14} {'change':>8}")
+    for name, result in sorted(current["results"].items()):
+        previous = baseline["results"].get(name)
+        if not isinstance(result, dict) or not isinstance(previous, dict) or metric not in previous:
+            continue
+        before, after = previous[metric], result[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        regressed = change > threshold and after - before > MIN_REGRESSION_MS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<58} {before:>12.2f}ms {after:>12.2f}ms {change:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--sizes", default="1,10,100", help="comma-separated numbers of databases and branches")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", help="git revision or results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if any(size < 1 or size > 1000 for size in sizes):
+        raise ValueError("Project sizes must be between 1 and 1000")
+    # Load the baseline first, a run of the same revision overwrites its results file
+    baseline = load_results(args.baseline) if args.baseline else None
+
+    os.environ.setdefault("NEON_API_KEY", "benchmark")
+    os.environ["NEON_API_BACKOFF_BASE"] = "0.01"
+    os.environ["NEON_API_BACKOFF_MAX"] = "0.1"
+    os.environ.pop("BRANCH_POOL_SIZE", None)
+    workdir = tempfile.mkdtemp(prefix="neon_local_bench_")
+    os.environ["TLS_CERT_CACHE_DIR"] = os.path.join(workdir, "certs")
+
+    current = {
+        "revision": git_revision() or "unknown",
+        "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "config": {key: getattr(args, key) for key in ("repeats", "latency_ms", "jitter_ms", "error_rate", "rate_limit_rate")},
+        "results": {},
+    }
+    try:
+        for size in sizes:
+            print(f"Running control-plane benchmarks for {size} database(s) and branch(es)...")
+            for name, result in run_size(size, args, workdir).items():
+                current["results"][f"{size}/{name}"] = result
+                if isinstance(result, dict):
+                    print(f"  {name:<45} median {result['median_ms']:>10.2f}ms  p95 {result['p95_ms']:>10.2f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{current['revision']}.json")
+    with open(path, "w") as file:
+        json.dump(current, file, indent=2)
+    print(f"Results written to {path}")
+
+    if baseline:
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:g}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
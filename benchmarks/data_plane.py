@@ -0,0 +1,460 @@
+"""Data-plane benchmarks through Envoy and PgBouncer.
+
+Renders the real envoy.yaml.tmpl and pgbouncer.ini.tmpl, points them at local
+Postgres and HTTP /sql stand-ins, and drives concurrent clients over each
+path. Every path is also measured against the stand-ins directly, so the
+report shows the latency each hop adds, along with the TLS handshakes that
+reached the stand-ins (fewer means better upstream connection reuse). The
+HTTP and WebSocket paths are also run through a second Envoy with ENVOY_DEBUG
+request tracing, which shows what the tracing costs per request:
+
+    python -m benchmarks.data_plane --concurrency 16 --duration 10
+
+The Postgres paths are also run through a third Envoy that reaches PgBouncer
+over its Unix socket and terminates client TLS itself, as with
+PGBOUNCER_UNIX_SOCKET, so the two hops can be compared. --pgbouncer-workers runs several PgBouncer processes behind Envoy,
+as PGBOUNCER_WORKERS does in Neon Local.
+
+Needs the envoy and pgbouncer binaries (as in the Docker image, where it can
+be run as the postgres user) and must not run as root, which PgBouncer
+refuses. Results are saved to benchmarks/results/data-plane-<git revision>.json
+and can be compared with --baseline like the control-plane benchmarks.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import copy
+import base64
+import argparse
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import yaml
+import requests
+import urllib3
+
+from benchmarks.control_plane import REPO_ROOT, RESULTS_DIR, git_revision, load_results, compare
+from benchmarks.standins import PostgresStandin, HTTPStandin, websocket_frame, read_websocket_frame
+
+RESULTS_PREFIX = "data-plane-"
+# Credentials from userlist.txt, accepted by PgBouncer for every database
+CLIENT_USER = "neon"
+CLIENT_PASSWORD = "npg"
+# What each hop adds over the one before it, by the suffix of its name
+STEPS = {
+    "(debug)": "for request tracing",
+    "(unix)": "over the Unix socket, with Envoy terminating client TLS",
+}
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _free_port_range(count):
+    """The first of count consecutive free ports, for the PgBouncer workers."""
+    while True:
+        port = _free_port()
+        if port + count > 65536:
+            continue
+        sockets = []
+        try:
+            for i in range(1, count):
+                sock = socket.socket()
+                sockets.append(sock)
+                sock.bind(("127.0.0.1", port + i))
+            return port
+        except OSError:
+            pass
+        finally:
+            for sock in sockets:
+                sock.close()
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def run_load(make_client, concurrency, duration, warmup):
+    """Drive concurrency clients for duration seconds after a warmup; make_client returns (request, close)."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        client = None
+        while time.perf_counter() < stop_at:
+            try:
+                if client is None:
+                    client = make_client()
+                began = time.perf_counter()
+                client[0]()
+                if began >= start_at:
+                    local_latencies.append(time.perf_counter() - began)
+            except Exception:
+                local_errors += 1
+                if client is not None:
+                    client[1]()
+                client = None
+                time.sleep(0.01)
+        if client is not None:
+            client[1]()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": sum(errors), "qps": 0.0, "median_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "qps": round(len(latencies) / duration, 1),
+        "median_ms": round(_percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def postgres_client(port, database, per_request_connection=False):
+    from app.readiness import postgres_connect, postgres_query, postgres_close
+
+    if per_request_connection:
+        def request():
+            sock = postgres_connect("127.0.0.1", port, database, CLIENT_USER, CLIENT_PASSWORD)
+            try:
+                postgres_query(sock, "SELECT 1")
+            finally:
+                postgres_close(sock)
+        return lambda: (request, lambda: None)
+
+    def make_client():
+        sock = postgres_connect("127.0.0.1", port, database, CLIENT_USER, CLIENT_PASSWORD)
+        return lambda: postgres_query(sock, "SELECT 1"), lambda: postgres_close(sock)
+    return make_client
+
+def http_client(url, connection_string, per_request_connection=False):
+    headers = {"Neon-Connection-String": connection_string}
+    payload = {"query": "SELECT 1", "params": []}
+
+    if per_request_connection:
+        # Like a serverless function that opens a new connection for every invocation
+        def request():
+            response = requests.post(url, json=payload, headers=dict(headers, Connection="close"),
+                                     verify=False, timeout=10)
+            response.raise_for_status()
+        return lambda: (request, lambda: None)
+
+    def make_client():
+        session = requests.Session()
+
+        def request():
+            response = session.post(url, json=payload, headers=headers, verify=False, timeout=10)
+            response.raise_for_status()
+        return request, session.close
+    return make_client
+
+def websocket_client(port, use_tls, connection_string):
+    from app.readiness import ssl_client_context
+
+    def make_client():
+        sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+        if use_tls:
+            sock = ssl_client_context().wrap_socket(sock, server_hostname="localhost")
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall((
+            f"GET /v2 HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+            f"Neon-Connection-String: {connection_string}\r\n\r\n").encode())
+        stream = sock.makefile("rb")
+        status = stream.readline()
+        if b" 101 " not in status:
+            sock.close()
+            raise ConnectionError(f"WebSocket upgrade failed: {status.strip()}")
+        while stream.readline().strip():
+            pass
+        message = b"\x00" * 64
+
+        def request():
+            sock.sendall(websocket_frame(message, mask=os.urandom(4)))
+            if read_websocket_frame(stream)[1] != message:
+                raise ConnectionError("Unexpected WebSocket echo")
+        return request, sock.close
+    return make_client
+
+def _rewire_pgbouncer_config(config_path, workdir, databases, pg_port, worker):
+    with open(config_path, "r") as file:
+        config = file.read()
+    for db in databases:
+        config = config.replace(f"host={db['host']} port=5432", f"host=127.0.0.1 port={pg_port}")
+    for old, new in (
+        ("listen_addr = 0.0.0.0", "listen_addr = 127.0.0.1"),
+        ("auth_file = /etc/pgbouncer/userlist.txt",
+         f"auth_file = {os.path.join(REPO_ROOT, 'app', 'pgbouncer', 'userlist.txt')}"),
+        ("/etc/pgbouncer/server.crt", os.path.join(workdir, "server.crt")),
+        ("/etc/pgbouncer/server.key", os.path.join(workdir, "server.key")),
+        # The stand-in certificate is self-signed
+        ("server_tls_sslmode = verify-full", "server_tls_sslmode = require"),
+    ):
+        config = config.replace(old, new)
+    config += f"\nlogfile = {os.path.join(workdir, f'pgbouncer-{worker}.log')}\n"
+    with open(config_path, "w") as file:
+        file.write(config)
+
+def render_configs(workdir, databases, pg_port, http_port, ports):
+    """Render the real templates for the given databases, rewired to the stand-ins and free ports.
+
+    Returns the PgBouncer configs (one per worker), the Envoy config, an
+    Envoy config with ENVOY_DEBUG tracing that listens on the envoy_debug
+    ports, and one with PGBOUNCER_UNIX_SOCKET on the envoy_unix ports.
+    """
+    os.environ.setdefault("NEON_API_KEY", "benchmark")
+    os.environ.setdefault("NEON_PROJECT_ID", "benchmark")
+    from app import envoy_xds
+    from app.unified_manager import UnifiedManager
+
+    with redirect_stdout(io.StringIO()):
+        manager = UnifiedManager()
+        manager.pgbouncer.base_port = ports["pgbouncer"]
+        manager.pgbouncer_template_path = os.path.join(REPO_ROOT, "app", "pgbouncer", "pgbouncer.ini.tmpl")
+        manager.pgbouncer_config_path = os.path.join(workdir, "pgbouncer.ini")
+        manager.envoy_template_path = os.path.join(REPO_ROOT, "app", "envoy", "envoy.yaml.tmpl")
+        manager.envoy_config_path = os.path.join(workdir, "envoy.yaml")
+        manager.xds_dir = os.path.join(workdir, "xds")
+        manager._write_pgbouncer_config(databases)
+        manager._write_envoy_config(databases)
+
+    pgbouncer_configs = manager.pgbouncer.config_paths(manager.pgbouncer_config_path)
+    for i, config_path in enumerate(pgbouncer_configs):
+        _rewire_pgbouncer_config(config_path, workdir, databases, pg_port, i)
+
+    with open(manager.envoy_config_path, "r") as file:
+        bootstrap = yaml.safe_load(file)
+    bootstrap["admin"]["address"]["socket_address"]["port_value"] = ports["envoy_admin"]
+    bootstrap["static_resources"]["listeners"][0]["address"]["socket_address"]["port_value"] = ports["envoy"]
+    with open(manager.envoy_config_path, "w") as file:
+        yaml.safe_dump(bootstrap, file)
+
+    unix_bootstrap = copy.deepcopy(bootstrap)
+    unix_bootstrap["admin"]["address"]["socket_address"]["port_value"] = ports["envoy_unix_admin"]
+    unix_bootstrap["static_resources"]["listeners"][0]["address"]["socket_address"]["port_value"] = ports["envoy_unix"]
+    filter_chains = unix_bootstrap["static_resources"]["listeners"][0]["filter_chains"]
+    filter_chains[-1] = envoy_xds.postgres_filter_chain(
+        manager.access_log.envoy_config(), (os.path.join(workdir, "server.crt"), os.path.join(workdir, "server.key")))
+    for cluster in unix_bootstrap["static_resources"]["clusters"]:
+        if cluster["name"] == "pgbouncer_cluster":
+            cluster["load_assignment"]["endpoints"][0]["lb_endpoints"] = envoy_xds.pgbouncer_endpoints(
+                manager.pgbouncer.ports, manager.pgbouncer.socket_paths)
+    unix_config_path = os.path.join(workdir, "envoy-unix.yaml")
+    with open(unix_config_path, "w") as file:
+        yaml.safe_dump(unix_bootstrap, file)
+
+    bootstrap["admin"]["address"]["socket_address"]["port_value"] = ports["envoy_debug_admin"]
+    bootstrap["static_resources"]["listeners"][0]["address"]["socket_address"]["port_value"] = ports["envoy_debug"]
+    for listener in bootstrap["static_resources"]["listeners"]:
+        for chain in listener["filter_chains"]:
+            for network_filter in chain["filters"]:
+                for http_filter in network_filter.get("typed_config", {}).get("http_filters", []):
+                    if http_filter["name"] == "envoy.filters.http.lua":
+                        code = http_filter["typed_config"]["inline_code"]
+                        http_filter["typed_config"]["inline_code"] = code.replace(
+                            "local trace_requests = false", "local trace_requests = true")
+    debug_config_path = os.path.join(workdir, "envoy-debug.yaml")
+    with open(debug_config_path, "w") as file:
+        yaml.safe_dump(bootstrap, file)
+
+    with open(os.path.join(manager.xds_dir, envoy_xds.CDS_FILE), "r") as file:
+        clusters = json.load(file)["resources"]
+    for cluster in clusters:
+        cluster["type"] = "STATIC"
+        for endpoint in cluster["load_assignment"]["endpoints"][0]["lb_endpoints"]:
+            endpoint["endpoint"]["address"]["socket_address"].update({"address": "127.0.0.1", "port_value": http_port})
+    envoy_xds.write_resources(manager.xds_dir, envoy_xds.CDS_FILE, clusters)
+    return pgbouncer_configs, manager.envoy_config_path, debug_config_path, unix_config_path
+
+def start_proxies(workdir, pgbouncer_configs, envoy_config, envoy_debug_config, envoy_unix_config):
+    logs = [open(os.path.join(workdir, name), "a")
+            for name in ("pgbouncer.out", "envoy.out", "envoy-debug.out", "envoy-unix.out")]
+    pgbouncers = [subprocess.Popen([shutil.which("pgbouncer") or "/usr/local/bin/pgbouncer", config],
+                                   stdout=logs[0], stderr=logs[0]) for config in pgbouncer_configs]
+    envoy = subprocess.Popen([shutil.which("envoy") or "/usr/local/bin/envoy", "-c", envoy_config,
+                              "--log-level", "info", "--base-id", str(os.getpid())],
+                             stdout=logs[1], stderr=logs[1])
+    # Same log level as Neon Local runs Envoy with, so the traced lines are actually written
+    envoy_debug = subprocess.Popen([shutil.which("envoy") or "/usr/local/bin/envoy", "-c", envoy_debug_config,
+                                    "--log-level", "info", "--base-id", str(os.getpid() + 1)],
+                                   stdout=logs[2], stderr=logs[2])
+    envoy_unix = subprocess.Popen([shutil.which("envoy") or "/usr/local/bin/envoy", "-c", envoy_unix_config,
+                                   "--log-level", "info", "--base-id", str(os.getpid() + 2)],
+                                  stdout=logs[3], stderr=logs[3])
+    return pgbouncers + [envoy, envoy_debug, envoy_unix], logs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per path")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each path")
+    parser.add_argument("--databases", type=int, default=1)
+    parser.add_argument("--paths", default="postgres,postgres_connect,http,http_connect,websocket",
+                        help="comma-separated subset of postgres, postgres_connect, http, http_connect and websocket")
+    parser.add_argument("--baseline", help="git revision or results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument("--pgbouncer-workers", type=int, default=1, help="PgBouncer processes behind Envoy")
+    args = parser.parse_args()
+
+    if os.geteuid() == 0:
+        raise SystemExit("PgBouncer refuses to run as root, run the data-plane benchmark as an unprivileged user")
+    for binary in ("envoy", "pgbouncer"):
+        if not shutil.which(binary) and not os.path.exists(f"/usr/local/bin/{binary}"):
+            raise SystemExit(f"{binary} not found, run the data-plane benchmark inside the Neon Local image")
+    baseline = load_results(args.baseline, RESULTS_PREFIX) if args.baseline else None
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    workdir = tempfile.mkdtemp(prefix="neon_local_dataplane_")
+    os.environ["TLS_CERT_CACHE_DIR"] = os.path.join(workdir, "certs")
+    # Runs with the ACCESS_LOG_MODE from the environment, like Neon Local itself
+    os.environ["ACCESS_LOG_PATH"] = os.path.join(workdir, "envoy_access.log")
+    from app.certs import ensure_certificate
+    from app.readiness import ReadinessChecker, postgres_probe, http_sql_probe
+    from app.envoy_xds import connection_string
+    with redirect_stdout(io.StringIO()):
+        ensure_certificate(os.path.join(workdir, "server.crt"), os.path.join(workdir, "server.key"))
+
+    postgres_standin = PostgresStandin(os.path.join(workdir, "server.crt"), os.path.join(workdir, "server.key")).start()
+    http_standin = HTTPStandin(os.path.join(workdir, "server.crt"), os.path.join(workdir, "server.key")).start()
+    os.environ["PGBOUNCER_WORKERS"] = str(args.pgbouncer_workers)
+    os.environ["PGBOUNCER_SOCKET_DIR"] = workdir
+    ports = {name: _free_port() for name in ("envoy", "envoy_admin", "envoy_debug", "envoy_debug_admin",
+                                             "envoy_unix", "envoy_unix_admin")}
+    ports["pgbouncer"] = _free_port_range(args.pgbouncer_workers)
+    databases = [{"database": f"db_{i}", "user": "bench", "password": "bench",
+                  "host": f"ep-bench-{i}.local", "branch_id": "br-bench"} for i in range(args.databases)]
+    configs = render_configs(workdir, databases, postgres_standin.port, http_standin.port, ports)
+    processes, logs = start_proxies(workdir, *configs)
+
+    db = databases[0]
+    connection = connection_string(db, "neon_local_benchmark")
+    envoy_url = f"http://127.0.0.1:{ports['envoy']}/sql"
+    envoy_debug_url = f"http://127.0.0.1:{ports['envoy_debug']}/sql"
+    paths = {
+        "postgres": [
+            ("direct", postgres_client(postgres_standin.port, db["database"])),
+            ("pgbouncer", postgres_client(ports["pgbouncer"], db["database"])),
+            ("envoy+pgbouncer", postgres_client(ports["envoy"], db["database"])),
+            ("envoy+pgbouncer (unix)", postgres_client(ports["envoy_unix"], db["database"])),
+        ],
+        "postgres_connect": [
+            ("direct", postgres_client(postgres_standin.port, db["database"], per_request_connection=True)),
+            ("pgbouncer", postgres_client(ports["pgbouncer"], db["database"], per_request_connection=True)),
+            ("envoy+pgbouncer", postgres_client(ports["envoy"], db["database"], per_request_connection=True)),
+            ("envoy+pgbouncer (unix)", postgres_client(ports["envoy_unix"], db["database"],
+                                                       per_request_connection=True)),
+        ],
+        "http": [
+            ("direct", http_client(f"https://127.0.0.1:{http_standin.port}/sql", connection)),
+            ("envoy", http_client(envoy_url, connection)),
+            ("envoy (debug)", http_client(envoy_debug_url, connection)),
+        ],
+        "http_connect": [
+            ("direct", http_client(f"https://127.0.0.1:{http_standin.port}/sql", connection, per_request_connection=True)),
+            ("envoy", http_client(envoy_url, connection, per_request_connection=True)),
+        ],
+        "websocket": [
+            ("direct", websocket_client(http_standin.port, True, connection)),
+            ("envoy", websocket_client(ports["envoy"], False, connection)),
+            ("envoy (debug)", websocket_client(ports["envoy_debug"], False, connection)),
+        ],
+    }
+
+    current = {
+        "revision": git_revision() or "unknown",
+        "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "config": {key: getattr(args, key) for key in ("concurrency", "duration", "warmup", "databases",
+                                                        "pgbouncer_workers")},
+        "results": {},
+    }
+    succeeded = False
+    try:
+        checker = ReadinessChecker()
+        with redirect_stdout(io.StringIO()):
+            ready = checker.wait({
+                "pgbouncer": lambda: postgres_probe("127.0.0.1", ports["pgbouncer"], db["database"]),
+                "envoy": lambda: postgres_probe("127.0.0.1", ports["envoy"], db["database"]),
+                "envoy_unix": lambda: postgres_probe("127.0.0.1", ports["envoy_unix"], db["database"]),
+                "envoy_http": lambda: http_sql_probe(envoy_url, connection),
+                "envoy_debug_http": lambda: http_sql_probe(envoy_debug_url, connection),
+            })
+        if not ready:
+            raise SystemExit(f"Proxies did not become ready, see the logs in {workdir}: "
+                             f"{json.dumps(checker.status()['probes'])}")
+
+        for path in args.paths.split(","):
+            print(f"{path} ({args.concurrency} clients, {args.duration:g}s):")
+            direct = None
+            previous = None
+            for hop, make_client in paths[path]:
+                postgres_standin.reset_stats()
+                http_standin.reset_stats()
+                result = run_load(make_client, args.concurrency, args.duration, args.warmup)
+                # TLS handshakes the stand-ins saw, which shows how well upstream connections are reused
+                upstream = postgres_standin if path.startswith("postgres") else http_standin
+                result["upstream_tls_handshakes"] = upstream.stats["handshakes"]
+                result["upstream_tls_resumed"] = upstream.stats["resumed"]
+                current["results"][f"{path}/{hop}"] = result
+                overhead = ""
+                if direct is not None:
+                    result["overhead_ms"] = round(result["median_ms"] - direct["median_ms"], 3)
+                    overhead = f"  +{result['overhead_ms']:.3f}ms vs direct"
+                    if previous is not direct:
+                        step = STEPS.get(hop.rsplit(" ", 1)[-1], "for the outer hop")
+                        overhead += f", {result['median_ms'] - previous['median_ms']:+.3f}ms {step}"
+                print(f"  {hop:<24} {result['qps']:>10.1f} qps  p50 {result['median_ms']:>8.3f}ms  "
+                      f"p99 {result['p99_ms']:>8.3f}ms  errors {result['errors']}  "
+                      f"tls {result['upstream_tls_handshakes']} ({result['upstream_tls_resumed']} resumed){overhead}")
+                direct = direct or result
+                previous = result
+        succeeded = True
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in logs:
+            log.close()
+        postgres_standin.stop()
+        http_standin.stop()
+        # Keep the proxy logs around when something went wrong
+        if succeeded:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{RESULTS_PREFIX}{current['revision']}.json")
+    with open(path, "w") as file:
+        json.dump(current, file, indent=2)
+    print(f"Results written to {path}")
+
+    if baseline:
+        # Tail latency is shown for reference, only the medians are stable enough to gate on
+        compare(current, baseline, args.threshold, metric="p99_ms")
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:g}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Local stand-in for the parts of the Neon API that Neon Local calls.
+
+Serves endpoints, databases, reveal_password and branch CRUD for a single
+project with a configurable number of databases, roles and branches, and can
+add latency and inject 5xx and 429 responses. Run it on its own with
+
+    python -m benchmarks.mock_neon_api --port 8080 --databases 100 --latency-ms 50
+
+and point Neon Local at it with NEON_API_URL=http://localhost:8080/api/v2.
+"""
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/api/v2"
+
+class MockNeonProject:
+    """In-memory project state shared by all request handlers."""
+
+    def __init__(self, project_id="mock-project", databases=1, roles=None, branches=1,
+                 latency_ms=0, jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0):
+        self.project_id = project_id
+        self.database_count = databases
+        # By default every database has its own owner, the worst case for password reveals
+        self.role_count = roles or databases
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.branches = {}
+        # Roles created through the API, per branch, on top of the generated owners
+        self.branch_roles = {}
+        self.default_branch_id = self._add_branch("main")
+        for i in range(1, branches):
+            self._add_branch(f"branch_{i}", self.default_branch_id)
+
+    def _add_branch(self, name, parent_id=None):
+        branch_id = f"br-{uuid.uuid4().hex[:16]}"
+        self.branches[branch_id] = {
+            "id": branch_id,
+            "project_id": self.project_id,
+            "parent_id": parent_id,
+            "name": name,
+            "current_state": "ready",
+            "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "updated_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        return branch_id
+
+    def databases(self, branch_id):
+        return [{"name": f"db_{i}", "owner_name": f"role_{i % self.role_count}", "branch_id": branch_id}
+                for i in range(self.database_count)]
+
+    def endpoints(self):
+        return [{"id": f"ep-{branch_id[3:]}", "branch_id": branch_id, "type": "read_write",
+                 "host": f"ep-{branch_id[3:]}.mock.neon.local",
+                 "autoscaling_limit_min_cu": 0.25, "autoscaling_limit_max_cu": 2} for branch_id in self.branches]
+
+    def create_branch(self, payload):
+        branch = payload.get("branch") or {}
+        with self._lock:
+            branch_id = self._add_branch(branch.get("name") or f"br-{uuid.uuid4().hex[:8]}",
+                                         branch.get("parent_id") or self.default_branch_id)
+            return self.branches[branch_id]
+
+def make_handler(project):
+    branch_path = re.compile(rf"^{API_PREFIX}/projects/([^/]+)/branches/([^/]+)(/.*)?$")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes, which would otherwise wait
+        # on Nagle and delayed ACKs for ~40ms on every reused connection
+        disable_nagle_algorithm = True
+
+        def _send(self, status, body=None, headers=None):
+            data = json.dumps(body if body is not None else {}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def _handle(self, method):
+            payload = self._read_json() if method in ("POST", "PATCH") else {}
+            with project._lock:
+                project.request_count += 1
+            if project.latency_ms or project.jitter_ms:
+                time.sleep(max(0.0, project.latency_ms + random.uniform(-project.jitter_ms, project.jitter_ms)) / 1000)
+            if random.random() < project.rate_limit_rate:
+                return self._send(429, {"message": "rate limited"}, {"Retry-After": "0"})
+            if random.random() < project.error_rate:
+                return self._send(503, {"message": "injected error"})
+
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == f"{API_PREFIX}/projects/{project.project_id}/endpoints" and method == "GET":
+                return self._send(200, {"endpoints": project.endpoints()})
+            if path == f"{API_PREFIX}/projects/{project.project_id}/branches":
+                if method == "GET":
+                    return self._send(200, {"branches": list(project.branches.values())})
+                if method == "POST":
+                    branch = project.create_branch(payload)
+                    return self._send(201, {"branch": branch, "operations": []})
+
+            match = branch_path.match(path)
+            if not match or match.group(1) != project.project_id:
+                return self._send(404, {"message": "not found"})
+            branch = project.branches.get(match.group(2))
+            if branch is None:
+                return self._send(404, {"message": "branch not found"})
+            rest = match.group(3) or ""
+            if rest == "":
+                if method == "GET":
+                    return self._send(200, {"branch": branch})
+                if method == "PATCH":
+                    with project._lock:
+                        branch.update({k: v for k, v in (payload.get("branch") or {}).items() if k == "name"})
+                        branch["updated_at"] = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+                    return self._send(200, {"branch": branch, "operations": []})
+                if method == "DELETE":
+                    with project._lock:
+                        project.branches.pop(branch["id"], None)
+                    return self._send(200, {"branch": branch, "operations": []})
+            if rest == "/databases" and method == "GET":
+                return self._send(200, {"databases": project.databases(branch["id"])})
+            if rest == "/roles" and method == "POST":
+                name = (payload.get("role") or {}).get("name")
+                with project._lock:
+                    roles = project.branch_roles.setdefault(branch["id"], set())
+                    if name in roles:
+                        return self._send(409, {"message": "role already exists"})
+                    roles.add(name)
+                return self._send(201, {"role": {"name": name, "branch_id": branch["id"]}, "operations": []})
+            role = re.match(r"^/roles/([^/]+)$", rest)
+            if role and method == "DELETE":
+                with project._lock:
+                    roles = project.branch_roles.get(branch["id"], set())
+                    if role.group(1) not in roles:
+                        return self._send(404, {"message": "role not found"})
+                    roles.discard(role.group(1))
+                return self._send(200, {"role": {"name": role.group(1), "branch_id": branch["id"]}, "operations": []})
+            role = re.match(r"^/roles/([^/]+)/reveal_password$", rest)
+            if role and method == "GET":
+                return self._send(200, {"password": f"mock-password-{role.group(1)}"})
+            return self._send(404, {"message": "not found"})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class MockNeonAPI:
+    """Runs a MockNeonProject behind an HTTP server on a background thread."""
+
+    def __init__(self, project, port=0):
+        self.project = project
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(project))
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}{API_PREFIX}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--project-id", default="mock-project")
+    parser.add_argument("--databases", type=int, default=1)
+    parser.add_argument("--roles", type=int, default=None)
+    parser.add_argument("--branches", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    project = MockNeonProject(args.project_id, args.databases, args.roles, args.branches,
+                              args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    server = MockNeonAPI(project, args.port)
+    print(f"Mock Neon API for project {project.project_id} listening on {server.url}")
+    print(f"Default branch: {project.default_branch_id}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
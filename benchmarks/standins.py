@@ -0,0 +1,198 @@
+"""Local stand-ins for a Neon compute, used by the data-plane benchmark.
+
+PostgresStandin speaks enough of the Postgres wire protocol for PgBouncer and
+simple clients: SSL negotiation, trust authentication and simple queries that
+each return a single row. HTTPStandin serves Neon's HTTP /sql endpoint and
+echoes WebSocket messages. Both serve TLS with the given certificate, one
+thread per connection.
+"""
+import ssl
+import json
+import socket
+import base64
+import struct
+import hashlib
+import threading
+import socketserver
+
+SSL_REQUEST_CODE = 80877103
+CANCEL_REQUEST_CODE = 80877102
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SQL_RESPONSE = json.dumps({
+    "command": "SELECT", "rowCount": 1, "rows": [{"?column?": 1}],
+    "fields": [{"name": "?column?", "dataTypeID": 23}], "rowAsArray": False,
+}).encode()
+
+def _message(message_type, body=b""):
+    return message_type + struct.pack("!I", len(body) + 4) + body
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("Client closed the connection")
+    return data
+
+def websocket_frame(payload, opcode=0x2, mask=None):
+    """Encode a single-frame WebSocket message; clients must pass a 4-byte mask."""
+    header = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if len(payload) < 126:
+        header += bytes([mask_bit | len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([mask_bit | 126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([mask_bit | 127]) + struct.pack("!Q", len(payload))
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        header += mask
+    return header + payload
+
+def read_websocket_frame(stream):
+    """Read one WebSocket frame, returning (opcode, unmasked payload)."""
+    first, second = _read_exact(stream, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(stream, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(stream, 8))[0]
+    mask = _read_exact(stream, 4) if second & 0x80 else None
+    payload = _read_exact(stream, length)
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return first & 0x0F, payload
+
+class _Standin:
+    handler = None
+
+    def __init__(self, cert_path, key_path):
+        self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.ssl_context.load_cert_chain(cert_path, key_path)
+        # TLS handshakes since the last reset_stats(), and how many of them resumed a session
+        self.stats = {"handshakes": 0, "resumed": 0}
+        self._stats_lock = threading.Lock()
+        handler = type(self.handler.__name__, (self.handler,), {"ssl_context": self.ssl_context, "standin": self})
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {"handshakes": 0, "resumed": 0}
+
+    def count_handshake(self, sock):
+        with self._stats_lock:
+            self.stats["handshakes"] += 1
+            self.stats["resumed"] += int(sock.session_reused)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class _PostgresHandler(socketserver.BaseRequestHandler):
+    ssl_context = None
+    standin = None
+
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            length, code = struct.unpack("!II", _read_exact(sock.makefile("rb"), 8))
+            if code == SSL_REQUEST_CODE:
+                sock.sendall(b"S")
+                sock = self.ssl_context.wrap_socket(sock, server_side=True)
+                self.standin.count_handshake(sock)
+                stream = sock.makefile("rb")
+                length, code = struct.unpack("!II", _read_exact(stream, 8))
+            else:
+                stream = sock.makefile("rb")
+            if code == CANCEL_REQUEST_CODE:
+                return
+            _read_exact(stream, length - 8)
+
+            response = _message(b"R", struct.pack("!I", 0))
+            for key, value in (("server_version", "16.0"), ("client_encoding", "UTF8"),
+                               ("DateStyle", "ISO, MDY"), ("integer_datetimes", "on"),
+                               ("standard_conforming_strings", "on")):
+                response += _message(b"S", f"{key}\0{value}\0".encode())
+            response += _message(b"K", struct.pack("!II", 1, 1)) + _message(b"Z", b"I")
+            sock.sendall(response)
+
+            while True:
+                message_type = _read_exact(stream, 1)
+                length = struct.unpack("!I", _read_exact(stream, 4))[0]
+                body = _read_exact(stream, length - 4)
+                if message_type == b"X":
+                    return
+                if message_type != b"Q":
+                    sock.sendall(_message(b"E", b"SERROR\0C0A000\0Monly simple queries are supported\0\0")
+                                 + _message(b"Z", b"I"))
+                elif body.strip(b"\0 ;").upper().startswith(b"SELECT"):
+                    sock.sendall(
+                        _message(b"T", b"\0\x01?column?\0" + struct.pack("!IhIhih", 0, 0, 23, 4, -1, 0))
+                        + _message(b"D", struct.pack("!hI", 1, 1) + b"1")
+                        + _message(b"C", b"SELECT 1\0")
+                        + _message(b"Z", b"I"))
+                else:
+                    # DISCARD ALL and other statements PgBouncer may send
+                    tag = body.strip(b"\0 ;").split(b" ", 1)[0].upper()
+                    sock.sendall(_message(b"C", tag + b"\0") + _message(b"Z", b"I"))
+        except (ConnectionError, ssl.SSLError, OSError):
+            pass
+
+class _HTTPHandler(socketserver.BaseRequestHandler):
+    ssl_context = None
+    standin = None
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            sock = self.ssl_context.wrap_socket(self.request, server_side=True)
+            self.standin.count_handshake(sock)
+            stream = sock.makefile("rb")
+            while True:
+                request_line = stream.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = stream.readline().decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body_length = int(headers.get("content-length", "0"))
+                if body_length:
+                    _read_exact(stream, body_length)
+
+                if headers.get("upgrade", "").lower() == "websocket":
+                    accept = base64.b64encode(hashlib.sha1(
+                        (headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+                    sock.sendall((
+                        "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                        f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                    while True:
+                        opcode, payload = read_websocket_frame(stream)
+                        if opcode == 0x8:
+                            sock.sendall(websocket_frame(b"", 0x8))
+                            return
+                        sock.sendall(websocket_frame(payload, opcode))
+
+                sock.sendall((
+                    "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(SQL_RESPONSE)}\r\n\r\n").encode() + SQL_RESPONSE)
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, ssl.SSLError, OSError, KeyError):
+            pass
+
+class PostgresStandin(_Standin):
+    """Accepts any user and password and answers every query with one row."""
+    handler = _PostgresHandler
+
+class HTTPStandin(_Standin):
+    """Answers every HTTP request with a one-row /sql result and echoes WebSocket messages."""
+    handler = _HTTPHandler
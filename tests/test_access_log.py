@@ -0,0 +1,65 @@
+import pytest
+
+from app import access_log
+from app.access_log import AccessLog
+
+@pytest.fixture
+def reopened(monkeypatch):
+    calls = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+    monkeypatch.setattr(access_log.requests, "post", lambda url, timeout: calls.append(url) or Response())
+    return calls
+
+def _access_log(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return AccessLog()
+
+def test_all_logs_every_request_and_off_logs_nothing(monkeypatch):
+    assert "filter" not in _access_log(monkeypatch).envoy_config()[0]
+    assert _access_log(monkeypatch, ACCESS_LOG_MODE="off").envoy_config() == []
+
+def test_sampled_uses_parts_per_million(monkeypatch):
+    config = _access_log(monkeypatch, ACCESS_LOG_MODE="sampled", ACCESS_LOG_SAMPLE_PERCENT="0.5").envoy_config()
+    percent = config[0]["filter"]["runtime_filter"]["percent_sampled"]
+    assert percent == {"numerator": 5000, "denominator": "MILLION"}
+
+def test_errors_logs_5xx_and_flagged_responses(monkeypatch):
+    log_filter = _access_log(monkeypatch, ACCESS_LOG_MODE="errors").envoy_config()[0]["filter"]
+    status, flags = log_filter["or_filter"]["filters"]
+    assert status["status_code_filter"]["comparison"]["value"]["default_value"] == 500
+    assert flags == {"response_flag_filter": {}}
+
+def test_slow_uses_the_threshold(monkeypatch):
+    log_filter = _access_log(monkeypatch, ACCESS_LOG_MODE="slow", ACCESS_LOG_SLOW_MS="250").envoy_config()[0]["filter"]
+    assert log_filter["duration_filter"]["comparison"]["value"]["default_value"] == 250
+
+@pytest.mark.parametrize("env", [{"ACCESS_LOG_MODE": "verbose"},
+                                 {"ACCESS_LOG_MODE": "sampled", "ACCESS_LOG_SAMPLE_PERCENT": "0"}])
+def test_invalid_settings_are_rejected(monkeypatch, env):
+    with pytest.raises(ValueError):
+        _access_log(monkeypatch, **env)
+
+def test_rotation_shifts_backups_and_reopens_the_log(monkeypatch, tmp_path, reopened):
+    path = tmp_path / "access.log"
+    log = _access_log(monkeypatch, ACCESS_LOG_PATH=str(path), ACCESS_LOG_MAX_BYTES="10", ACCESS_LOG_BACKUPS="2")
+    for content in ("first rotation", "second rotation", "third rotation"):
+        path.write_text(content)
+        assert log.rotate()
+
+    assert not path.exists()
+    assert (tmp_path / "access.log.1").read_text() == "third rotation"
+    assert (tmp_path / "access.log.2").read_text() == "second rotation"
+    assert not (tmp_path / "access.log.3").exists()
+    assert reopened == [f"{access_log.ENVOY_ADMIN_URL}/reopen_logs"] * 3
+
+def test_small_log_is_not_rotated(monkeypatch, tmp_path, reopened):
+    path = tmp_path / "access.log"
+    path.write_text("short")
+    log = _access_log(monkeypatch, ACCESS_LOG_PATH=str(path), ACCESS_LOG_MAX_BYTES="1000")
+    assert not log.rotate()
+    assert path.exists()
+    assert reopened == []
@@ -0,0 +1,163 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.mock_neon_api import MockNeonProject, MockNeonAPI
+
+PARENT = None
+POOL_SIZE = 3
+CLAIMERS = 8
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    project = MockNeonProject(latency_ms=5, jitter_ms=5)
+    server = MockNeonAPI(project).start()
+    monkeypatch.setenv("NEON_API_KEY", "test")
+    monkeypatch.setenv("NEON_PROJECT_ID", project.project_id)
+    from app import neon
+    monkeypatch.setattr(neon, "API_URL", server.url)
+    yield project
+    server.stop()
+
+def _add_pool_branches(project, count, age=0):
+    created_at = (datetime.utcnow() - timedelta(seconds=age)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    ids = []
+    for i in range(count):
+        branch_id = project._add_branch(f"neon_local_pool_default_{i}", project.default_branch_id)
+        project.branches[branch_id]["created_at"] = created_at
+        project.branch_roles[branch_id] = {"neon_local_pool_token"}
+        ids.append(branch_id)
+    return ids
+
+def test_concurrent_claims_never_share_a_branch(mock_api):
+    from app.neon import NeonAPI
+    from app.branch_pool import BranchPool
+
+    pool_ids = _add_pool_branches(mock_api, POOL_SIZE)
+    results = {}
+    start = threading.Barrier(CLAIMERS)
+
+    def claim(i):
+        pool = BranchPool(NeonAPI(), PARENT, POOL_SIZE)
+        start.wait()
+        results[i] = pool.claim(f"git_branch_{i}")
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(CLAIMERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = {i: branch_id for i, branch_id in results.items() if branch_id}
+    assert winners
+    assert len(set(winners.values())) == len(winners)
+    for i, branch_id in winners.items():
+        assert mock_api.branches[branch_id]["name"] == f"git_branch_{i}"
+    # Every branch went to a claimer while there were claimers left
+    assert sorted(winners.values()) == sorted(pool_ids)
+
+class FakeNeonAPI:
+    """In-memory branches whose claim tokens are tracked per branch."""
+
+    def __init__(self, branches):
+        self.branches = {b["id"]: dict(b) for b in branches}
+        self.tokens = set(self.branches)
+        self.renames = []
+        self.deleted = []
+
+    def list_branches(self):
+        return [dict(b) for b in self.branches.values()]
+
+    def create_branch(self, name, parent, annotations):
+        branch_id = f"br-new-{len(self.branches)}"
+        self.branches[branch_id] = _branch(branch_id, name)
+        return branch_id
+
+    def rename_branch(self, branch_id, name):
+        self.renames.append((branch_id, name))
+        self.branches[branch_id]["name"] = name
+        return dict(self.branches[branch_id])
+
+    def delete_branch(self, branch_id):
+        self.deleted.append(branch_id)
+        del self.branches[branch_id]
+
+    def create_role(self, branch_id, role_name):
+        assert role_name == "neon_local_pool_token"
+        self.tokens.add(branch_id)
+
+    def delete_role(self, branch_id, role_name):
+        assert role_name == "neon_local_pool_token"
+        if branch_id not in self.tokens:
+            return False
+        self.tokens.remove(branch_id)
+        return True
+
+def _branch(branch_id, name, age=0):
+    created_at = (datetime.utcnow() - timedelta(seconds=age)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {"id": branch_id, "name": name, "current_state": "ready", "created_at": created_at}
+
+def test_claim_moves_on_from_a_branch_claimed_since_listing():
+    from app.branch_pool import BranchPool
+
+    api = FakeNeonAPI([_branch("br-1", "neon_local_pool_default_a"), _branch("br-2", "neon_local_pool_default_b")])
+    # Another container won br-1 but has not renamed it yet
+    api.tokens.remove("br-1")
+
+    assert BranchPool(api, PARENT, 2).claim("mine") == "br-2"
+    assert api.renames == [("br-2", "mine")]
+    assert api.tokens == set()
+
+def test_claim_without_tokens_left_writes_nothing():
+    from app.branch_pool import BranchPool
+
+    api = FakeNeonAPI([_branch("br-1", "neon_local_pool_default_a")])
+    api.tokens.clear()
+
+    assert BranchPool(api, PARENT, 1).claim("mine") is None
+    assert api.renames == []
+
+def test_refill_only_deletes_expired_branches_it_wins(monkeypatch):
+    from app import branch_pool
+    from app.branch_pool import BranchPool
+
+    monkeypatch.setattr(branch_pool.time, "sleep", lambda seconds: None)
+    api = FakeNeonAPI([
+        _branch("br-fresh", "neon_local_pool_default_a", age=10),
+        _branch("br-expired", "neon_local_pool_default_b", age=200),
+        _branch("br-being-claimed", "neon_local_pool_default_c", age=200),
+    ])
+    api.tokens.remove("br-being-claimed")
+    BranchPool(api, PARENT, 3, max_age=100).refill()
+
+    assert api.deleted == ["br-expired"]
+    assert "br-being-claimed" in api.branches
+    # Both expired branches are replaced, and the replacements can be claimed
+    created = [b for b in api.branches if b.startswith("br-new-")]
+    assert len(created) == 2
+    assert all(api.branches[b]["name"].startswith("neon_local_pool_default_") for b in created)
+    assert set(created) <= api.tokens
+
+def test_refill_deletes_a_branch_it_cannot_add_a_token_to(monkeypatch):
+    from app import branch_pool
+    from app.branch_pool import BranchPool
+
+    monkeypatch.setattr(branch_pool.time, "sleep", lambda seconds: None)
+    api = FakeNeonAPI([])
+
+    def create_role(branch_id, role_name):
+        raise RuntimeError("conflicting operation in progress")
+    api.create_role = create_role
+    BranchPool(api, PARENT, 1).refill()
+
+    assert api.branches == {}
+    assert api.deleted == ["br-new-0"]
+
+def test_claim_ignores_expired_branches():
+    from app.branch_pool import BranchPool
+
+    api = FakeNeonAPI([_branch("br-old", "neon_local_pool_default_a", age=200)])
+    assert BranchPool(api, PARENT, 1, max_age=100).claim("mine") is None
+    assert api.renames == []
+    assert api.tokens == {"br-old"}
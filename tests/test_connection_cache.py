@@ -0,0 +1,74 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from app import connection_cache
+from app.connection_cache import ConnectionCache, cached_branch_connection_info
+
+PARAMS = [{"database": "neondb", "user": "neon", "password": "secret", "host": "ep-one.neon.tech"}]
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEON_CACHE", raising=False)
+    monkeypatch.delenv("NEON_CACHE_TTL", raising=False)
+    return str(tmp_path / ".neon_local" / ".connection_cache")
+
+def test_entries_round_trip_encrypted(cache_path):
+    cache = ConnectionCache("api-key", cache_path)
+    cache.put("project", "br-1", PARAMS)
+
+    assert ConnectionCache("api-key", cache_path).get("project", "br-1") == PARAMS
+    with open(cache_path) as file:
+        assert "secret" not in file.read()
+
+def test_another_api_key_cannot_read_entries(cache_path):
+    ConnectionCache("api-key", cache_path).put("project", "br-1", PARAMS)
+    assert ConnectionCache("other-key", cache_path).get("project", "br-1") is None
+
+def test_expired_entries_are_ignored(cache_path, monkeypatch):
+    monkeypatch.setenv("NEON_CACHE_TTL", "60")
+    cache = ConnectionCache("api-key", cache_path)
+    cache.put("project", "br-1", PARAMS)
+    now = time.time()
+    monkeypatch.setattr(connection_cache.time, "time", lambda: now + 61)
+    assert cache.get("project", "br-1") is None
+
+def test_invalidate_removes_only_that_branch(cache_path):
+    cache = ConnectionCache("api-key", cache_path)
+    cache.put("project", "br-1", PARAMS)
+    cache.put("project", "br-2", PARAMS)
+    cache.invalidate("project", "br-1")
+
+    assert cache.get("project", "br-1") is None
+    assert cache.get("project", "br-2") == PARAMS
+
+def test_disabled_cache_writes_nothing(cache_path, monkeypatch, tmp_path):
+    monkeypatch.setenv("NEON_CACHE", "false")
+    cache = ConnectionCache("api-key", cache_path)
+    cache.put("project", "br-1", PARAMS)
+    assert cache.get("project", "br-1") is None
+    assert not (tmp_path / ".neon_local").exists()
+
+def test_corrupt_cache_file_is_a_miss(cache_path, tmp_path):
+    (tmp_path / ".neon_local").mkdir()
+    with open(cache_path, "w") as file:
+        json.dump({"project/br-1": {"fetched_at": 0, "data": "not a token"}}, file)
+    with open(cache_path, "a") as file:
+        file.write("trailing garbage")
+    assert ConnectionCache("api-key", cache_path).get("project", "br-1") is None
+
+def test_connection_info_is_fetched_once(cache_path):
+    calls = []
+
+    class FakeNeonAPI:
+        def get_branch_connection_info(self, project_id, branch_id):
+            calls.append(branch_id)
+            return PARAMS
+
+    cache = ConnectionCache("api-key", cache_path)
+    assert cached_branch_connection_info(FakeNeonAPI(), cache, "project", "br-1") == (PARAMS, False)
+    assert cached_branch_connection_info(FakeNeonAPI(), cache, "project", "br-1") == (PARAMS, True)
+    assert calls == ["br-1"]
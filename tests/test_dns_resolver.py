@@ -0,0 +1,63 @@
+import socket
+
+import pytest
+
+from app import dns_resolver
+from app.dns_resolver import DNSResolver, _render_hosts, write_hosts_file
+
+HOSTS = "127.0.0.1 localhost\n::1 localhost ip6-localhost\n"
+
+def test_block_is_appended_sorted_by_host():
+    content = _render_hosts(HOSTS, {"ep-b.neon.tech": "10.0.0.2", "ep-a.neon.tech": "10.0.0.1"})
+    assert content == HOSTS + "# BEGIN neon_local\n10.0.0.1 ep-a.neon.tech\n10.0.0.2 ep-b.neon.tech\n# END neon_local\n"
+
+def test_block_is_replaced_and_other_lines_kept():
+    current = _render_hosts(HOSTS, {"ep-old.neon.tech": "10.0.0.9"}) + "172.17.0.3 other-service\n"
+    content = _render_hosts(current, {"ep-new.neon.tech": "10.0.0.1"})
+    assert "ep-old" not in content
+    assert content.startswith(HOSTS)
+    assert "172.17.0.3 other-service\n" in content
+    assert content.count("# BEGIN neon_local") == 1
+
+def test_empty_addresses_remove_the_block():
+    assert _render_hosts(_render_hosts(HOSTS, {"ep-a.neon.tech": "10.0.0.1"}), {}) == HOSTS
+
+def test_hosts_file_is_only_written_when_it_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(dns_resolver.os, "geteuid", lambda: 0)
+    path = tmp_path / "hosts"
+    path.write_text(HOSTS)
+    assert write_hosts_file({"ep-a.neon.tech": "10.0.0.1"}, str(path))
+    assert "10.0.0.1 ep-a.neon.tech" in path.read_text()
+    assert not write_hosts_file({"ep-a.neon.tech": "10.0.0.1"}, str(path))
+    assert not (tmp_path / ".hosts.neon_local").exists()
+
+@pytest.fixture
+def resolver(monkeypatch):
+    resolver = DNSResolver()
+    resolver.answers = {}
+    resolver.lookups = []
+
+    def lookup(host):
+        resolver.lookups.append(host)
+        answer = resolver.answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    monkeypatch.setattr(resolver, "_lookup", lookup)
+    return resolver
+
+def test_addresses_are_cached_until_forced(resolver):
+    resolver.answers = {"ep-a.neon.tech": "10.0.0.1", "ep-b.neon.tech": "10.0.0.2"}
+    assert resolver.resolve_all(["ep-a.neon.tech", "ep-b.neon.tech", "ep-a.neon.tech"]) == resolver.answers
+    resolver.resolve_all(["ep-a.neon.tech"])
+    assert sorted(resolver.lookups) == ["ep-a.neon.tech", "ep-b.neon.tech"]
+
+    resolver.resolve_all(["ep-a.neon.tech"], force=True)
+    assert resolver.lookups.count("ep-a.neon.tech") == 2
+
+def test_failed_lookup_keeps_the_last_address(resolver):
+    resolver.answers = {"ep-a.neon.tech": "10.0.0.1"}
+    resolver.resolve_all(["ep-a.neon.tech"])
+    resolver.answers = {"ep-a.neon.tech": socket.gaierror("Temporary failure in name resolution"),
+                        "ep-new.neon.tech": socket.gaierror("Name or service not known")}
+    assert resolver.resolve_all(["ep-a.neon.tech", "ep-new.neon.tech"], force=True) == {"ep-a.neon.tech": "10.0.0.1"}
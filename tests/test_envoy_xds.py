@@ -0,0 +1,52 @@
+import os
+import json
+
+import yaml
+
+from app import envoy_xds
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "envoy", "envoy.yaml.tmpl")
+
+def _render_bootstrap(tls_certificate=None, socket_paths=None):
+    with open(TEMPLATE_PATH, "r") as file:
+        config = file.read()
+    config = config.replace("XDS_DIR", "/tmp/envoy").replace("ENVOY_DEBUG_TRACE", "false")
+    config = config.replace("POSTGRES_FILTER_CHAIN", json.dumps(envoy_xds.postgres_filter_chain([], tls_certificate)))
+    config = config.replace("ACCESS_LOG_CONFIG", "[]")
+    config = config.replace("PGBOUNCER_ENDPOINTS", json.dumps(envoy_xds.pgbouncer_endpoints([6432, 6433], socket_paths)))
+    return yaml.safe_load(config)
+
+def _postgres_chain(bootstrap):
+    return bootstrap["static_resources"]["listeners"][0]["filter_chains"][-1]
+
+def test_postgres_chain_passes_tls_through_to_pgbouncer_by_default():
+    chain = _postgres_chain(_render_bootstrap())
+    assert [f["name"] for f in chain["filters"]] == ["envoy.filters.network.tcp_proxy"]
+    assert chain["filters"][0]["typed_config"]["cluster"] == "pgbouncer_cluster"
+    assert "transport_socket" not in chain
+
+def test_postgres_chain_terminates_tls_for_unix_sockets():
+    bootstrap = _render_bootstrap(("/etc/pgbouncer/server.crt", "/etc/pgbouncer/server.key"),
+                                  ["/tmp/.s.PGSQL.6432", "/tmp/.s.PGSQL.6433"])
+    chain = _postgres_chain(bootstrap)
+    assert [f["name"] for f in chain["filters"]] == [
+        "envoy.filters.network.postgres_proxy", "envoy.filters.network.tcp_proxy"]
+    assert chain["filters"][0]["typed_config"]["terminate_ssl"] is True
+    tls_context = chain["transport_socket"]["typed_config"]["tls_socket_config"]["common_tls_context"]
+    assert tls_context["tls_certificates"][0]["private_key"]["filename"] == "/etc/pgbouncer/server.key"
+
+    endpoints = bootstrap["static_resources"]["clusters"][0]["load_assignment"]["endpoints"][0]["lb_endpoints"]
+    assert [e["endpoint"]["address"]["pipe"]["path"] for e in endpoints] == ["/tmp/.s.PGSQL.6432", "/tmp/.s.PGSQL.6433"]
+
+def test_probe_requests_get_their_own_cluster():
+    db = {"database": "neondb", "user": "neon", "password": "pw", "host": "ep-one-123.neon.tech"}
+    routes = envoy_xds.build_route_configuration([db], "neon_local_container", "node")
+    tree = routes["virtual_hosts"][0]["matcher"]["matcher_tree"]
+    by_database = tree["exact_match_map"]["map"]
+    assert by_database["probe|neondb"]["action"]["typed_config"]["route"]["cluster"] == "neon_cluster_ep-one-123_probe"
+    assert envoy_xds.PROBE_HEADER in routes["virtual_hosts"][0]["request_headers_to_remove"]
+
+    clusters = envoy_xds.build_clusters([db], "neon_local_container", "envoy-health-check",
+                                        health_checked_hosts={db["host"]})
+    probe_cluster = [c for c in clusters if c["name"] == "neon_cluster_ep-one-123_probe"][0]
+    assert "health_checks" not in probe_cluster
@@ -0,0 +1,44 @@
+import os
+import threading
+
+import pytest
+
+from app.git_watcher import GitHeadWatcher
+
+def _checkout(head_path, branch):
+    # Like git: write HEAD.lock and rename it over HEAD
+    lock_path = f"{head_path}.lock"
+    with open(lock_path, "w") as file:
+        file.write(f"ref: refs/heads/{branch}\n")
+    os.replace(lock_path, head_path)
+
+@pytest.fixture(params=["inotify", "polling"])
+def watch(request, tmp_path, monkeypatch):
+    head_path = str(tmp_path / "HEAD")
+    with open(head_path, "w") as file:
+        file.write("ref: refs/heads/main\n")
+    changes = threading.Semaphore(0)
+    shutdown = threading.Event()
+    watcher = GitHeadWatcher(head_path, changes.release, shutdown, poll_interval=0.05)
+    if request.param == "polling":
+        monkeypatch.setattr(watcher, "_start_inotify", lambda: None)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    # Let the watcher record the initial HEAD
+    shutdown.wait(0.2)
+    yield head_path, changes
+    shutdown.set()
+    thread.join()
+
+def test_branch_switch_is_reported(watch):
+    head_path, changes = watch
+    _checkout(head_path, "feature")
+    assert changes.acquire(timeout=2)
+    _checkout(head_path, "main")
+    assert changes.acquire(timeout=2)
+
+def test_rewriting_the_same_head_is_ignored(watch):
+    head_path, changes = watch
+    _checkout(head_path, "main")
+    os.utime(head_path)
+    assert not changes.acquire(timeout=0.5)
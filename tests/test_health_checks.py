@@ -0,0 +1,60 @@
+import re
+import threading
+
+from app import health_checks
+from app.health_checks import TrafficAwareHealthChecks
+
+DATABASES = [{"host": "ep-one-123.neon.tech"}, {"host": "ep-two-456.neon.tech"}]
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+class FakeSession:
+    def __init__(self):
+        self.stats = {}
+
+    def get(self, url, params=None, timeout=None):
+        return FakeResponse("\n".join(f"cluster.{name}.upstream_rq_total: {count}"
+                                      for name, count in self.stats.items()))
+
+def _checks(changes):
+    checks = TrafficAwareHealthChecks(lambda: DATABASES, changes.append, threading.Event())
+    checks.session = FakeSession()
+    return checks
+
+def test_client_requests_enable_active_checks():
+    changes = []
+    checks = _checks(changes)
+    checks.session.stats = {"neon_cluster_ep-one-123": 0, "neon_cluster_ep-two-456_ws": 0}
+    assert not checks.poll()
+
+    checks.session.stats["neon_cluster_ep-two-456_ws"] = 3
+    assert checks.poll()
+    assert checks.active_hosts == {"ep-two-456.neon.tech"}
+
+def test_readiness_probes_are_not_client_traffic():
+    checks = _checks([])
+    checks.session.stats = {"neon_cluster_ep-one-123": 0, "neon_cluster_ep-one-123_probe": 0}
+    checks.poll()
+    checks.session.stats["neon_cluster_ep-one-123_probe"] = 2
+    assert not checks.poll()
+    assert checks.active_hosts == set()
+
+def test_idle_compute_drops_its_checks(monkeypatch):
+    checks = _checks([])
+    checks.session.stats = {"neon_cluster_ep-one-123": 1}
+    assert checks.poll()
+    monkeypatch.setattr(checks, "idle_timeout", 0)
+    monkeypatch.setattr(health_checks.time, "monotonic", lambda: float("inf"))
+    assert checks.poll()
+    assert checks.active_hosts == set()
+
+def test_stats_filter_skips_probe_clusters():
+    pattern = re.compile(health_checks.TRAFFIC_STATS_FILTER)
+    assert pattern.match("cluster.neon_cluster_ep-one-123.upstream_rq_total")
+    assert pattern.match("cluster.neon_cluster_ep-one-123_ws.upstream_rq_total")
+    assert not pattern.match("cluster.neon_cluster_ep-one-123_probe.upstream_rq_total")
@@ -0,0 +1,70 @@
+import pytest
+
+from app import metrics
+
+ROWS = {
+    "SHOW STATS": [{"database": "neondb", "total_xact_count": "12", "avg_query_time": "350"}],
+    "SHOW POOLS": [{"database": "neondb", "user": "neon", "cl_active": "2", "sv_idle": "1", "pool_mode": "transaction"}],
+    "SHOW CLIENTS": [{"database": "neondb", "state": "active"}, {"database": "neondb", "state": "active"},
+                     {"database": "pgbouncer", "state": "active"}],
+}
+
+class FakeSession:
+    def __init__(self, port):
+        self.port = port
+        self.broken = False
+        self.closed = False
+
+@pytest.fixture
+def admin(monkeypatch):
+    sessions = []
+
+    def connect(host, port, database, timeout):
+        assert (host, database) == ("127.0.0.1", "pgbouncer")
+        sessions.append(FakeSession(port))
+        return sessions[-1]
+
+    def query(sock, query):
+        if sock.broken:
+            raise ConnectionError("Server closed the connection")
+        return [dict(row) for row in ROWS[query]]
+
+    def close(sock):
+        sock.closed = True
+
+    monkeypatch.setattr(metrics, "postgres_connect", connect)
+    monkeypatch.setattr(metrics, "postgres_query", query)
+    monkeypatch.setattr(metrics, "postgres_close", close)
+    monkeypatch.setattr(metrics, "_admin_sessions", {})
+    return sessions
+
+def test_scrapes_reuse_one_admin_session_per_worker(admin):
+    for _ in range(3):
+        metrics.collect_pgbouncer_metrics("main", (6432, 6433))
+    assert sorted(session.port for session in admin) == [6432, 6433]
+
+def test_broken_admin_session_is_reopened(admin):
+    metrics.collect_pgbouncer_metrics("main", (6432,))
+    admin[0].broken = True
+    lines = metrics.collect_pgbouncer_metrics("main", (6432,))
+
+    assert admin[0].closed
+    assert len(admin) == 2
+    assert 'neon_local_pgbouncer_stats_total_xact_count{database="neondb",branch="main"} 12' in lines
+
+def test_unreachable_worker_is_reported_and_skipped(admin, monkeypatch):
+    def connect(host, port, database, timeout):
+        raise ConnectionRefusedError("Connection refused")
+    monkeypatch.setattr(metrics, "postgres_connect", connect)
+
+    lines = metrics.collect_pgbouncer_metrics("main", (6432,))
+    assert lines[0] == "# PgBouncer admin console on port 6432 unavailable: Connection refused"
+    assert not [line for line in lines if not line.startswith("#")]
+
+def test_samples_get_a_worker_label_with_several_workers(admin):
+    lines = metrics.collect_pgbouncer_metrics("main", (6432, 6433))
+
+    assert 'neon_local_pgbouncer_pool_cl_active{database="neondb",user="neon",worker="1",branch="main"} 2' in lines
+    assert 'neon_local_pgbouncer_clients{database="neondb",state="active",worker="0",branch="main"} 2' in lines
+    assert "# TYPE neon_local_pgbouncer_stats_total_xact_count counter" in lines
+    assert "# TYPE neon_local_pgbouncer_stats_avg_query_time gauge" in lines
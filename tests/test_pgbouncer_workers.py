@@ -0,0 +1,47 @@
+import pytest
+
+from app import pgbouncer_workers
+from app.pgbouncer_workers import PgBouncerWorkers, worker_count
+
+CONFIG = """[pgbouncer]
+listen_addr = 0.0.0.0
+listen_port = 6432
+unix_socket_dir = /var/run/postgresql
+"""
+
+@pytest.fixture
+def workers(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_WORKERS", "3")
+    monkeypatch.setenv("PGBOUNCER_SOCKET_DIR", "/run/pgbouncer")
+    return PgBouncerWorkers()
+
+def test_auto_uses_one_worker_per_cpu_up_to_the_cap(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_WORKERS", "auto")
+    monkeypatch.setattr(pgbouncer_workers, "container_cpus", lambda: 2.5)
+    assert worker_count() == 2
+    monkeypatch.setattr(pgbouncer_workers, "container_cpus", lambda: 64)
+    assert worker_count() == pgbouncer_workers.MAX_AUTO_WORKERS
+
+def test_worker_count_must_be_positive(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_WORKERS", "0")
+    with pytest.raises(ValueError):
+        worker_count()
+
+def test_workers_listen_on_consecutive_ports_and_sockets(workers):
+    assert workers.ports == [6432, 6433, 6434]
+    assert workers.socket_paths == ["/run/pgbouncer/.s.PGSQL.6432", "/run/pgbouncer/.s.PGSQL.6433",
+                                    "/run/pgbouncer/.s.PGSQL.6434"]
+
+def test_first_worker_keeps_the_original_config_path(workers):
+    assert workers.config_paths("/etc/pgbouncer/pgbouncer.ini") == [
+        "/etc/pgbouncer/pgbouncer.ini", "/etc/pgbouncer/pgbouncer-1.ini", "/etc/pgbouncer/pgbouncer-2.ini"]
+
+def test_each_config_gets_its_own_port_and_the_socket_dir(workers, tmp_path):
+    config_path = str(tmp_path / "pgbouncer.ini")
+    workers.write_configs(config_path, CONFIG)
+    for path, port in zip(workers.config_paths(config_path), workers.ports):
+        with open(path) as file:
+            config = file.read()
+        assert f"listen_port = {port}\n" in config
+        assert "unix_socket_dir = /run/pgbouncer\n" in config
+        assert "listen_addr = 0.0.0.0\n" in config
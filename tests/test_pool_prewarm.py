@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from app import pool_prewarm
+from app.pool_prewarm import PoolPrewarmer
+
+@pytest.fixture
+def prewarmer(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_PREWARM_SIZE", "5")
+    monkeypatch.setenv("PGBOUNCER_PREWARM_TIMEOUT", "2")
+    prewarmer = PoolPrewarmer(threading.Event(), lambda: [6432])
+    prewarmer.calls = []
+    prewarmer.prewarm = lambda *args: prewarmer.calls.append(args)
+    return prewarmer
+
+def _pool(clients=0, servers=0, database="neondb"):
+    return {"database": database, "user": "neon", "cl_active": str(clients), "sv_idle": str(servers)}
+
+def _wait_for_calls(prewarmer, count):
+    for _ in range(100):
+        if len(prewarmer.calls) >= count:
+            return
+        time.sleep(0.01)
+
+def test_first_client_after_idle_starts_one_prewarm(prewarmer):
+    assert prewarmer.check([_pool()]) == []
+    assert prewarmer.check([_pool(clients=1)]) == ["neondb"]
+    # Still waiting for servers, the prewarm already running covers it
+    assert prewarmer.check([_pool(clients=3, servers=1)]) == []
+    _wait_for_calls(prewarmer, 1)
+    assert prewarmer.calls == [("neondb", 5, 6432)]
+
+def test_pool_is_prewarmed_again_after_going_idle(prewarmer):
+    assert prewarmer.check([_pool(clients=1)]) == ["neondb"]
+    assert prewarmer.check([_pool()]) == []
+    assert prewarmer.check([_pool(clients=1)]) == ["neondb"]
+
+def test_warm_pools_and_the_admin_console_are_left_alone(prewarmer):
+    assert prewarmer.check([_pool(clients=1, servers=4), _pool(clients=1, database="pgbouncer")]) == []
+
+def test_prewarm_is_capped_by_the_pool_size_and_split_between_workers(prewarmer):
+    prewarmer.check([_pool(clients=1, servers=1)], {"neondb": 2}, port=6433)
+    prewarmer.check([_pool(clients=1, database="other")], port=6434, workers=2)
+    _wait_for_calls(prewarmer, 2)
+    assert sorted(prewarmer.calls) == [("neondb", 1, 6433), ("other", 3, 6434)]
+
+def test_prewarm_holds_every_session_until_all_have_a_server(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_PREWARM_TIMEOUT", "2")
+    queries = []
+    lock = threading.Lock()
+
+    def query(sock, sql):
+        with lock:
+            queries.append(sql)
+
+    monkeypatch.setattr(pool_prewarm, "postgres_connect", lambda *args, **kwargs: object())
+    monkeypatch.setattr(pool_prewarm, "postgres_query", query)
+    monkeypatch.setattr(pool_prewarm, "postgres_close", lambda sock: None)
+    PoolPrewarmer(threading.Event(), lambda: [6432]).prewarm("neondb", 4)
+    assert queries == ["BEGIN"] * 4 + ["COMMIT"] * 4
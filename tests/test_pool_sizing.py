@@ -0,0 +1,54 @@
+import resource
+
+import pytest
+
+from app import pool_sizing
+from app.pool_sizing import pool_sizes
+
+@pytest.fixture(autouse=True)
+def unlimited_files(monkeypatch):
+    for name in ("PGBOUNCER_POOL_SIZE", "PGBOUNCER_RESERVE_POOL_SIZE", "PGBOUNCER_MAX_CLIENT_CONN"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(pool_sizing.resource, "getrlimit",
+                        lambda limit: (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+
+def _db(name, host="ep-one", cu=None):
+    return {"database": name, "host": host, "compute_max_cu": cu}
+
+def test_pool_follows_the_compute_size():
+    sizes, _ = pool_sizes([_db("small", "ep-small", 0.25), _db("large", "ep-large", 2)], cpus=4)
+    assert sizes == {"small": (10, 2), "large": (80, 16)}
+
+def test_container_cpus_cap_the_pool():
+    sizes, _ = pool_sizes([_db("large", cu=8)], cpus=1)
+    # 25 server connections per CPU, plus a fifth as reserve
+    assert sizes == {"large": (25, 5)}
+
+def test_databases_on_one_compute_share_its_connection_limit():
+    databases = [_db(f"db_{i}", cu=0.0625) for i in range(3)]
+    sizes, _ = pool_sizes(databases, cpus=4)
+    # (28 - 7) * 0.9 = 18 connections for the pooler, 6 per database
+    assert all(pool + reserve == 6 for pool, reserve in sizes.values())
+
+def test_unknown_compute_size_uses_the_defaults():
+    sizes, max_client_conn = pool_sizes([_db("neondb")], cpus=4)
+    assert sizes == {"neondb": (25, 5)}
+    assert max_client_conn == 300
+
+def test_pools_are_split_between_workers():
+    sizes, _ = pool_sizes([_db("neondb", cu=2)], cpus=4, workers=2)
+    assert sizes == {"neondb": (40, 8)}
+
+def test_overrides_apply_before_the_worker_split(monkeypatch):
+    monkeypatch.setenv("PGBOUNCER_POOL_SIZE", "50")
+    monkeypatch.setenv("PGBOUNCER_RESERVE_POOL_SIZE", "10")
+    monkeypatch.setenv("PGBOUNCER_MAX_CLIENT_CONN", "1000")
+    sizes, max_client_conn = pool_sizes([_db("neondb", cu=2)], cpus=4, workers=2)
+    assert sizes == {"neondb": (25, 5)}
+    assert max_client_conn == 1000
+
+def test_max_client_conn_stays_within_the_file_limit(monkeypatch):
+    monkeypatch.setattr(pool_sizing.resource, "getrlimit", lambda limit: (1024, 1024))
+    _, max_client_conn = pool_sizes([_db("neondb", cu=2)], cpus=4)
+    # 96 server connections would allow 960 clients, but only 1024 - 96 - 100 descriptors are left
+    assert max_client_conn == 828
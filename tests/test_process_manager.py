@@ -0,0 +1,50 @@
+import pytest
+
+from app import process_manager
+from app.process_manager import ProcessManager
+
+@pytest.fixture
+def git_paths(tmp_path, monkeypatch):
+    monkeypatch.setenv("NEON_PROJECT_ID", "test")
+    git_dir = tmp_path / "mount" / ".git"
+    git_dir.parent.mkdir()
+    worktrees_dir = tmp_path / "mount" / ".git-worktrees"
+    monkeypatch.setattr(process_manager, "GIT_DIR", str(git_dir))
+    monkeypatch.setattr(process_manager, "GIT_WORKTREES_DIR", str(worktrees_dir))
+    return git_dir, worktrees_dir
+
+def test_branch_is_read_from_a_mounted_head(git_paths):
+    git_dir, _ = git_paths
+    git_dir.mkdir()
+    (git_dir / "HEAD").write_text("ref: refs/heads/feature/login\n")
+    assert ProcessManager()._get_git_branch() == "feature/login"
+
+def test_worktree_gitdir_is_mapped_under_the_worktrees_mount(git_paths):
+    git_dir, worktrees_dir = git_paths
+    # The host path in the .git file does not exist in the container
+    git_dir.write_text("gitdir: /Users/dev/src/app/.git/worktrees/app-login\n")
+    (worktrees_dir / "app-login").mkdir(parents=True)
+    (worktrees_dir / "app-login" / "HEAD").write_text("ref: refs/heads/login\n")
+
+    manager = ProcessManager()
+    assert manager._git_head_path() == str(worktrees_dir / "app-login" / "HEAD")
+    assert manager._get_git_branch() == "login"
+
+def test_unreachable_worktree_gitdir_is_reported_once(git_paths, capsys):
+    git_dir, worktrees_dir = git_paths
+    git_dir.write_text("gitdir: /Users/dev/src/app/.git/worktrees/app-login\n")
+
+    manager = ProcessManager()
+    assert manager._get_git_branch() is None
+    assert manager._get_git_branch() is None
+    output = capsys.readouterr().out
+    assert output.count(f"Mount your main repository's .git/worktrees directory at {worktrees_dir}") == 1
+
+def test_reachable_worktree_gitdir_is_used_as_is(git_paths, tmp_path):
+    git_dir, _ = git_paths
+    worktree_git_dir = tmp_path / "repo" / ".git" / "worktrees" / "app-login"
+    worktree_git_dir.mkdir(parents=True)
+    (worktree_git_dir / "HEAD").write_text("ref: refs/heads/login\n")
+    git_dir.write_text(f"gitdir: {worktree_git_dir}\n")
+
+    assert ProcessManager()._get_git_branch() == "login"
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from app import readiness
+from app.readiness import ReadinessChecker
+
+@pytest.fixture
+def checker(monkeypatch):
+    monkeypatch.setenv("READINESS_TIMEOUT", "1")
+    monkeypatch.setattr(readiness, "MIN_RETRY_DELAY", 0.001)
+    return ReadinessChecker()
+
+def test_not_ready_while_a_wait_runs(checker):
+    assert checker.wait({"ok": lambda: None})
+    started, release = threading.Event(), threading.Event()
+
+    def slow_probe():
+        started.set()
+        release.wait(1)
+    thread = threading.Thread(target=checker.wait, args=({"slow": slow_probe},))
+    thread.start()
+    started.wait(1)
+    assert checker.status()["ready"] is False
+    release.set()
+    thread.join()
+    assert checker.status()["ready"] is True
+
+def test_probe_is_retried_until_it_passes(checker):
+    failures = [ConnectionRefusedError("refused"), ConnectionError("waking up")]
+
+    def probe():
+        if failures:
+            raise failures.pop(0)
+    assert checker.wait({"db": probe})
+    assert checker.status()["probes"]["db"]["attempts"] == 3
+
+def test_failed_probe_reports_its_error(checker, monkeypatch):
+    monkeypatch.setattr(checker, "timeout", 0.05)
+
+    def probe():
+        raise ConnectionError("password authentication failed")
+    assert not checker.wait({"db": probe})
+    assert checker.status()["probes"]["db"]["error"] == "password authentication failed"
+
+def test_status_rechecks_at_most_every_interval(checker, monkeypatch):
+    checker.wait({"ok": lambda: None})
+    calls = []
+    assert checker.status(lambda: calls.append(1))["ready"]
+    assert checker.status(lambda: calls.append(1))["ready"]
+    assert len(calls) == 1
+
+    monkeypatch.setattr(checker, "recheck_interval", 0)
+
+    def down():
+        raise ConnectionError("Envoy or PgBouncer is not running")
+    status = checker.status(down)
+    assert status["ready"] is False
+    assert status["error"] == "Envoy or PgBouncer is not running"
+
+def test_status_skips_the_recheck_when_not_ready(checker):
+    calls = []
+    assert checker.status(lambda: calls.append(1))["ready"] is False
+    assert calls == []